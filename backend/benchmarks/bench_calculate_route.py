@@ -0,0 +1,24 @@
+"""The whole calculate_route view per trip size and HOS rule set, cold caches every round"""
+
+import pytest
+from rest_framework.test import APIRequestFactory
+
+from routes.views import calculate_route
+
+from .conftest import clear_caches
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.mark.parametrize('ruleset', ['basic', 'fmcsa'])
+def test_calculate_route(benchmark, profile_memory, settings, payload, ruleset):
+    settings.HOS_RULESET = ruleset
+    factory = APIRequestFactory()
+
+    def post():
+        return calculate_route(factory.post('/api/calculate-route/', payload, format='json'))
+
+    clear_caches()
+    profile_memory(post)
+    response = benchmark.pedantic(post, setup=clear_caches, rounds=10, warmup_rounds=1)
+    assert response.status_code == 200, response.data
@@ -0,0 +1,29 @@
+"""HOSCalculator.calculate_breaks and the FMCSA DutyTimeline per trip size"""
+
+from routes.services.hos_rules import DutyTimeline
+from routes.services.hos_service import HOSCalculator
+
+
+def trip_totals(route_info):
+    route_details = route_info['route_details']
+    return route_details['duration'] / 3600, route_details['distance'] / 1609.34
+
+
+def test_calculate_breaks(benchmark, profile_memory, payload, route_info):
+    total_drive_time, total_distance = trip_totals(route_info)
+    calculator = HOSCalculator(current_cycle_hours=payload['current_cycle_hours'])
+
+    profile_memory(calculator.calculate_breaks, total_drive_time, total_distance)
+    breaks = benchmark(calculator.calculate_breaks, total_drive_time, total_distance)
+    assert breaks[0]['type'] == 'pickup' and breaks[-1]['type'] == 'dropoff'
+
+
+def test_duty_timeline(benchmark, profile_memory, payload, route_info):
+    total_drive_time, total_distance = trip_totals(route_info)
+
+    def simulate():
+        return DutyTimeline.for_trip(total_drive_time, total_distance, payload['current_cycle_hours']).to_breaks()
+
+    profile_memory(simulate)
+    breaks = benchmark(simulate)
+    assert breaks[-1]['type'] == 'dropoff'
@@ -0,0 +1,22 @@
+"""LogSheetGenerator.generate_daily_logs per trip size, with a cold geocode cache every round"""
+
+from routes.services.hos_service import HOSCalculator
+from routes.services.log_generator import LogSheetGenerator
+
+from .conftest import START_TIME, clear_caches
+
+
+def test_generate_daily_logs(benchmark, profile_memory, payload, route_info):
+    route_details = route_info['route_details']
+    breaks = HOSCalculator(current_cycle_hours=payload['current_cycle_hours']).calculate_breaks(
+        route_details['duration'] / 3600, route_details['distance'] / 1609.34
+    )
+    generator = LogSheetGenerator()
+
+    clear_caches()
+    profile_memory(generator.generate_daily_logs, breaks, START_TIME, route_info)
+    log_sheets = benchmark.pedantic(
+        generator.generate_daily_logs, args=(breaks, START_TIME, route_info),
+        setup=clear_caches, rounds=20, warmup_rounds=1
+    )
+    assert log_sheets
@@ -0,0 +1,93 @@
+"""Fixtures for the benchmark suite.
+
+Every benchmark replays recorded Google Maps responses (benchmarks/fixtures)
+through ReplayClient, so runs are offline and repeatable, and starts each
+round with empty caches so the measured work is a cold plan.
+"""
+
+import datetime
+import tracemalloc
+
+import pytest
+from django.core.cache import caches
+
+from routes.services import maps_client
+from routes.services.geocode_cache import geocode_cache
+from routes.services.google_maps_service import GoogleMapsService, directions_cache
+
+from .stub_client import ReplayClient
+from .synthetic import TRIPS
+
+START_TIME = datetime.datetime(2024, 1, 1, 6, 0)
+
+
+def clear_caches():
+    directions_cache.local.clear()
+    geocode_cache.cells.local.clear()
+    caches['default'].clear()
+    caches['coordination'].clear()
+
+
+@pytest.fixture(params=list(TRIPS))
+def trip(request):
+    """(name, ReplayClient) for each trip size"""
+    return request.param, ReplayClient.load(request.param)
+
+
+@pytest.fixture
+def replay_client(trip, monkeypatch):
+    """The trip's ReplayClient, installed as the process-wide maps client"""
+    _, client = trip
+    monkeypatch.setattr(maps_client, '_client', client)
+    clear_caches()
+    yield client
+    clear_caches()
+
+
+@pytest.fixture
+def payload(trip, replay_client):
+    return dict(replay_client.recording['payload'])
+
+
+@pytest.fixture
+def route_info(payload):
+    """route_info as RoutePlanner builds it for the log generator"""
+    route_details = GoogleMapsService().get_route_details(
+        origin=payload['current_location'],
+        destination=payload['dropoff_location'],
+        waypoints=[payload['pickup_location']]
+    )
+    return {
+        'locations': {
+            'current': payload['current_location'],
+            'pickup': payload['pickup_location'],
+            'dropoff': payload['dropoff_location'],
+        },
+        'route_details': route_details,
+    }
+
+
+@pytest.fixture
+def profile_memory(benchmark):
+    """Run a callable once under tracemalloc and attach its memory use to the benchmark.
+
+    peak_kb is the highest traced memory during the call, retained_kb and
+    retained_blocks what was still allocated when it returned. They are saved
+    with the timings (--benchmark-autosave), so they can be compared across runs.
+    """
+    def profile(func, *args, **kwargs):
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            func(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+            diff = tracemalloc.take_snapshot().compare_to(before, 'filename')
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info.update({
+            'peak_kb': round(peak / 1024, 1),
+            'retained_kb': round(sum(stat.size_diff for stat in diff) / 1024, 1),
+            'retained_blocks': sum(stat.count_diff for stat in diff),
+        })
+    return profile
@@ -0,0 +1,67 @@
+"""Record the Google Maps responses the benchmark trips need.
+
+    python -m benchmarks.record_fixtures                # real APIs, GOOGLE_MAPS_API_KEY
+    python -m benchmarks.record_fixtures --synthetic    # generated responses, no network
+
+Run from the backend directory. Each trip is planned with both HOS rule
+sets and every response is written to benchmarks/fixtures/<trip>.json.
+"""
+
+import argparse
+import json
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.cache import caches  # noqa: E402
+
+from routes.services import maps_client  # noqa: E402
+from routes.services.google_maps_service import directions_cache  # noqa: E402
+from routes.services.geocode_cache import geocode_cache  # noqa: E402
+from routes.services.route_planner import RoutePlanner  # noqa: E402
+
+from .stub_client import FIXTURES_DIR, RecordingClient  # noqa: E402
+from .synthetic import TRIPS, SyntheticClient  # noqa: E402
+
+
+def record(name: str, client) -> dict:
+    recorder = RecordingClient(client)
+    maps_client._client = recorder
+    try:
+        for ruleset in ('basic', 'fmcsa'):
+            settings.HOS_RULESET = ruleset
+            directions_cache.local.clear()
+            geocode_cache.cells.local.clear()
+            caches['default'].clear()
+            RoutePlanner().plan(TRIPS[name])
+    finally:
+        maps_client._client = None
+    return {'trip': name, 'payload': TRIPS[name], **recorder.recording}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('trips', nargs='*', help=f"any of {', '.join(TRIPS)} (default: all)")
+    parser.add_argument('--synthetic', action='store_true', help="generate responses instead of calling Google")
+    args = parser.parse_args()
+    unknown = set(args.trips) - set(TRIPS)
+    if unknown:
+        parser.error(f"unknown trips: {', '.join(sorted(unknown))}")
+
+    FIXTURES_DIR.mkdir(exist_ok=True)
+    for name in args.trips or TRIPS:
+        client = SyntheticClient() if args.synthetic else maps_client.get_maps_client()
+        fixture = record(name, client)
+        with open(FIXTURES_DIR / f"{name}.json", 'w') as f:
+            json.dump(fixture, f, separators=(',', ':'))
+        print(f"{name}: " + ", ".join(f"{len(fixture[m])} {m}"
+                                      for m in ('directions', 'places_nearby', 'reverse_geocode')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""Settings for the benchmark suite: no network, in-memory database and cache"""
+
+import os
+
+# core.settings reads these from the environment / .env
+os.environ.setdefault('GOOGLE_MAPS_API_KEY', 'AIza-benchmark')
+os.environ.setdefault('DJANGO_SECRET', 'benchmark')
+
+from core.settings import *  # noqa: E402,F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'coordination': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'coordination',
+    },
+}
+
+# every round plans from scratch instead of serving the plan stored by the last one
+PLAN_REUSE_TTL = 0
+
+# no background job sweeps against the in-memory database
+ROUTE_JOB_SWEEP_INTERVAL = 0
@@ -0,0 +1,87 @@
+"""Record and replay Google Maps responses for the benchmarks"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+
+
+def point_key(lat, lng) -> str:
+    return f"{round(float(lat), 5)},{round(float(lng), 5)}"
+
+
+def directions_key(origin, destination, waypoints=None) -> str:
+    return json.dumps([origin, destination, list(waypoints or [])])
+
+
+class RecordingClient:
+    """Wraps a googlemaps client and keeps every response it returns"""
+
+    def __init__(self, client):
+        self.client = client
+        self.recording = {'directions': {}, 'places_nearby': {}, 'reverse_geocode': {}}
+
+    def directions(self, origin, destination, waypoints=None, **options):
+        response = self.client.directions(origin, destination, waypoints=waypoints, **options)
+        self.recording['directions'][directions_key(origin, destination, waypoints)] = response
+        return response
+
+    def places_nearby(self, location=None, **options):
+        response = self.client.places_nearby(location=location, **options)
+        self.recording['places_nearby'][point_key(*location)] = response
+        return response
+
+    def reverse_geocode(self, latlng, **options):
+        response = self.client.reverse_geocode(latlng, **options)
+        self.recording['reverse_geocode'][point_key(*latlng)] = response
+        return response
+
+
+class ReplayClient:
+    """Serves recorded responses in place of googlemaps.Client.
+
+    Directions must have been recorded for the exact stops. Places and
+    geocode lookups fall back to the closest recorded point, so a change in
+    where the planner places a fuel stop doesn't need a new recording.
+    """
+
+    def __init__(self, recording: dict):
+        self.recording = recording
+        self.calls = {'directions': 0, 'places_nearby': 0, 'reverse_geocode': 0}
+        self._points = {}
+        for method in ('places_nearby', 'reverse_geocode'):
+            keys = list(recording[method])
+            coords = np.array([[float(v) for v in key.split(',')] for key in keys]).reshape(-1, 2)
+            self._points[method] = (keys, coords)
+
+    @classmethod
+    def load(cls, name: str) -> 'ReplayClient':
+        with open(FIXTURES_DIR / f"{name}.json") as f:
+            return cls(json.load(f))
+
+    def _nearest(self, method: str, lat, lng):
+        responses = self.recording[method]
+        key = point_key(lat, lng)
+        if key not in responses:
+            keys, coords = self._points[method]
+            if not keys:
+                raise KeyError(f"No {method} responses recorded")
+            key = keys[int(np.argmin(((coords - (float(lat), float(lng))) ** 2).sum(axis=1)))]
+        return responses[key]
+
+    def directions(self, origin, destination, waypoints=None, **options):
+        self.calls['directions'] += 1
+        key = directions_key(origin, destination, waypoints)
+        if key not in self.recording['directions']:
+            raise KeyError(f"Directions not recorded for {key}, re-run benchmarks.record_fixtures")
+        return self.recording['directions'][key]
+
+    def places_nearby(self, location=None, **options):
+        self.calls['places_nearby'] += 1
+        return self._nearest('places_nearby', *location)
+
+    def reverse_geocode(self, latlng, **options):
+        self.calls['reverse_geocode'] += 1
+        return self._nearest('reverse_geocode', *latlng)
@@ -0,0 +1,194 @@
+"""Google-shaped responses for trips that were not recorded against the real APIs"""
+
+import hashlib
+import math
+
+import numpy as np
+from googlemaps.convert import encode_polyline
+
+from routes.services.geo import METERS_PER_MILE
+from routes.services.polyline import cumulative_miles
+
+# stops of the benchmark trips, from a same-day run to a coast-to-coast round
+TRIPS = {
+    'short': {
+        'current_location': {'lat': 32.7767, 'lng': -96.7970, 'address': 'Dallas, TX'},
+        'pickup_location': {'lat': 32.7555, 'lng': -97.3308, 'address': 'Fort Worth, TX'},
+        'dropoff_location': {'lat': 35.4676, 'lng': -97.5164, 'address': 'Oklahoma City, OK'},
+        'current_cycle_hours': 10,
+    },
+    'regional': {
+        'current_location': {'lat': 41.8781, 'lng': -87.6298, 'address': 'Chicago, IL'},
+        'pickup_location': {'lat': 39.7684, 'lng': -86.1581, 'address': 'Indianapolis, IN'},
+        'dropoff_location': {'lat': 33.7490, 'lng': -84.3880, 'address': 'Atlanta, GA'},
+        'current_cycle_hours': 20,
+    },
+    'multi_week': {
+        'current_location': {'lat': 47.6062, 'lng': -122.3321, 'address': 'Seattle, WA'},
+        'pickup_location': {'lat': 42.3601, 'lng': -71.0589, 'address': 'Boston, MA'},
+        'dropoff_location': {'lat': 32.7157, 'lng': -117.1611, 'address': 'San Diego, CA'},
+        'current_cycle_hours': 60,
+    },
+}
+
+CITY_SPEED, HIGHWAY_SPEED = 25, 62  # mph
+CITY_STEPS = 8  # short steps leaving and entering every stop
+SPACING_MILES = 1.0
+SYLLABLES = ('ash', 'bel', 'cor', 'dal', 'el', 'fair', 'glen', 'har', 'ing', 'lan',
+             'mar', 'nor', 'ox', 'pine', 'ridge', 'sal', 'ton', 'vale', 'wood', 'york')
+STATES = ('AL', 'AZ', 'CA', 'CO', 'GA', 'ID', 'IL', 'IN', 'KS', 'KY', 'MO', 'MT',
+          'NE', 'NM', 'NV', 'OH', 'OK', 'OR', 'TN', 'TX', 'UT', 'WA', 'WY')
+
+
+def _seed(*parts) -> int:
+    return int(hashlib.sha1(repr(parts).encode()).hexdigest()[:8], 16)
+
+
+def _parse(point: str) -> tuple:
+    lat, lng = point.split(',')
+    return float(lat), float(lng)
+
+
+def _leg_points(start: tuple, end: tuple) -> np.ndarray:
+    """A wavy line between two stops, about SPACING_MILES between points"""
+    rng = np.random.default_rng(_seed(start, end))
+    straight = math.dist(start, end) * 69
+    count = max(int(straight * 1.15 / SPACING_MILES), 2)
+    t = np.linspace(0, 1, count)
+    points = np.outer(1 - t, start) + np.outer(t, end)
+    # a few bends of a couple of degrees, pinned at both ends
+    normal = np.array([end[1] - start[1], start[0] - end[0]])
+    normal /= np.linalg.norm(normal) or 1
+    bends = sum(rng.uniform(-1, 1) * np.sin(np.pi * k * t) for k in range(1, 5)) * min(straight / 300, 2)
+    points += np.outer(bends, normal)
+    points[1:-1] += rng.normal(0, 0.002, (count - 2, 2))
+    return points
+
+
+def _step(points: np.ndarray, miles: float, speed: float, index: int) -> dict:
+    meters = miles * METERS_PER_MILE
+    seconds = miles / speed * 3600
+    start, end = points[0].tolist(), points[-1].tolist()
+    return {
+        'distance': {'text': f"{miles:.1f} mi", 'value': int(round(meters))},
+        'duration': {'text': f"{round(seconds / 60)} mins", 'value': int(round(seconds))},
+        'end_location': {'lat': end[0], 'lng': end[1]},
+        'html_instructions': (f"Continue onto <b>I-{10 + index % 80}</b>"
+                              f"<div style=\"font-size:0.9em\">Pass by a landmark (on the right)</div>"),
+        'maneuver': 'keep-left' if index % 3 else 'merge',
+        'polyline': {'points': encode_polyline([tuple(p) for p in points.tolist()])},
+        'start_location': {'lat': start[0], 'lng': start[1]},
+        'travel_mode': 'DRIVING',
+    }
+
+
+def _leg(start: tuple, end: tuple) -> dict:
+    points = _leg_points(start, end)
+    miles = cumulative_miles(points)
+    rng = np.random.default_rng(_seed('steps', start, end))
+
+    # short city steps at both ends, long highway steps in between
+    city = np.cumsum(rng.uniform(0.2, 3, CITY_STEPS))
+    boundaries = [0.0, *city.tolist()]
+    highway_end = miles[-1] - city[-1]
+    while boundaries[-1] + 150 < highway_end:
+        boundaries.append(boundaries[-1] + float(rng.uniform(15, 120)))
+    boundaries += (highway_end + city).tolist()
+    boundaries = sorted({min(max(b, 0.0), miles[-1]) for b in boundaries} | {miles[-1]})
+
+    indices = np.unique(np.searchsorted(miles, boundaries))
+    indices[-1] = len(points) - 1
+    steps = []
+    for i, (a, b) in enumerate(zip(indices[:-1].tolist(), indices[1:].tolist())):
+        step_miles = float(miles[b] - miles[a])
+        city_step = i < CITY_STEPS or i >= len(indices) - 1 - CITY_STEPS
+        steps.append(_step(points[a:b + 1], step_miles, CITY_SPEED if city_step else HIGHWAY_SPEED, i))
+
+    return {
+        'distance': {'text': '', 'value': sum(s['distance']['value'] for s in steps)},
+        'duration': {'text': '', 'value': sum(s['duration']['value'] for s in steps)},
+        'end_location': steps[-1]['end_location'],
+        'start_location': steps[0]['start_location'],
+        'steps': steps,
+        'traffic_speed_entry': [],
+        'via_waypoint': [],
+        '_points': points,
+    }
+
+
+class SyntheticClient:
+    """Stands in for googlemaps.Client with made-up but plausibly sized responses"""
+
+    def directions(self, origin, destination, waypoints=None, **options):
+        stops = [_parse(origin), *map(_parse, waypoints or []), _parse(destination)]
+        legs = [_leg(a, b) for a, b in zip(stops, stops[1:])]
+        points = np.concatenate([leg.pop('_points') for leg in legs])
+        for leg in legs:
+            leg['distance']['text'] = f"{leg['distance']['value'] / METERS_PER_MILE:,.0f} mi"
+            leg['duration']['text'] = f"{leg['duration']['value'] // 3600} hours"
+        return [{
+            'bounds': {
+                'northeast': {'lat': float(points[:, 0].max()), 'lng': float(points[:, 1].max())},
+                'southwest': {'lat': float(points[:, 0].min()), 'lng': float(points[:, 1].min())},
+            },
+            'copyrights': 'Map data ©2024',
+            'legs': legs,
+            # the overview line is a coarser version of the steps
+            'overview_polyline': {'points': encode_polyline([tuple(p) for p in points[::3].tolist()])},
+            'summary': 'I-90',
+            'warnings': [],
+            'waypoint_order': list(range(len(waypoints or []))),
+        }]
+
+    def places_nearby(self, location=None, radius=None, type=None, **options):
+        lat, lng = location
+        rng = np.random.default_rng(_seed('places', round(lat, 3), round(lng, 3)))
+        results = []
+        for i in range(3):
+            place_lat, place_lng = lat + rng.normal(0, 0.01), lng + rng.normal(0, 0.01)
+            place_id = f"ChIJ{_seed('place', round(place_lat, 5), round(place_lng, 5)):08x}{i}"
+            results.append({
+                'business_status': 'OPERATIONAL',
+                'geometry': {
+                    'location': {'lat': place_lat, 'lng': place_lng},
+                    'viewport': {
+                        'northeast': {'lat': place_lat + 0.001, 'lng': place_lng + 0.001},
+                        'southwest': {'lat': place_lat - 0.001, 'lng': place_lng - 0.001},
+                    },
+                },
+                'icon': 'https://maps.gstatic.com/mapfiles/place_api/icons/v1/png_71/gas_station-71.png',
+                'name': ('Pilot Travel Center', "Love's Travel Stop", 'TA Petro')[i],
+                'opening_hours': {'open_now': True},
+                'place_id': place_id,
+                'rating': round(float(rng.uniform(3, 5)), 1),
+                'reference': place_id,
+                'scope': 'GOOGLE',
+                'types': ['gas_station', 'convenience_store', 'point_of_interest', 'establishment'],
+                'user_ratings_total': int(rng.integers(10, 2000)),
+                'vicinity': f"{int(rng.integers(100, 9999))} Highway Dr",
+            })
+        return {'html_attributions': [], 'results': results, 'status': 'OK'}
+
+    def reverse_geocode(self, latlng, **options):
+        lat, lng = latlng
+        # nearby points share a town, like they would on a real road
+        cell = (round(lat * 4), round(lng * 4))
+        rng = np.random.default_rng(_seed('town', cell))
+        town = ''.join(rng.choice(SYLLABLES, 2)).title()
+        state = STATES[_seed('state', round(lat), round(lng / 3)) % len(STATES)]
+        components = [
+            {'long_name': str(int(rng.integers(1, 9999))), 'short_name': '', 'types': ['street_number']},
+            {'long_name': 'Interstate Highway', 'short_name': 'I-90', 'types': ['route']},
+            {'long_name': town, 'short_name': town, 'types': ['locality', 'political']},
+            {'long_name': f"{town} County", 'short_name': f"{town} County",
+             'types': ['administrative_area_level_2', 'political']},
+            {'long_name': state, 'short_name': state, 'types': ['administrative_area_level_1', 'political']},
+            {'long_name': 'United States', 'short_name': 'US', 'types': ['country', 'political']},
+        ]
+        return [{
+            'address_components': components,
+            'formatted_address': f"{town}, {state}, USA",
+            'geometry': {'location': {'lat': lat, 'lng': lng}, 'location_type': 'APPROXIMATE'},
+            'place_id': f"ChIJ{_seed('geocode', cell):08x}",
+            'types': ['street_address'],
+        }]
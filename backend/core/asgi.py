@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+Serve it with an ASGI server to get the async calculate-route endpoint
+without a blocked worker per request, e.g.
+    gunicorn core.asgi:application -k uvicorn.workers.UvicornWorker
 """
 
 import os
@@ -0,0 +1,83 @@
+"""
+Logging helpers for the LOGGING setting: a non-blocking queue handler,
+a sampling filter and a JSON formatter.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+# attributes every LogRecord has, anything else was passed with extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the fields passed via extra={...}"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Let through only a `rate` fraction of the records at or below `level`.
+
+    Warnings and errors are above the default level and always kept.
+    """
+
+    def __init__(self, rate=1.0, level='INFO'):
+        super().__init__()
+        self.rate = float(rate)
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+
+    def filter(self, record):
+        return record.levelno > self.level or self.rate >= 1 or random.random() < self.rate
+
+
+class QueueStreamHandler(QueueHandler):
+    """Hands records to a background thread that writes them to the stream.
+
+    Request threads only put the record on a bounded queue; formatting and
+    the write happen on the listener thread, so a slow or contended stdout
+    doesn't add latency. When the queue is full, records are dropped (and
+    counted) rather than blocking the caller.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream or sys.stdout)
+        self.dropped = 0
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def setFormatter(self, fmt):
+        # formatting is done by the listener's handler, off the request thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # merge the message arguments now (they may change later), but leave
+        # the formatting to the target handler
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
@@ -10,10 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
-GOOGLE_MAPS_API_KEY = config('GOOGLE_MAPS_API_KEY')
+# only needed by the Google backends (ROUTING_BACKEND, FUEL_STATION_BACKEND)
+GOOGLE_MAPS_API_KEY = config('GOOGLE_MAPS_API_KEY', default='')
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -46,8 +48,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so its total covers the rest of the stack
+    'routes.middleware.ServerTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # compresses responses for clients that send Accept-Encoding: gzip
+    'django.middleware.gzip.GZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -94,6 +100,170 @@ DATABASES = {
 }
 
 
+# 'google' uses the Directions API, 'local' routes over the CSR road graph
+# stored in the ROAD_GRAPH_PATH directory (see routes.services.local_router)
+ROUTING_BACKEND = config('ROUTING_BACKEND', default='google')
+ROAD_GRAPH_PATH = config('ROAD_GRAPH_PATH', default='')
+
+# Directions responses are cached per rounded origin/waypoints/destination,
+# 4 decimal places is roughly 11 meters
+COORDINATE_CACHE_PRECISION = config('COORDINATE_CACHE_PRECISION', default=4, cast=int)
+DIRECTIONS_CACHE_SIZE = config('DIRECTIONS_CACHE_SIZE', default=512, cast=int)
+DIRECTIONS_CACHE_TTL = config('DIRECTIONS_CACHE_TTL', default=6 * 3600, cast=int)  # seconds
+
+# Distance Matrix results are stored per rounded origin/destination cell
+# (routes.models.MatrixCell), so any later matrix over already-seen points is
+# answered without API calls
+MATRIX_CACHE_SIZE = config('MATRIX_CACHE_SIZE', default=100000, cast=int)  # cells kept in process
+MATRIX_CACHE_TTL = config('MATRIX_CACHE_TTL', default=7 * 24 * 3600, cast=int)  # seconds
+MATRIX_MAX_POINTS = config('MATRIX_MAX_POINTS', default=500, cast=int)  # origins or destinations per /api/matrix/ call
+
+# Reverse geocodes are reused for any point within this radius of a resolved one
+GEOCODE_CACHE_RADIUS_MILES = config('GEOCODE_CACHE_RADIUS_MILES', default=5.0, cast=float)
+GEOCODE_CACHE_MAX_CELLS = config('GEOCODE_CACHE_MAX_CELLS', default=4096, cast=int)
+GEOCODE_CACHE_TTL = config('GEOCODE_CACHE_TTL', default=30 * 24 * 3600, cast=int)  # seconds
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The database caches are shared by every worker process, create their tables
+# with `python manage.py createcachetable`. 'default' is the shared tier of the
+# directions and geocode caches and is sized to hold both; the single-flight
+# locks and results live in their own table so culling cached responses can
+# never drop a lock that is still held.
+SHARED_CACHE_MAX_ENTRIES = config(
+    'SHARED_CACHE_MAX_ENTRIES', default=2 * (DIRECTIONS_CACHE_SIZE + GEOCODE_CACHE_MAX_CELLS), cast=int
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'route_planner_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': SHARED_CACHE_MAX_ENTRIES,
+            # a full table drops 1/10 of its entries, not Django's default 1/3
+            'CULL_FREQUENCY': 10,
+        },
+    },
+    'coordination': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'route_planner_locks',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+# Places and Geocoding calls are fanned out over a bounded thread pool
+UPSTREAM_MAX_CONCURRENCY = config('UPSTREAM_MAX_CONCURRENCY', default=16, cast=int)
+STAGE_MAX_CONCURRENCY = config('STAGE_MAX_CONCURRENCY', default=8, cast=int)
+UPSTREAM_CALL_TIMEOUT = config('UPSTREAM_CALL_TIMEOUT', default=10, cast=int)  # seconds, per HTTP call
+UPSTREAM_BATCH_TIMEOUT = config('UPSTREAM_BATCH_TIMEOUT', default=15, cast=int)  # seconds, per fan-out
+
+# 'basic' schedules 30 minute breaks and fuel stops only (HOSCalculator),
+# 'fmcsa' also applies the 11/14 hour limits with 10 hour resets and the
+# 70 hour / 8 day cycle with 34 hour restarts (hos_rules.DutyTimeline)
+HOS_RULESET = config('HOS_RULESET', default='basic')
+
+# All Google API calls share one keep-alive session per process
+GOOGLE_MAPS_POOL_SIZE = config('GOOGLE_MAPS_POOL_SIZE', default=UPSTREAM_MAX_CONCURRENCY, cast=int)
+GOOGLE_MAPS_MAX_RETRIES = config('GOOGLE_MAPS_MAX_RETRIES', default=3, cast=int)  # failed connections
+GOOGLE_MAPS_RETRY_BACKOFF = config('GOOGLE_MAPS_RETRY_BACKOFF', default=0.5, cast=float)  # seconds, doubled per retry
+# 5xx and OVER_QUERY_LIMIT responses are retried until this many seconds after
+# the first attempt, short enough for the last try to end within UPSTREAM_BATCH_TIMEOUT
+GOOGLE_MAPS_RETRY_TIMEOUT = config(
+    'GOOGLE_MAPS_RETRY_TIMEOUT', default=max(UPSTREAM_BATCH_TIMEOUT - UPSTREAM_CALL_TIMEOUT, 0), cast=int
+)
+# client-side rate limit, shared by every request thread of the process
+GOOGLE_MAPS_QUERIES_PER_SECOND = config('GOOGLE_MAPS_QUERIES_PER_SECOND', default=60, cast=int)
+
+# Concurrent identical calculate-route requests share one computation, across
+# workers through a lock in the shared cache
+SINGLE_FLIGHT_LOCK_TIMEOUT = config('SINGLE_FLIGHT_LOCK_TIMEOUT', default=60, cast=int)  # seconds
+SINGLE_FLIGHT_RESULT_TTL = config('SINGLE_FLIGHT_RESULT_TTL', default=10, cast=int)  # seconds
+# after that, a plan stored for the same input (Route.input_hash) is served
+# again for this long instead of being recomputed and stored again; its log
+# sheets start when it was first computed. 0 always computes a new plan.
+PLAN_REUSE_TTL = config('PLAN_REUSE_TTL', default=300, cast=int)  # seconds
+
+# Batch planning: HOS and log sheets run in a process pool of this size
+PLANNING_PROCESSES = config('PLANNING_PROCESSES', default=os.cpu_count() or 2, cast=int)
+BATCH_MAX_TRIPS = config('BATCH_MAX_TRIPS', default=500, cast=int)
+# routes of a batch looked up at once, their API calls still go through the upstream pool
+BATCH_ROUTE_CONCURRENCY = config('BATCH_ROUTE_CONCURRENCY', default=UPSTREAM_MAX_CONCURRENCY, cast=int)
+BATCH_TRIP_TIMEOUT = config('BATCH_TRIP_TIMEOUT', default=120, cast=int)  # seconds without any trip finishing
+
+# Background route jobs (POST /api/jobs/) run on this many threads per process,
+# finished jobs are POSTed to their callback_url with retries on failure
+ROUTE_JOB_WORKERS = config('ROUTE_JOB_WORKERS', default=4, cast=int)
+# a job still 'running' this long after it started is taken to belong to a
+# process that died and is queued again; every process sweeps for those, and
+# for queued jobs nobody picked up, this often (0 turns the sweep off)
+ROUTE_JOB_STALE_AFTER = config('ROUTE_JOB_STALE_AFTER', default=15 * 60, cast=int)  # seconds
+ROUTE_JOB_SWEEP_INTERVAL = config('ROUTE_JOB_SWEEP_INTERVAL', default=60, cast=int)  # seconds
+# callback_url must use one of these schemes and point at one of these hosts
+# (comma separated, '.example.com' matches its subdomains too); with no hosts
+# set, jobs can't have callbacks
+ROUTE_JOB_CALLBACK_SCHEMES = config('ROUTE_JOB_CALLBACK_SCHEMES', default='https', cast=Csv())
+ROUTE_JOB_CALLBACK_HOSTS = config('ROUTE_JOB_CALLBACK_HOSTS', default='', cast=Csv())
+ROUTE_JOB_CALLBACK_TIMEOUT = config('ROUTE_JOB_CALLBACK_TIMEOUT', default=5, cast=int)  # seconds
+ROUTE_JOB_CALLBACK_RETRIES = config('ROUTE_JOB_CALLBACK_RETRIES', default=3, cast=int)
+ROUTE_JOB_CALLBACK_BACKOFF = config('ROUTE_JOB_CALLBACK_BACKOFF', default=1.0, cast=float)  # seconds, doubled per retry
+
+# POST /api/routes/<id>/replan/ refuses positions further than this from the
+# stored route line, those need a new route
+REPLAN_MAX_OFF_ROUTE_MILES = config('REPLAN_MAX_OFF_ROUTE_MILES', default=2.0, cast=float)
+
+# Gas stations are searched within this radius of each scheduled fuel stop
+FUEL_STOP_SEARCH_RADIUS = config('FUEL_STOP_SEARCH_RADIUS', default=5000, cast=int)  # meters
+
+# 'places' searches the Google Places API, 'index' answers from the offline
+# truck-stop index at FUEL_STATION_INDEX_PATH (a CSV/Parquet export or a
+# directory compiled from one)
+FUEL_STATION_BACKEND = config('FUEL_STATION_BACKEND', default='places')
+FUEL_STATION_INDEX_PATH = config('FUEL_STATION_INDEX_PATH', default='')
+
+
+# Logging: JSON lines on stdout, written by a background thread so request
+# threads never wait on the stream. A LOG_SAMPLE_RATE below 1 keeps only that
+# fraction of the INFO and DEBUG records; warnings and errors are always kept.
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+LOG_SAMPLE_RATE = config('LOG_SAMPLE_RATE', default=1.0, cast=float)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'core.log_handlers.JsonFormatter'},
+    },
+    'filters': {
+        'sample': {'()': 'core.log_handlers.SamplingFilter', 'rate': LOG_SAMPLE_RATE},
+    },
+    'handlers': {
+        'console': {
+            '()': 'core.log_handlers.QueueStreamHandler',
+            'formatter': 'json',
+            'filters': ['sample'],
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': 'WARNING',
+    },
+    'loggers': {
+        # replaces Django's default console output, which would duplicate it
+        'django': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'routes': {
+            'level': LOG_LEVEL,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
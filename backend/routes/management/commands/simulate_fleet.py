@@ -0,0 +1,85 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from routes.services.fleet_simulation import iter_trip_chunks, simulate_fleet
+
+
+class Command(BaseCommand):
+    help = (
+        "Run HOS planning over a CSV/Parquet file of trips and report aggregate "
+        "durations, breaks, fuel stops and compliance, optionally under changed HOS rules"
+    )
+
+    # option -> HOSCalculator constant it overrides
+    POLICY_OPTIONS = {
+        'miles_per_fuel_stop': 'MILES_PER_FUEL_STOP',
+        'fueling_duration': 'FUELING_DURATION',
+        'break_after': 'REQUIRED_BREAK_AFTER',
+        'break_duration': 'MINIMUM_BREAK_DURATION',
+        'max_cycle_hours': 'MAX_CYCLE_HOURS',
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('trips', help="CSV or .parquet file, one trip per row")
+        parser.add_argument('--distance-column', default='distance')
+        parser.add_argument('--duration-column', default='duration', help="driving time")
+        parser.add_argument('--cycle-column', default='current_cycle_hours')
+        parser.add_argument('--distance-unit', choices=['miles', 'meters'], default='miles')
+        parser.add_argument('--duration-unit', choices=['hours', 'seconds'], default='hours')
+        parser.add_argument('--chunk-size', type=int, default=100000, help="rows held in memory per chunk")
+        parser.add_argument('--workers', type=int, default=1, help="processes to spread chunks over")
+        parser.add_argument('--output', help="write the JSON results here instead of stdout")
+
+        policy = parser.add_argument_group(
+            'policy', "what-if HOS rules; when any is given the current rules are reported as the baseline"
+        )
+        policy.add_argument('--miles-per-fuel-stop', type=float)
+        policy.add_argument('--fueling-duration', type=float, help="hours")
+        policy.add_argument('--break-after', type=float, help="driving hours before a break")
+        policy.add_argument('--break-duration', type=float, help="hours")
+        policy.add_argument('--max-cycle-hours', type=float)
+
+    def handle(self, *args, **options):
+        overrides = {
+            constant: options[option]
+            for option, constant in self.POLICY_OPTIONS.items()
+            if options[option] is not None
+        }
+        for option, constant in self.POLICY_OPTIONS.items():
+            # a zero or negative rule would divide by zero or silently fall back to the baseline
+            if constant in overrides and overrides[constant] <= 0:
+                raise CommandError(f"--{option.replace('_', '-')} must be greater than 0")
+        policies = {'baseline': {}}
+        if overrides:
+            policies['policy'] = overrides
+
+        chunks = iter_trip_chunks(
+            options['trips'],
+            columns=(options['distance_column'], options['duration_column'], options['cycle_column']),
+            chunk_size=options['chunk_size'],
+            distance_unit=options['distance_unit'],
+            duration_unit=options['duration_unit'],
+        )
+
+        start = time.perf_counter()
+        try:
+            summaries = simulate_fleet(chunks, policies, workers=options['workers'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - start
+
+        results = {name: summary.to_dict() for name, summary in summaries.items()}
+        if overrides:
+            results['policy']['overrides'] = overrides
+        results['elapsed_seconds'] = round(elapsed, 2)
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(f"Simulated {results['baseline']['trips']} trips in {elapsed:.1f}s, "
+                              f"results in {options['output']}")
+        else:
+            self.stdout.write(output)
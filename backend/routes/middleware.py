@@ -0,0 +1,48 @@
+# routes/middleware.py
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .services.timing import collect_timings, request_seconds
+
+
+class ServerTimingMiddleware:
+    """Collect per-stage timings for every request.
+
+    The stage totals go into the Server-Timing response header and the
+    /api/metrics/ histograms. Streaming responses are still being produced
+    when this returns, so they only get the request latency.
+
+    Runs natively in both sync and async stacks, so async views under ASGI
+    don't get a thread held for them by this middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        start = time.perf_counter()
+        with collect_timings() as timings:
+            response = self.get_response(request)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with collect_timings() as timings:
+            response = await self.get_response(request)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    def finish(self, request, response, timings, total):
+        view = request.resolver_match.url_name if request.resolver_match else 'unmatched'
+        request_seconds.observe(total, view=view)
+        if not response.streaming:
+            timings.observe()
+            response['Server-Timing'] = timings.server_timing(total)
+        return response
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='input_hash',
+            field=models.CharField(db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='plan_blob',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='plan_etag',
+            field=models.CharField(max_length=40, null=True),
+        ),
+    ]
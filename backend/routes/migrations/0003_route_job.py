@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:09
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0002_route_plan_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], db_index=True, default='queued', max_length=16)),
+                ('input', models.JSONField()),
+                ('callback_url', models.URLField(max_length=2048, null=True)),
+                ('callback_status', models.IntegerField(null=True)),
+                ('error', models.TextField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(null=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('route', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='routes.route')),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0003_route_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatrixCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origin', models.CharField(max_length=32)),
+                ('destination', models.CharField(max_length=32)),
+                ('duration', models.FloatField(null=True)),
+                ('distance', models.FloatField(null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('origin', 'destination'), name='unique_matrix_cell')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0004_matrix_cell'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='duty_timeline',
+            field=models.BinaryField(null=True),
+        ),
+    ]
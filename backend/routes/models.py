@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 
 class Route(models.Model):
@@ -10,4 +12,54 @@ class Route(models.Model):
     # these are calculated data for the route that's displayed as a map on the frontend
     estimated_duration = models.FloatField(null=True)
     route_polyline = models.TextField(null=True)
-    stops = models.JSONField(null=True)
\ No newline at end of file
+    stops = models.JSONField(null=True)
+
+    # normalized RouteInput hash (services.route_planner.route_input_hash)
+    input_hash = models.CharField(max_length=64, null=True, db_index=True)
+    # the rest of the computed plan (breaks, log sheets, steps...) as zlib-compressed JSON
+    plan_blob = models.BinaryField(null=True)
+    plan_etag = models.CharField(max_length=40, null=True)
+    # the HOS timeline's tasks and checkpoints (DutyTimeline.checkpoint_state)
+    # as zlib-compressed JSON, saved by re-plans so the next one replays from them
+    duty_timeline = models.BinaryField(null=True)
+
+
+class RouteJob(models.Model):
+    """A calculate-route request run in the background (POST /api/jobs/)"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    # validated RouteInput payload
+    input = models.JSONField()
+    # POSTed the job status once it finishes
+    callback_url = models.URLField(max_length=2048, null=True)
+    callback_status = models.IntegerField(null=True)
+
+    # the saved plan, served by GET /api/routes/<id>/
+    route = models.ForeignKey(Route, null=True, on_delete=models.SET_NULL)
+    error = models.TextField(null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+
+class MatrixCell(models.Model):
+    """A Distance Matrix element between two points rounded to COORDINATE_CACHE_PRECISION"""
+    # "lat,lng" of the rounded points
+    origin = models.CharField(max_length=32)
+    destination = models.CharField(max_length=32)
+    # seconds and meters, null when there is no driving route
+    duration = models.FloatField(null=True)
+    distance = models.FloatField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['origin', 'destination'], name='unique_matrix_cell')
+        ]
@@ -0,0 +1,20 @@
+# routes/renderers.py
+import msgpack
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+_json_encoder = DjangoJSONEncoder()
+
+
+class MessagePackRenderer(BaseRenderer):
+    """application/msgpack, chosen with the Accept header or ?format=msgpack"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # dates, decimals... get the same string form as in the JSON responses
+        return msgpack.packb(data, default=_json_encoder.default, use_bin_type=True)
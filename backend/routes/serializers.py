@@ -1,13 +1,73 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import Route
+from .services.route_jobs import callback_allowed
+
+class PointSerializer(serializers.Serializer):
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+
+class StopSerializer(PointSerializer):
+    """An extra pickup or dropoff of a multi-stop trip"""
+    address = serializers.CharField(required=False, allow_blank=True)
+    type = serializers.ChoiceField(choices=['pickup', 'dropoff'])
+    # pairs a dropoff with the pickup of the same load, it's visited after it
+    load = serializers.CharField(required=False, max_length=64)
+    # hours on duty at the stop
+    duration = serializers.FloatField(required=False, default=1, min_value=0, max_value=24)
 
 class RouteInputSerializer(serializers.ModelSerializer):
+    # not the Route.stops column (fuel stops), visited in the order that
+    # minimizes driving time between the pickup and the dropoff location
+    stops = StopSerializer(many=True, required=False, max_length=23)
+    # how many of the route options, ranked by trip duration, to return;
+    # up to 3 per leg from the Directions API, so 9 combinations at most
+    # (multi-stop trips take the single best-ordered route)
+    alternatives = serializers.IntegerField(required=False, min_value=1, max_value=9)
+
     class Meta:
         model = Route
         fields = ['current_location', 'pickup_location', 
-                 'dropoff_location', 'current_cycle_hours']
+                 'dropoff_location', 'current_cycle_hours', 'stops', 'alternatives']
+
+    def validate_stops(self, stops):
+        picked_up, dropped_off = set(), set()
+        for stop in stops:
+            load = stop.get('load')
+            if load is None:
+                continue
+            seen = picked_up if stop['type'] == 'pickup' else dropped_off
+            if load in seen:
+                raise serializers.ValidationError(f"Load {load} has more than one {stop['type']}")
+            seen.add(load)
+        missing = dropped_off - picked_up
+        if missing:
+            raise serializers.ValidationError(f"No pickup for load(s): {', '.join(sorted(missing))}")
+        return stops
 
 class RouteOutputSerializer(serializers.ModelSerializer):
     class Meta:
         model = Route
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class RouteJobInputSerializer(RouteInputSerializer):
+    callback_url = serializers.URLField(required=False, max_length=2048)
+
+    class Meta(RouteInputSerializer.Meta):
+        fields = RouteInputSerializer.Meta.fields + ['callback_url']
+
+    def validate_callback_url(self, value):
+        if not callback_allowed(value):
+            raise serializers.ValidationError("Callbacks can't be sent to this URL")
+        return value
+
+class MatrixInputSerializer(serializers.Serializer):
+    """Drivers x loads style travel time request, see POST /api/matrix/"""
+    origins = PointSerializer(many=True, min_length=1, max_length=settings.MATRIX_MAX_POINTS)
+    destinations = PointSerializer(many=True, min_length=1, max_length=settings.MATRIX_MAX_POINTS)
+
+class ReplanInputSerializer(serializers.Serializer):
+    """A GPS ping for POST /api/routes/<id>/replan/"""
+    position = PointSerializer()
+    # hours since the trip started, on the plan's clock
+    elapsed_duty_hours = serializers.FloatField(min_value=0)
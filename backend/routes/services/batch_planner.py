@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""batch_planner module"""
+
+import datetime
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Dict, Iterator, List
+
+from django.conf import settings
+from .concurrency import batch_executor
+from .route_planner import RoutePlanner, route_input_key, route_leg_key
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def _init_worker() -> None:
+    import django
+    django.setup()
+
+
+def build_plan_in_worker(data: Dict, route_details: Dict, start_time: datetime.datetime) -> Dict[str, Any]:
+    """Process pool entry point: HOS breaks, fuel stops and log sheets for one trip"""
+    return RoutePlanner().build_plan(data, route_details, start_time)
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Process-wide pool for the CPU side of planning, started on first use"""
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                # spawn, not fork: this process already runs thread pools
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=settings.PLANNING_PROCESSES,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker
+                )
+    return _process_pool
+
+
+def _discard_broken_pool(pool: ProcessPoolExecutor) -> None:
+    """Forget a pool whose worker died so the next batch starts a fresh one"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def plan_batch(payloads: List[Dict], start_time: datetime.datetime = None) -> Iterator[Dict]:
+    """Plan many trips, yielding one result per payload as soon as it is ready.
+
+    Identical payloads are planned once and identical current/pickup/dropoff
+    legs share one routing backend lookup (RoutePlanner.fetch_routes), from
+    which each trip gets its own route details. Routes are resolved
+    concurrently on the batch pool and each trip is handed to the process
+    pool as soon as its route is known. Results come out in completion order, tagged with the
+    payload's index.
+    """
+    start_time = start_time or datetime.datetime.now()
+    planner = RoutePlanner()
+    pool = get_process_pool()
+    finished = queue.Queue()
+
+    trips = {}  # input key -> (payload, indices of every copy of it)
+    for index, data in enumerate(payloads):
+        trips.setdefault(route_input_key(data), (data, []))[1].append(index)
+    legs = {}  # leg key -> input keys driving that leg
+    for key, (data, _) in trips.items():
+        legs.setdefault(route_leg_key(data), []).append(key)
+
+    def on_plan_done(key, future):
+        if isinstance(future.exception(), BrokenProcessPool):
+            _discard_broken_pool(pool)
+        finished.put((key, future))
+
+    def on_route_done(leg_key, future):
+        for key in legs[leg_key]:
+            data = trips[key][0]
+            try:
+                # each trip gets its own stop durations, addresses and ranking
+                route_details = planner.get_route_details(data, future.result())
+                plan_future = pool.submit(build_plan_in_worker, data, route_details, start_time)
+            except Exception as e:
+                plan_future = Future()
+                plan_future.set_exception(e)
+            plan_future.add_done_callback(partial(on_plan_done, key))
+
+    for leg_key, keys in legs.items():
+        route_future = batch_executor.submit(planner.fetch_routes, trips[keys[0]][0])
+        route_future.add_done_callback(partial(on_route_done, leg_key))
+
+    pending = set(trips)
+    while pending:
+        try:
+            key, future = finished.get(timeout=settings.BATCH_TRIP_TIMEOUT)
+        except queue.Empty:
+            break
+        pending.discard(key)
+        error = future.exception()
+        for index in trips[key][1]:
+            if error is not None:
+                yield {'index': index, 'status': 'error', 'error': f'Something went wrong: {str(error)}'}
+            else:
+                yield {'index': index, 'status': 'ok', 'result': future.result()}
+
+    for key in pending:
+        for index in trips[key][1]:
+            yield {'index': index, 'status': 'error', 'error': 'Timed out'}
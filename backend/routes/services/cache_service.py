@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""cache_service module"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from django.core.cache import caches
+
+_MISSING = object()
+
+
+def round_coordinate(point: Dict, precision: int) -> tuple:
+    """Round a {'lat', 'lng'} point so nearby requests share a cache key"""
+    return (round(float(point['lat']), precision), round(float(point['lng']), precision))
+
+
+def hash_parts(*parts: Any) -> str:
+    """Stable hex digest of JSON-serializable parts"""
+    payload = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def make_cache_key(namespace: str, *parts: Any) -> str:
+    """Build a short, stable cache key from JSON-serializable parts"""
+    return f"{namespace}:{hash_parts(*parts)}"
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with per-entry TTL"""
+
+    def __init__(self, max_size: int = 256, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TieredCache:
+    """In-process LRU in front of a shared Django cache backend.
+
+    Lookups try the local LRU first, then the shared tier (promoting hits
+    back into the LRU). Errors from the shared tier, e.g. a missing cache
+    table, are treated as misses so a cache outage never fails a request.
+    """
+
+    def __init__(self, namespace: str, max_size: int = 256, ttl: float = 3600,
+                 cache_alias: str = 'default'):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self.local = LRUCache(max_size=max_size, ttl=ttl)
+        self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'errors': 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias]
+
+    def key(self, *parts: Any) -> str:
+        return make_cache_key(self.namespace, *parts)
+
+    def _count(self, stat: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[stat] += n
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            self._count('local_hits')
+            return value
+
+        try:
+            value = self.shared.get(key, _MISSING)
+        except Exception:
+            self._count('errors')
+            value = _MISSING
+
+        if value is _MISSING:
+            self._count('misses')
+            return default
+
+        self._count('shared_hits')
+        self.local.set(key, value)
+        return value
+
+    def get_many(self, keys) -> Dict[str, Any]:
+        """Values of the keys found in either tier; one shared tier call for every local miss"""
+        found, missing = {}, []
+        for key in keys:
+            value = self.local.get(key, _MISSING)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        self._count('local_hits', len(found))
+        if not missing:
+            return found
+
+        try:
+            shared = self.shared.get_many(missing)
+        except Exception:
+            self._count('errors')
+            shared = {}
+        for key, value in shared.items():
+            self.local.set(key, value)
+        self._count('shared_hits', len(shared))
+        self._count('misses', len(missing) - len(shared))
+        return {**found, **shared}
+
+    def get_fresh(self, key: str, default: Any = None) -> Any:
+        """Like get, but the shared tier first: it has what other processes wrote since.
+
+        Falls back to the local value when the shared tier misses or fails,
+        e.g. for a read-modify-write of the entry.
+        """
+        try:
+            value = self.shared.get(key, _MISSING)
+        except Exception:
+            self._count('errors')
+            value = _MISSING
+        if value is _MISSING:
+            return self.local.get(key, default)
+        self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self.local.set(key, value)
+        try:
+            self.shared.set(key, value, timeout=self.ttl)
+        except Exception:
+            self._count('errors')
+
+    def get_or_set(self, key: str, compute) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def delete(self, key: str) -> None:
+        self.local.delete(key)
+        try:
+            self.shared.delete(key)
+        except Exception:
+            self._count('errors')
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['hits'] = stats['local_hits'] + stats['shared_hits']
+        stats['local_size'] = len(self.local)
+        return stats
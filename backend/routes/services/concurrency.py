@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""concurrency module"""
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextvars import copy_context
+from typing import Any, Callable, Iterable, List
+
+from django.conf import settings
+
+# Leaf calls (one Places/Geocode request each) run on the upstream pool, its
+# size is the process-wide limit on concurrent Google API calls. Whole pipeline
+# stages run on the stage pool and may wait on upstream futures, but upstream
+# tasks never wait on anything, so the two pools cannot deadlock each other.
+# Batch route lookups run the whole route stage (which fans out itself and may
+# use the stage pool) on the batch pool, which nothing else waits on.
+upstream_executor = ThreadPoolExecutor(
+    max_workers=settings.UPSTREAM_MAX_CONCURRENCY,
+    thread_name_prefix='upstream'
+)
+stage_executor = ThreadPoolExecutor(
+    max_workers=settings.STAGE_MAX_CONCURRENCY,
+    thread_name_prefix='stage'
+)
+batch_executor = ThreadPoolExecutor(
+    max_workers=settings.BATCH_ROUTE_CONCURRENCY,
+    thread_name_prefix='batch-route'
+)
+
+
+def fan_out(func: Callable, items: Iterable, timeout: float = None,
+            default: Any = None, on_error: Callable = None) -> List[Any]:
+    """Call func(item) for every item on the upstream pool.
+
+    Results come back in input order. Calls that raise, or are still running
+    after `timeout` seconds, yield `default` instead; `on_error(item, exc)` is
+    called for the ones that raised.
+    """
+    items = list(items)
+    if timeout is None:
+        timeout = settings.UPSTREAM_BATCH_TIMEOUT
+
+    # each call runs in a copy of the caller's context, so request-scoped
+    # state (stage timings) follows it onto the pool
+    futures = [upstream_executor.submit(copy_context().run, func, item) for item in items]
+    wait(futures, timeout=timeout)
+
+    results = []
+    for item, future in zip(items, futures):
+        if not future.done():
+            future.cancel()
+            results.append(default)
+            continue
+        exc = future.exception()
+        if exc is not None:
+            if on_error:
+                on_error(item, exc)
+            results.append(default)
+            continue
+        results.append(future.result())
+    return results
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""fleet_simulation module"""
+
+import csv
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterator, Sequence, Tuple
+
+import numpy as np
+
+from .geo import METERS_PER_MILE
+from .hos_service import HOSCalculator
+
+# trip hours are histogrammed in quarter hours up to this many hours for
+# the percentiles, longer trips land in the last bin (max is still exact)
+DURATION_BIN_HOURS = 0.25
+DURATION_HISTOGRAM_HOURS = 1000
+
+# HOSCalculator constants a what-if policy may change
+POLICY_CONSTANTS = ('MAX_CYCLE_HOURS', 'REQUIRED_BREAK_AFTER', 'MINIMUM_BREAK_DURATION',
+                    'MILES_PER_FUEL_STOP', 'FUELING_DURATION')
+
+TripChunk = Tuple[np.ndarray, np.ndarray, np.ndarray]  # drive hours, miles, cycle hours
+
+
+class FleetSummary:
+    """Running totals over simulated trips, mergeable across chunks and processes"""
+
+    def __init__(self):
+        self.trips = 0
+        self.skipped = 0
+        self.duration_sum = 0.0
+        self.duration_max = 0.0
+        self.total_trip_duration_sum = 0.0
+        self.drive_hours = 0.0
+        self.miles = 0.0
+        self.breaks = 0
+        self.fuel_stops = 0
+        self.compliant = 0
+        self.histogram = np.zeros(int(DURATION_HISTOGRAM_HOURS / DURATION_BIN_HOURS) + 1, dtype=np.int64)
+
+    def add(self, drive_hours: np.ndarray, miles: np.ndarray, totals: Dict[str, np.ndarray]) -> None:
+        """Add HOSCalculator.summarize_trips output for a chunk of trips"""
+        durations = totals['trip_hours']
+        self.trips += len(durations)
+        if not len(durations):
+            return
+        self.duration_sum += float(durations.sum())
+        self.duration_max = max(self.duration_max, float(durations.max()))
+        self.total_trip_duration_sum += float(totals['total_trip_duration'].sum())
+        self.drive_hours += float(drive_hours.sum())
+        self.miles += float(miles.sum())
+        self.breaks += int(totals['breaks'].sum())
+        self.fuel_stops += int(totals['fuel_stops'].sum())
+        self.compliant += int(totals['hos_compliance'].sum())
+        bins = np.minimum((durations / DURATION_BIN_HOURS).astype(np.int64), len(self.histogram) - 1)
+        self.histogram += np.bincount(bins, minlength=len(self.histogram))
+
+    def merge(self, other: 'FleetSummary') -> None:
+        for name in ('trips', 'skipped', 'duration_sum', 'total_trip_duration_sum', 'drive_hours', 'miles',
+                     'breaks', 'fuel_stops', 'compliant'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.duration_max = max(self.duration_max, other.duration_max)
+        self.histogram += other.histogram
+
+    def percentile(self, q: float) -> float:
+        """Upper edge of the bin holding the q-th percentile trip_hours"""
+        if not self.trips:
+            return 0.0
+        index = int(np.searchsorted(np.cumsum(self.histogram), q / 100 * self.trips))
+        return min((index + 1) * DURATION_BIN_HOURS, self.duration_max)
+
+    def to_dict(self) -> Dict:
+        trips = self.trips or 1
+        return {
+            'trips': self.trips,
+            'skipped_rows': self.skipped,
+            'total_drive_hours': round(self.drive_hours, 2),
+            'total_miles': round(self.miles, 2),
+            # pickup to dropoff, rest and fuel stops included
+            'trip_hours': {
+                'mean': round(self.duration_sum / trips, 3),
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99),
+                'max': round(self.duration_max, 3),
+            },
+            # the calculate-route total_trip_duration, averaged
+            'mean_total_trip_duration': round(self.total_trip_duration_sum / trips, 3),
+            'breaks': {'total': self.breaks, 'per_trip': round(self.breaks / trips, 3)},
+            'fuel_stops': {'total': self.fuel_stops, 'per_trip': round(self.fuel_stops / trips, 3)},
+            'compliance_rate': round(self.compliant / trips, 4),
+        }
+
+
+def policy_calculator(overrides: Dict[str, float]) -> type:
+    """HOSCalculator with some of its constants replaced"""
+    unknown = set(overrides) - set(POLICY_CONSTANTS)
+    if unknown:
+        raise ValueError(f"Unknown HOS constants: {', '.join(sorted(unknown))}")
+    if not overrides:
+        return HOSCalculator
+    return type('PolicyHOSCalculator', (HOSCalculator,), dict(overrides))
+
+
+def simulate_chunk(chunk: TripChunk, policies: Dict[str, Dict[str, float]]) -> Dict[str, FleetSummary]:
+    """Summaries of one chunk of trips under every policy"""
+    drive_hours, miles, cycle_hours = chunk
+    valid = (np.isfinite(drive_hours) & np.isfinite(miles) & np.isfinite(cycle_hours)
+             & (drive_hours >= 0) & (miles >= 0) & (cycle_hours >= 0))
+    drive_hours, miles, cycle_hours = drive_hours[valid], miles[valid], cycle_hours[valid]
+
+    summaries = {}
+    for name, overrides in policies.items():
+        summary = FleetSummary()
+        summary.skipped = int((~valid).sum())
+        summary.add(drive_hours, miles,
+                    policy_calculator(overrides).summarize_trips(drive_hours, miles, cycle_hours))
+        summaries[name] = summary
+    return summaries
+
+
+def simulate_fleet(chunks: Iterator[TripChunk], policies: Dict[str, Dict[str, float]],
+                   workers: int = 1) -> Dict[str, FleetSummary]:
+    """Run every chunk under every policy and merge the results.
+
+    With more than one worker, chunks go to a process pool with at most two
+    chunks per worker in flight, so memory stays bounded by the chunk size
+    however large the input is.
+    """
+    totals = {name: FleetSummary() for name in policies}
+
+    def merge(summaries):
+        for name, summary in summaries.items():
+            totals[name].merge(summary)
+
+    if workers <= 1:
+        for chunk in chunks:
+            merge(simulate_chunk(chunk, policies))
+        return totals
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        pending = set()
+        for chunk in chunks:
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    merge(future.result())
+            pending.add(pool.submit(simulate_chunk, chunk, policies))
+        for future in pending:
+            merge(future.result())
+    return totals
+
+
+def _to_chunk(columns: Sequence, distance_unit: str, duration_unit: str) -> TripChunk:
+    distance, duration, cycle = (np.asarray(column, dtype=float) for column in columns)
+    if distance_unit == 'meters':
+        distance = distance / METERS_PER_MILE
+    if duration_unit == 'seconds':
+        duration = duration / 3600
+    return duration, distance, cycle
+
+
+def _float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def iter_trip_chunks(source: Path, columns: Sequence[str], chunk_size: int = 100000,
+                     distance_unit: str = 'miles', duration_unit: str = 'hours') -> Iterator[TripChunk]:
+    """(drive hours, miles, cycle hours) arrays from a CSV or Parquet file, chunk_size rows at a time.
+
+    `columns` names the distance, duration and cycle hours columns. Rows with
+    a missing or unparsable value become NaN and are skipped by the simulation.
+    """
+    source = Path(source)
+    if source.suffix == '.parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Reading Parquet trips requires pyarrow")
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size, columns=list(columns)):
+            yield _to_chunk([batch.column(name).to_numpy(zero_copy_only=False) for name in columns],
+                            distance_unit, duration_unit)
+        return
+
+    with open(source, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        missing = [name for name in columns if name not in header]
+        if missing:
+            raise ValueError(f"Missing columns in {source.name}: {', '.join(missing)}")
+        indexes = [header.index(name) for name in columns]
+
+        rows = []
+        for row in reader:
+            rows.append([_float(row[i]) if i < len(row) else np.nan for i in indexes])
+            if len(rows) >= chunk_size:
+                yield _to_chunk(np.array(rows).T, distance_unit, duration_unit)
+                rows = []
+        if rows:
+            yield _to_chunk(np.array(rows).T, distance_unit, duration_unit)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""fuel_station_index module"""
+
+import csv
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+from scipy.spatial import cKDTree
+
+from .geo import EARTH_RADIUS_MILES
+from .polyline import RouteGeometry, to_unit_vectors
+
+LAT_COLUMNS = ('lat', 'latitude')
+LNG_COLUMNS = ('lng', 'lon', 'long', 'longitude')
+
+
+def _miles_to_chord(miles):
+    return 2 * np.sin(np.asarray(miles) / (2 * EARTH_RADIUS_MILES))
+
+
+def _chord_to_miles(chord):
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+def _read_rows(source: Path) -> List[Dict]:
+    if source.suffix == '.parquet':
+        try:
+            import pandas as pd
+        except ImportError:
+            raise ValueError("Reading a Parquet station export requires pandas and pyarrow")
+        return pd.read_parquet(source).to_dict('records')
+
+    with open(source, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def _pick(row: Dict, columns) -> Optional[str]:
+    for column in columns:
+        if row.get(column) not in (None, ''):
+            return row[column]
+    return None
+
+
+class FuelStationIndex:
+    """Offline truck-stop index: a memory-mapped coordinate array plus a KD-tree.
+
+    A CSV/Parquet export is compiled once into a directory holding
+    `coords.npy` (lat/lng degrees, memory-mapped on load) and
+    `stations.json`. Results are shaped like Places API results so they can
+    stand in for `places_nearby` output.
+    """
+
+    def __init__(self, coords: np.ndarray, stations: List[Dict]):
+        self.coords = coords
+        self.stations = stations
+        self.tree = cKDTree(to_unit_vectors(coords[:, 0], coords[:, 1]))
+
+    @classmethod
+    def compile(cls, source: Path, target: Path) -> None:
+        """Convert a CSV/Parquet export into the on-disk index format"""
+        coords = []
+        stations = []
+        for number, row in enumerate(_read_rows(source)):
+            lat, lng = _pick(row, LAT_COLUMNS), _pick(row, LNG_COLUMNS)
+            if lat is None or lng is None:
+                continue
+            coords.append((float(lat), float(lng)))
+            stations.append({
+                'place_id': str(_pick(row, ('place_id', 'id')) or f"station-{number}"),
+                'name': _pick(row, ('name',)) or "Fuel Station",
+                'vicinity': _pick(row, ('vicinity', 'address')) or "",
+            })
+
+        target.mkdir(parents=True, exist_ok=True)
+        np.save(target / 'coords.npy', np.asarray(coords, dtype=np.float64).reshape(-1, 2))
+        with open(target / 'stations.json', 'w') as f:
+            json.dump(stations, f)
+
+    @classmethod
+    def load(cls, path) -> 'FuelStationIndex':
+        """Load a compiled index directory, or a CSV/Parquet export (compiled next to it on first use)"""
+        path = Path(path)
+        if path.is_dir():
+            target = path
+        else:
+            target = path.with_name(path.name + '.index')
+            compiled = target / 'coords.npy'
+            if not compiled.exists() or os.path.getmtime(compiled) < os.path.getmtime(path):
+                cls.compile(path, target)
+
+        coords = np.load(target / 'coords.npy', mmap_mode='r')
+        with open(target / 'stations.json') as f:
+            stations = json.load(f)
+        return cls(coords, stations)
+
+    def _result(self, index: int, distance_miles: float) -> Dict:
+        lat, lng = self.coords[index]
+        return {
+            **self.stations[index],
+            'geometry': {'location': {'lat': float(lat), 'lng': float(lng)}},
+            'distance_miles': round(float(distance_miles), 2),
+        }
+
+    def nearest(self, lat: float, lng: float, k: int = 1,
+                max_distance_miles: float = None) -> List[Dict]:
+        """Up to k stations closest to a point, nearest first"""
+        if not self.stations:
+            return []
+        upper_bound = _miles_to_chord(max_distance_miles) if max_distance_miles else np.inf
+        chords, indices = self.tree.query(
+            to_unit_vectors([lat], [lng])[0],
+            k=min(k, len(self.stations)),
+            distance_upper_bound=upper_bound
+        )
+        chords, indices = np.atleast_1d(chords), np.atleast_1d(indices)
+        found = np.isfinite(chords)
+        return [
+            self._result(i, miles)
+            for i, miles in zip(indices[found], _chord_to_miles(chords[found]))
+        ]
+
+    def within_corridor(self, geometry: RouteGeometry, radius_miles: float,
+                        spacing_miles: float = None) -> List[Dict]:
+        """Stations within radius_miles of the route line, ordered by position along the route.
+
+        The line is resampled every `spacing_miles` (default: the radius), so
+        stations up to about radius + spacing / 2 from the line can match.
+        """
+        if not self.stations or len(geometry.coords) == 0:
+            return []
+        spacing_miles = spacing_miles or radius_miles
+        samples_at = np.arange(0, geometry.length_miles + spacing_miles, spacing_miles)
+        samples = geometry.point_at(samples_at)
+
+        matches = self.tree.query_ball_point(
+            to_unit_vectors(samples[:, 0], samples[:, 1]),
+            r=float(_miles_to_chord(radius_miles))
+        )
+        # keep each station at the first sample that reached it
+        first_seen = {}
+        for sample_index, station_indices in enumerate(matches):
+            for station_index in station_indices:
+                first_seen.setdefault(station_index, sample_index)
+
+        results = []
+        for station_index, sample_index in sorted(first_seen.items(), key=lambda item: item[1]):
+            lat, lng = samples[sample_index]
+            chord = np.linalg.norm(
+                self.tree.data[station_index] - to_unit_vectors([lat], [lng])[0]
+            )
+            result = self._result(station_index, _chord_to_miles(chord))
+            result['route_miles'] = round(float(samples_at[sample_index]), 1)
+            results.append(result)
+        return results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_fuel_station_index() -> FuelStationIndex:
+    """Process-wide index loaded from settings.FUEL_STATION_INDEX_PATH on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if not settings.FUEL_STATION_INDEX_PATH:
+                    raise ValueError("FUEL_STATION_INDEX_PATH is not configured")
+                _index = FuelStationIndex.load(settings.FUEL_STATION_INDEX_PATH)
+    return _index
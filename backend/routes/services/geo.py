@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+"""geo module"""
+
+import math
+
+METERS_PER_MILE = 1609.34
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LAT = 69.05
+
+
+def haversine_miles(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two points in miles"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""geocode_cache module"""
+
+import math
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from .cache_service import TieredCache
+from .geo import MILES_PER_DEGREE_LAT, haversine_miles
+
+
+# cells found empty are remembered this long (seconds), in this process only,
+# so points other processes add there are picked up soon
+EMPTY_CELL_TTL = 300
+# how long an add waits for another process adding to the same cell
+CELL_LOCK_TIMEOUT = 2
+CELL_LOCK_POLL = 0.01
+
+
+class GeocodeCache:
+    """Reverse-geocode store backed by a lat/lng grid index.
+
+    Resolved points are bucketed into square grid cells roughly `radius_miles`
+    on a side, and each cell is one entry in a TieredCache, so the LRU size cap
+    and TTL apply per cell. A lookup scans the cells around the query point and
+    returns the closest stored name within `radius_miles`.
+
+    Adding a point is a read-modify-write of its cell, done under a lock in
+    the 'coordination' cache so adds from different processes don't drop each
+    other's points.
+    """
+
+    def __init__(self, radius_miles: float = 5, max_cells: int = 2048,
+                 max_points_per_cell: int = 16, ttl: float = 30 * 24 * 3600):
+        self.radius_miles = radius_miles
+        self.cell_size = radius_miles / MILES_PER_DEGREE_LAT  # degrees
+        self.max_points_per_cell = max_points_per_cell
+        self.cells = TieredCache('geocode', max_size=max_cells, ttl=ttl)
+        self._write_lock = threading.Lock()
+
+    @property
+    def locks(self):
+        return caches['coordination']
+
+    def _cell(self, lat: float, lng: float) -> tuple:
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def _cell_key(self, cell: tuple) -> str:
+        return self.cells.key(self.cell_size, cell)
+
+    def _neighbour_cells(self, lat: float, lng: float):
+        row, col = self._cell(lat, lng)
+        # longitude degrees shrink towards the poles, widen the search to match
+        lng_span = math.ceil(1 / max(math.cos(math.radians(lat)), 0.01))
+        for d_row in (-1, 0, 1):
+            for d_col in range(-lng_span, lng_span + 1):
+                yield (row + d_row, col + d_col)
+
+    def lookup(self, lat: float, lng: float) -> Optional[str]:
+        """Name of the closest resolved point within the radius, or None.
+
+        An empty string is a cached "no locality found" result and is
+        returned as-is so callers can skip the API call for it too.
+        """
+        keys = [self._cell_key(cell) for cell in self._neighbour_cells(lat, lng)]
+        cells = self.cells.get_many(keys)
+        for key in set(keys) - cells.keys():
+            # no need to ask the shared tier for it again right away
+            self.cells.local.set(key, (), ttl=EMPTY_CELL_TTL)
+
+        best_name, best_distance = None, self.radius_miles
+        for points in cells.values():
+            for point_lat, point_lng, name in points:
+                distance = haversine_miles(lat, lng, point_lat, point_lng)
+                if distance <= best_distance:
+                    best_name, best_distance = name, distance
+        return best_name
+
+    @contextmanager
+    def _cell_lock(self, key: str):
+        """Hold the cell's lock, or go ahead after CELL_LOCK_TIMEOUT (its holder died)"""
+        lock_key, token = f"{key}:lock", uuid.uuid4().hex
+        acquired = False
+        deadline = time.monotonic() + CELL_LOCK_TIMEOUT
+        try:
+            while True:
+                acquired = self.locks.add(lock_key, token, timeout=CELL_LOCK_TIMEOUT)
+                if acquired or time.monotonic() >= deadline:
+                    break
+                time.sleep(CELL_LOCK_POLL)
+        except Exception:
+            # no shared cache, no other process to lose points to
+            pass
+        try:
+            yield
+        finally:
+            if acquired:
+                try:
+                    if self.locks.get(lock_key) == token:
+                        self.locks.delete(lock_key)
+                except Exception:
+                    pass
+
+    def add(self, lat: float, lng: float, name: str) -> None:
+        key = self._cell_key(self._cell(lat, lng))
+        with self._write_lock, self._cell_lock(key):
+            points = list(self.cells.get_fresh(key) or ())
+            points.append((lat, lng, name))
+            # oldest points are evicted first once a cell is full
+            self.cells.set(key, points[-self.max_points_per_cell:])
+
+geocode_cache = GeocodeCache(
+    radius_miles=settings.GEOCODE_CACHE_RADIUS_MILES,
+    max_cells=settings.GEOCODE_CACHE_MAX_CELLS,
+    ttl=settings.GEOCODE_CACHE_TTL,
+)
@@ -3,53 +3,156 @@
 
 from django.conf import settings
 from typing import Dict, List, Any
-import googlemaps
+import numpy as np
+from .cache_service import TieredCache, round_coordinate
+from .concurrency import fan_out
+from .fuel_station_index import get_fuel_station_index
+from .maps_client import get_maps_client
+from .matrix_service import MatrixService
+from .polyline import RouteGeometry
+from .routing import RoutingProvider
+from .timing import count, stage, timed
 
 
-class GoogleMapsService:
+# shared across requests so repeat plans of the same trip skip the Directions API
+directions_cache = TieredCache(
+    'directions',
+    max_size=settings.DIRECTIONS_CACHE_SIZE,
+    ttl=settings.DIRECTIONS_CACHE_TTL,
+)
+
+
+class GoogleMapsService(RoutingProvider):
     def __init__(self):
-        self.client = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
+        self._client = None
+        self.directions_cache = directions_cache
 
+    @property
+    def client(self):
+        # created on first call, the offline fuel index and local router never need it
+        if self._client is None:
+            self._client = get_maps_client()
+        return self._client
 
-    def get_route_details(self, origin: Dict, destination: Dict, waypoints: List[Dict] = None) -> Dict[str, Any]:
+
+    def get_directions(self, origin: Dict, destination: Dict, waypoints: List[Dict] = None,
+                       **options) -> List[Dict]:
+        """Raw Directions API response, served from the cache when possible"""
+        precision = settings.COORDINATE_CACHE_PRECISION
+        cache_key = self.directions_cache.key(
+            round_coordinate(origin, precision),
+            round_coordinate(destination, precision),
+            [round_coordinate(wp, precision) for wp in (waypoints or [])],
+            options
+        )
+        directions = self.directions_cache.get(cache_key)
+        if directions is not None:
+            count('cache_hit.directions')
+        else:
+            count('cache_miss.directions')
+            count('upstream.directions')
+            with stage('directions'):
+                directions = self.client.directions(
+                    origin=f"{origin['lat']},{origin['lng']}",
+                    destination=f"{destination['lat']},{destination['lng']}",
+                    waypoints=[f"{wp['lat']},{wp['lng']}" for wp in (waypoints or [])],
+                    **options
+                )
+            # empty results are not cached, a later retry may find a route
+            if directions:
+                self.directions_cache.set(cache_key, directions)
+        return directions
+
+
+    def route_details(self, route: Dict) -> Dict[str, Any]:
+        """One Directions API route in the RoutingProvider route details shape"""
+        # Calculate total distance and duration
+        total_distance = sum(leg['distance']['value'] for leg in route['legs'])
+        total_duration = sum(leg['duration']['value'] for leg in route['legs'])
+
+        return {
+            'distance': total_distance,  # in meters
+            'duration': total_duration,  # in seconds
+            'polyline': route['overview_polyline']['points'],
+            # every leg's steps, not just the first leg's
+            'steps': [step for leg in route['legs'] for step in leg['steps']],
+            'legs': [{'distance': leg['distance']['value'], 'duration': leg['duration']['value']}
+                     for leg in route['legs']],
+            'bounds': route['bounds'],
+            'summary': route.get('summary', '')
+        }
+
+
+    def get_route_alternatives(self, origin: Dict, destination: Dict,
+                               waypoints: List[Dict] = None) -> List[Dict[str, Any]]:
         try:
-            directions = self.client.directions(
-                origin=f"{origin['lat']},{origin['lng']}",
-                destination=f"{destination['lat']},{destination['lng']}",
-                waypoints=[f"{wp['lat']},{wp['lng']}" for wp in (waypoints or [])],
-                optimize_waypoints=True,
-                # adding alternatives=True allows us to get multiple route options 
+            directions = self.get_directions(
+                origin=origin,
+                destination=destination,
+                waypoints=waypoints,
+                # waypoints come in the order RoutePlanner solved for, which
+                # respects pickup-before-dropoff; Google's wouldn't
+                optimize_waypoints=False,
+                # up to 3 routes, though only when there are no waypoints
                 alternatives=True
             )
 
             if not directions:
                 raise ValueError("No route found")
 
-            route = directions[0]
-            
-            # Calculate total distance and duration
-            total_distance = sum(leg['distance']['value'] for leg in route['legs'])
-            total_duration = sum(leg['duration']['value'] for leg in route['legs'])
-
-            return {
-                'distance': total_distance,  # in meters
-                'duration': total_duration,  # in seconds
-                'polyline': route['overview_polyline']['points'],
-                'steps': route['legs'][0]['steps'],
-                'bounds': route['bounds']
-            }
+            return [self.route_details(route) for route in directions]
         except Exception as e:
             raise Exception(f"Error calculating route: {str(e)}")
 
 
-    def find_fuel_stops(self, route_points: List[Dict], max_distance: int = 1000000) -> List[Dict]:
+    def get_route_details(self, origin: Dict, destination: Dict, waypoints: List[Dict] = None) -> Dict[str, Any]:
+        return self.get_route_alternatives(origin, destination, waypoints)[0]
+
+
+    def get_duration_matrix(self, points: List[Dict]) -> np.ndarray:
+        """Driving times between all points, from the cached Distance Matrix cells"""
+        matrix = MatrixService(self._client).get_matrix(points, points)['duration']
+        np.fill_diagonal(matrix, 0)
+        return matrix
+
+    @timed('fuel_stops')
+    def find_fuel_stops(self, breaks: List[Dict], geometry: RouteGeometry) -> List[Dict]:
+        """Nearest gas station to each fuel stop scheduled by HOSCalculator"""
+        fuel_breaks = [b for b in breaks if b['type'] == 'fuel']
+        if not fuel_breaks or len(geometry.coords) == 0:
+            return []
+
+        # fuel stops are scheduled by distance, place them on the actual route line
+        query_points = geometry.point_at_fraction(
+            np.array([b['route_percentage'] / 100 for b in fuel_breaks])
+        )
+
+        if settings.FUEL_STATION_BACKEND == 'index':
+            # local station index, no network involved
+            index = get_fuel_station_index()
+            radius_miles = settings.FUEL_STOP_SEARCH_RADIUS / 1609.34
+            stations = [
+                next(iter(index.nearest(lat, lng, max_distance_miles=radius_miles)), None)
+                for lat, lng in query_points
+            ]
+        else:
+            def nearest_station(point):
+                count('upstream.places')
+                with stage('places'):
+                    places = self.client.places_nearby(
+                        location=(float(point[0]), float(point[1])),
+                        radius=settings.FUEL_STOP_SEARCH_RADIUS,
+                        type='gas_station'
+                    )
+                return places['results'][0] if places.get('results') else None
+
+            # one Places call per stop, run side by side instead of back to back
+            stations = fan_out(nearest_station, query_points)
+
         fuel_stops = []
-        for point in route_points:
-            places = self.client.places_nearby(
-                location=(point['lat'], point['lng']),
-                radius=5000,
-                type='gas_station'
-            )
-            if places.get('results'):
-                fuel_stops.append(places['results'][0])
-        return fuel_stops
\ No newline at end of file
+        seen_place_ids = set()
+        for stop in stations:
+            if stop and stop.get('place_id') not in seen_place_ids:
+                seen_place_ids.add(stop.get('place_id'))
+                fuel_stops.append(stop)
+        return fuel_stops
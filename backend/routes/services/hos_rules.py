@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""hos_rules module"""
+
+import bisect
+import math
+from typing import Dict, List
+
+from .hos_service import HOSCalculator
+
+EPSILON = 1e-9
+
+# duty statuses, as printed on the log sheets
+DRIVING, ON_DUTY, OFF_DUTY = 'D', 'ON', 'OFF'
+
+ON_DUTY_TASKS = ('pickup', 'dropoff', 'fuel')
+# duty status of each event type
+EVENT_STATUS = {'driving': DRIVING, 'break': OFF_DUTY, 'off_duty': OFF_DUTY,
+                'pickup': ON_DUTY, 'dropoff': ON_DUTY, 'fuel': ON_DUTY}
+
+
+class DutyState:
+    """Rule counters at one point of the timeline, cheap to copy for checkpoints"""
+    __slots__ = ('time', 'distance', 'distance_since_fuel', 'drive_since_break',
+                 'shift_drive', 'shift_start', 'cycle_start', 'prior_cycle_hours')
+
+    def __init__(self, prior_cycle_hours: float):
+        self.time = 0.0
+        self.distance = 0.0
+        self.distance_since_fuel = 0.0
+        self.drive_since_break = 0.0  # driving since the last 30 minute interruption
+        self.shift_drive = 0.0  # driving since the last 10 hour reset
+        self.shift_start = None  # when the 14 hour window opened, None while off duty
+        self.cycle_start = None  # end of the last 34 hour restart, None if none yet
+        self.prior_cycle_hours = prior_cycle_hours  # on-duty hours before the trip
+
+    def copy(self) -> 'DutyState':
+        state = DutyState.__new__(DutyState)
+        for name in self.__slots__:
+            setattr(state, name, getattr(self, name))
+        return state
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, values: Dict) -> 'DutyState':
+        state = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(state, name, values[name])
+        return state
+
+
+class DutyTimeline:
+    """FMCSA property-carrying HOS simulation of a trip as a duty-status event timeline.
+
+    A trip is a list of tasks, e.g. {'type': 'pickup', 'duration': 1} or
+    {'type': 'driving', 'duration': 20.5, 'distance': 1200}. Simulating them
+    inserts the rest the rules require:
+
+    - a 30 minute break after 8 hours of driving without a 30 minute
+      interruption (any non-driving period counts, fuel stops included)
+    - a 10 hour off-duty reset once 11 hours were driven or the 14 hour window
+      since the shift started has closed
+    - a 34 hour restart once the 70 hour / 8 day cycle is used up
+    - a fuel stop every HOSCalculator.MILES_PER_FUEL_STOP miles
+
+    The counters are checkpointed at the start of every task, so changing a
+    task (a delay at pickup, a re-estimated drive) only replays the timeline
+    from that task on. Driving tasks marked 'logged' already happened: they
+    count towards every limit but no rest is inserted into them, so a trip's
+    history can lead its remaining tasks (see replan).
+    """
+    MAX_DRIVING_HOURS = HOSCalculator.MAX_DRIVING_HOURS
+    MAX_DUTY_HOURS = HOSCalculator.MAX_DUTY_HOURS
+    MAX_CYCLE_HOURS = HOSCalculator.MAX_CYCLE_HOURS
+    CYCLE_DAYS = 8
+    REQUIRED_BREAK_AFTER = HOSCalculator.REQUIRED_BREAK_AFTER
+    MINIMUM_BREAK_DURATION = HOSCalculator.MINIMUM_BREAK_DURATION
+    SHIFT_RESET_DURATION = 10
+    CYCLE_RESTART_DURATION = 34
+    MILES_PER_FUEL_STOP = HOSCalculator.MILES_PER_FUEL_STOP
+    FUELING_DURATION = HOSCalculator.FUELING_DURATION
+
+    def __init__(self, tasks: List[Dict], current_cycle_hours: float):
+        self.tasks = list(tasks)
+        self.current_cycle_hours = current_cycle_hours
+        self.events = []
+        # checkpoints[i] = (state before task i, number of events before task i)
+        self.checkpoints = [(DutyState(current_cycle_hours), 0)]
+        self._replay(0)
+
+    @classmethod
+    def restore(cls, saved: Dict, breaks: List[Dict], current_cycle_hours: float) -> 'DutyTimeline':
+        """A timeline as checkpoint_state saved it, without replaying any of it.
+
+        Its events are the breaks to_breaks made of them, so edits replay
+        from the edited task's checkpoint on, as on the original timeline.
+        """
+        timeline = cls.__new__(cls)
+        timeline.tasks = list(saved['tasks'])
+        timeline.current_cycle_hours = current_cycle_hours
+        timeline.events = [{**b, 'status': EVENT_STATUS[b['type']]} for b in breaks]
+        timeline.checkpoints = [(DutyState.from_dict(state), event_count)
+                                for state, event_count in saved['checkpoints']]
+        return timeline
+
+    def checkpoint_state(self) -> Dict:
+        """Tasks and checkpoints as JSON-serializable data, for restore"""
+        return {
+            'tasks': self.tasks,
+            'checkpoints': [[state.to_dict(), event_count] for state, event_count in self.checkpoints],
+        }
+
+    @classmethod
+    def for_trip(cls, total_drive_time: float, total_distance: float,
+                 current_cycle_hours: float) -> 'DutyTimeline':
+        """Timeline for the usual pickup -> drive -> dropoff trip"""
+        return cls([
+            {'type': 'pickup', 'duration': 1},
+            {'type': 'driving', 'duration': total_drive_time, 'distance': total_distance},
+            {'type': 'dropoff', 'duration': 1},
+        ], current_cycle_hours)
+
+    @classmethod
+    def for_stops(cls, legs: List[Dict], stops: List[Dict],
+                  current_cycle_hours: float) -> 'DutyTimeline':
+        """Timeline for a multi-stop trip: each leg (meters, seconds) is driven, then its stop worked"""
+        return cls(cls.stop_tasks(legs, stops), current_cycle_hours)
+
+    @staticmethod
+    def stop_tasks(legs: List[Dict], stops: List[Dict]) -> List[Dict]:
+        tasks = []
+        for leg, stop in zip(legs, stops):
+            if leg['duration'] > 0:
+                tasks.append({'type': 'driving', 'duration': leg['duration'] / 3600,
+                              'distance': leg['distance'] / 1609.34})
+            tasks.append({'type': stop['type'], 'duration': stop.get('duration', 1),
+                          'address': stop.get('address'),
+                          'location': {'lat': stop['lat'], 'lng': stop['lng']}})
+        return tasks
+
+    # editing tasks, each returns the index of the first event that changed
+
+    def replace_task(self, index: int, task: Dict) -> int:
+        self.tasks[index] = task
+        return self._replay(index)
+
+    def insert_task(self, index: int, task: Dict) -> int:
+        self.tasks.insert(index, task)
+        return self._replay(index)
+
+    def remove_task(self, index: int) -> int:
+        del self.tasks[index]
+        return self._replay(index)
+
+    def replace_tasks_from(self, index: int, tasks: List[Dict]) -> int:
+        """Replace every task from index on, e.g. the rest of a trip after a re-plan"""
+        self.tasks[index:] = tasks
+        return self._replay(index)
+
+    def delay_task(self, index: int, hours: float) -> int:
+        """Extend a task, e.g. a driver waiting at the pickup"""
+        task = dict(self.tasks[index])
+        task['duration'] = task['duration'] + hours
+        return self.replace_task(index, task)
+
+    # simulation
+
+    def _replay(self, from_task: int) -> int:
+        state, event_count = self.checkpoints[from_task]
+        state = state.copy()
+        del self.events[event_count:]
+        del self.checkpoints[from_task + 1:]
+
+        for task in self.tasks[from_task:]:
+            if task['type'] == 'driving' and task.get('logged'):
+                self._log_drive(state, task['duration'], task.get('distance', 0))
+            elif task['type'] == 'driving':
+                self._drive(state, task['duration'], task.get('distance', 0))
+            elif task['type'] == 'off_duty':
+                self._off_duty(state, task['duration'], task.get('reason', 'off_duty'))
+            elif task['type'] in ON_DUTY_TASKS:
+                self._on_duty(state, task['type'], task['duration'],
+                              address=task.get('address'), location=task.get('location'))
+            else:
+                raise ValueError(f"Unknown task type: {task['type']}")
+            self.checkpoints.append((state.copy(), len(self.events)))
+        return event_count
+
+    def _emit(self, state: DutyState, event_type: str, status: str, duration: float,
+              distance: float = 0.0, reason: str = None, address: str = None,
+              location: Dict = None) -> None:
+        state.distance += distance
+        event = {
+            'type': event_type,
+            'status': status,
+            'duration': duration,
+            'start_time': state.time,
+            'end_time': state.time + duration,
+            'distance_covered': state.distance
+        }
+        if reason:
+            event['reason'] = reason
+        if address:
+            event['address'] = address
+        if location:
+            event['location'] = dict(location)
+        self.events.append(event)
+        state.time += duration
+
+    def cycle_hours_used(self, state: DutyState) -> float:
+        """On-duty hours inside the rolling 8 day window ending now"""
+        window_start = state.time - self.CYCLE_DAYS * 24
+        used = 0.0
+        if state.cycle_start is None:
+            # hours worked before the trip are not timestamped, they are
+            # assumed to stay in the window until a restart (conservative)
+            used += state.prior_cycle_hours
+        else:
+            window_start = max(window_start, state.cycle_start)
+
+        for event in reversed(self.events):
+            if event['end_time'] <= window_start:
+                break
+            if event['status'] != OFF_DUTY:
+                used += event['end_time'] - max(event['start_time'], window_start)
+        return used
+
+    def _off_duty(self, state: DutyState, duration: float, reason: str) -> None:
+        self._emit(state, 'off_duty', OFF_DUTY, duration, reason=reason)
+        if duration >= self.MINIMUM_BREAK_DURATION - EPSILON:
+            state.drive_since_break = 0.0
+        if duration >= self.SHIFT_RESET_DURATION - EPSILON:
+            state.shift_drive = 0.0
+            state.shift_start = None
+        if duration >= self.CYCLE_RESTART_DURATION - EPSILON:
+            state.cycle_start = state.time
+
+    def _on_duty(self, state: DutyState, event_type: str, duration: float,
+                 address: str = None, location: Dict = None) -> None:
+        if state.shift_start is None:
+            state.shift_start = state.time
+        self._emit(state, event_type, ON_DUTY, duration, address=address, location=location)
+        if duration >= self.MINIMUM_BREAK_DURATION - EPSILON:
+            state.drive_since_break = 0.0
+        if event_type == 'fuel':
+            state.distance_since_fuel = 0.0
+
+    def _log_drive(self, state: DutyState, hours: float, miles: float) -> None:
+        if state.shift_start is None:
+            state.shift_start = state.time
+        self._emit(state, 'driving', DRIVING, hours, distance=miles)
+        state.drive_since_break += hours
+        state.shift_drive += hours
+        state.distance_since_fuel += miles
+
+    def _drive(self, state: DutyState, hours: float, miles: float) -> None:
+        speed = miles / hours if hours > 0 else 0.0
+        remaining = hours
+
+        while remaining > EPSILON:
+            cycle_left = self.MAX_CYCLE_HOURS - self.cycle_hours_used(state)
+            if cycle_left <= EPSILON:
+                self._off_duty(state, self.CYCLE_RESTART_DURATION, '34_hour_restart')
+                continue
+
+            if state.shift_start is None:
+                state.shift_start = state.time
+            shift_left = min(self.MAX_DRIVING_HOURS - state.shift_drive,
+                             self.MAX_DUTY_HOURS - (state.time - state.shift_start))
+            if shift_left <= EPSILON:
+                self._off_duty(state, self.SHIFT_RESET_DURATION, '10_hour_reset')
+                continue
+
+            if speed > 0 and state.distance_since_fuel >= self.MILES_PER_FUEL_STOP - EPSILON:
+                self._on_duty(state, 'fuel', self.FUELING_DURATION)
+                continue
+
+            break_left = self.REQUIRED_BREAK_AFTER - state.drive_since_break
+            if break_left <= EPSILON:
+                self._emit(state, 'break', OFF_DUTY, self.MINIMUM_BREAK_DURATION)
+                state.drive_since_break = 0.0
+                continue
+
+            chunk = min(remaining, cycle_left, shift_left, break_left)
+            if speed > 0:
+                chunk = min(chunk, (self.MILES_PER_FUEL_STOP - state.distance_since_fuel) / speed)
+
+            self._emit(state, 'driving', DRIVING, chunk, distance=chunk * speed)
+            remaining -= chunk
+            state.drive_since_break += chunk
+            state.shift_drive += chunk
+            state.distance_since_fuel += chunk * speed
+
+    # results
+
+    @property
+    def total_duration(self) -> float:
+        return self.events[-1]['end_time'] if self.events else 0.0
+
+    def is_compliant(self) -> bool:
+        """True when the trip fits without a 34 hour restart"""
+        return not any(event.get('reason') == '34_hour_restart' for event in self.events)
+
+    def task_events(self, task_index: int) -> int:
+        """Index of the first event of the task, e.g. to read the events of every task from it on"""
+        return self.checkpoints[task_index][1]
+
+    def event_task(self, event_index: int) -> int:
+        """Index of the task that emitted the event"""
+        return bisect.bisect_right([event_count for _, event_count in self.checkpoints[:-1]], event_index) - 1
+
+    def to_breaks(self, from_event: int = 0) -> List[Dict]:
+        """Events in the calculate_breaks dict shape (fuel stops get their route percentage)"""
+        total_distance = self.checkpoints[-1][0].distance or 1.0
+        breaks = []
+        for event in self.events[from_event:]:
+            row = {key: value for key, value in event.items() if key != 'status'}
+            if event['type'] == 'fuel':
+                row['route_percentage'] = (event['distance_covered'] / total_distance) * 100
+            breaks.append(row)
+        return breaks
+
+
+class BasicDutyTimeline(DutyTimeline):
+    """The 'basic' ruleset (HOSCalculator) as a timeline.
+
+    Only 30 minute breaks and fuel stops are inserted, there are no 11/14
+    hour or cycle limits. Compliant means the driving fits in the hours the
+    cycle has left, as HOSCalculator reports it.
+    """
+    MAX_DRIVING_HOURS = math.inf
+    MAX_DUTY_HOURS = math.inf
+    MAX_CYCLE_HOURS = math.inf
+
+    def is_compliant(self) -> bool:
+        driving = sum(event['duration'] for event in self.events if event['status'] == DRIVING)
+        return driving <= HOSCalculator.MAX_CYCLE_HOURS - self.current_cycle_hours
@@ -1,5 +1,10 @@
 from datetime import datetime, timedelta
 from typing import List, Dict
+import logging
+import math
+import numpy as np
+
+logger = logging.getLogger(__name__)
 
 class HOSCalculator:
     MAX_DRIVING_HOURS = 11
@@ -16,110 +21,155 @@ class HOSCalculator:
         self.remaining_cycle_hours = self.MAX_CYCLE_HOURS - current_cycle_hours
 
 
-    def calculate_breaks(self, total_drive_time: float, total_distance: float) -> List[Dict]:
-        breaks = []
-        current_drive_time = 0
-        total_time = 0
-        distance_covered = 0
-        distance_since_fuel = 0
-        
-        # Add initial pickup
-        breaks.append({
-            'type': 'pickup',
-            'duration': 1,
-            'start_time': total_time,
-            'end_time': total_time + 1,
-            'distance_covered': distance_covered
-        })
-        total_time += 1
-        
-        while current_drive_time < total_drive_time:
-            # Calculate next segment duration
-            remaining_drive = min(
-                self.REQUIRED_BREAK_AFTER,
-                total_drive_time - current_drive_time,
-                self.remaining_cycle_hours
+    def calculate_schedule(self, total_drive_time: float, total_distance: float) -> 'HOSSchedule':
+        """Columnar trip schedule, computed arithmetically instead of segment by segment.
+
+        Driving is interrupted by a break every REQUIRED_BREAK_AFTER hours
+        (capped by the remaining cycle hours) and by a fuel stop every
+        MILES_PER_FUEL_STOP miles; with a constant average speed both are
+        fixed points on the drive-time axis, so every boundary is known up
+        front. A fuel stop that lands on a break boundary comes first.
+        """
+        # a segment can't be longer than the cycle allows, an exhausted cycle
+        # still gets a schedule (it is reported as non compliant)
+        chunk = min(self.REQUIRED_BREAK_AFTER, self.remaining_cycle_hours)
+        if chunk <= 0:
+            chunk = self.REQUIRED_BREAK_AFTER
+
+        if total_drive_time > 0:
+            break_positions = chunk * np.arange(1, math.ceil(total_drive_time / chunk))
+            # no fuel stop right at the destination
+            fuel_distances = self.MILES_PER_FUEL_STOP * np.arange(
+                1, math.ceil(total_distance / self.MILES_PER_FUEL_STOP)
             )
-            
-            # Calculate distance for this segment (proportional to driving time)
-            segment_distance = (remaining_drive / total_drive_time) * total_distance
-            
-            # Check if we need a fuel stop within this segment
-            if distance_since_fuel + segment_distance >= self.MILES_PER_FUEL_STOP:
-                # Add driving until fuel stop
-                distance_to_fuel = self.MILES_PER_FUEL_STOP - distance_since_fuel
-                drive_time_to_fuel = (distance_to_fuel / total_distance) * total_drive_time
-                
-                if drive_time_to_fuel > 0:
-                    breaks.append({
-                        'type': 'driving',
-                        'duration': drive_time_to_fuel,
-                        'start_time': total_time,
-                        'end_time': total_time + drive_time_to_fuel,
-                        'distance_covered': distance_covered + distance_to_fuel
-                    })
-                    
-                    total_time += drive_time_to_fuel
-                    current_drive_time += drive_time_to_fuel
-                    distance_covered += distance_to_fuel
-                
-                # Add fuel stop
-                breaks.append({
-                    'type': 'fuel',
-                    'duration': self.FUELING_DURATION,
-                    'start_time': total_time,
-                    'end_time': total_time + self.FUELING_DURATION,
-                    'distance_covered': distance_covered,
-                    'route_percentage': (distance_covered / total_distance) * 100  # Add percentage along route
-                })
-                
-                total_time += self.FUELING_DURATION
-                distance_since_fuel = 0
-                
-                # Recalculate remaining segment
-                remaining_distance = segment_distance - distance_to_fuel
-                remaining_drive = (remaining_distance / total_distance) * total_drive_time
-            
-            # Add driving segment
-            if remaining_drive > 0:
-                segment_distance_remaining = (remaining_drive / total_drive_time) * total_distance
-                
-                breaks.append({
-                    'type': 'driving',
-                    'duration': remaining_drive,
-                    'start_time': total_time,
-                    'end_time': total_time + remaining_drive,
-                    'distance_covered': distance_covered + segment_distance_remaining
-                })
-                
-                total_time += remaining_drive
-                current_drive_time += remaining_drive
-                distance_covered += segment_distance_remaining
-                distance_since_fuel += segment_distance_remaining
-            
-            # Add mandatory break if needed
-            if current_drive_time < total_drive_time:
-                breaks.append({
-                    'type': 'break',
-                    'duration': self.MINIMUM_BREAK_DURATION,
-                    'start_time': total_time,
-                    'end_time': total_time + self.MINIMUM_BREAK_DURATION,
-                    'distance_covered': distance_covered
-                })
-                total_time += self.MINIMUM_BREAK_DURATION
-        
-        # Add final dropoff
-        breaks.append({
-            'type': 'dropoff',
-            'duration': 1,
-            'start_time': total_time,
-            'end_time': total_time + 1,
-            'distance_covered': distance_covered
-        })
-        
-        # Debug print to see fuel stop distribution
-        for idx, break_info in enumerate(breaks):
-            if break_info['type'] == 'fuel':
-                print(f"Fuel stop {idx}: at {break_info['distance_covered']:.1f} miles ({break_info['route_percentage']:.1f}% of route)")
-        
-        return breaks
\ No newline at end of file
+            fuel_positions = fuel_distances / total_distance * total_drive_time
+        else:
+            break_positions = fuel_positions = np.empty(0)
+
+        # fuel stops are listed first, so a stable sort keeps them ahead of a
+        # break at the same position
+        stop_positions = np.concatenate((fuel_positions, break_positions))
+        order = np.argsort(stop_positions, kind='stable')
+        stop_positions = stop_positions[order]
+        is_fuel = order < len(fuel_positions)
+        count = len(stop_positions)
+
+        # rows: pickup, then driving / stop alternating, a last driving row
+        # to the end of the trip and the dropoff
+        types = np.empty(2 * count + 3, dtype=np.int8)
+        durations = np.empty(2 * count + 3)
+        drive_positions = np.empty(2 * count + 3)
+
+        types[0], durations[0], drive_positions[0] = HOSSchedule.PICKUP, 1.0, 0.0
+        types[1:-1:2] = HOSSchedule.DRIVING
+        drive_positions[1:-2:2] = stop_positions
+        drive_positions[-2] = max(total_drive_time, 0.0)
+        durations[1:-1:2] = np.diff(drive_positions[-2::-2][::-1], prepend=0.0)
+        types[2:-1:2] = np.where(is_fuel, HOSSchedule.FUEL, HOSSchedule.BREAK)
+        durations[2:-1:2] = np.where(is_fuel, self.FUELING_DURATION, self.MINIMUM_BREAK_DURATION)
+        drive_positions[2:-1:2] = stop_positions
+        types[-1], durations[-1], drive_positions[-1] = HOSSchedule.DROPOFF, 1.0, drive_positions[-2]
+
+        # driving rows between two stops at the same point are dropped
+        keep = (types != HOSSchedule.DRIVING) | (durations > 0)
+        types, durations, drive_positions = types[keep], durations[keep], drive_positions[keep]
+        if total_drive_time > 0:
+            distances = drive_positions * (total_distance / total_drive_time)
+        else:
+            distances = np.zeros_like(drive_positions)
+        ends = np.cumsum(durations)
+
+        return HOSSchedule(types, ends - durations, ends, distances, total_distance)
+
+    @classmethod
+    def summarize_trips(cls, total_drive_times, total_distances, current_cycle_hours) -> Dict[str, np.ndarray]:
+        """Per-trip totals for many trips at once, without building any schedule.
+
+        Uses the same boundaries as calculate_schedule, so every value equals
+        what RoutePlanner.schedule reports for the trip on the basic ruleset:
+        'trip_hours' is when the dropoff ends, 'total_trip_duration' is
+        trip_duration of the schedule.
+        """
+        drive = np.asarray(total_drive_times, dtype=float)
+        distance = np.asarray(total_distances, dtype=float)
+        remaining = cls.MAX_CYCLE_HOURS - np.asarray(current_cycle_hours, dtype=float)
+
+        chunk = np.minimum(cls.REQUIRED_BREAK_AFTER, remaining)
+        chunk = np.where(chunk > 0, chunk, cls.REQUIRED_BREAK_AFTER)
+        driving = drive > 0
+        breaks = np.where(driving, np.ceil(drive / chunk) - 1, 0)
+        fuel_stops = np.where(driving & (distance > 0),
+                              np.ceil(distance / cls.MILES_PER_FUEL_STOP) - 1, 0)
+        drive = np.maximum(drive, 0)
+
+        return {
+            'breaks': breaks.astype(np.int64),
+            'fuel_stops': fuel_stops.astype(np.int64),
+            # pickup and dropoff take an hour each
+            'trip_hours': 2 + drive + breaks * cls.MINIMUM_BREAK_DURATION + fuel_stops * cls.FUELING_DURATION,
+            'total_trip_duration': 2 + drive + breaks,
+            'hos_compliance': drive <= remaining,
+        }
+
+    @staticmethod
+    def trip_duration(breaks: List[Dict]) -> float:
+        """Total trip duration of a schedule: hours driven, plus an hour per pickup, dropoff and break"""
+        driving = sum(b['end_time'] - b['start_time'] for b in breaks if b['type'] == 'driving')
+        return driving + len([b for b in breaks if b['type'] in ['pickup', 'dropoff', 'break']])
+
+    def calculate_breaks(self, total_drive_time: float, total_distance: float) -> List[Dict]:
+        breaks = self.calculate_schedule(total_drive_time, total_distance).to_dicts()
+
+        # fuel stop distribution, only walked when debug logging is on
+        if logger.isEnabledFor(logging.DEBUG):
+            for idx, break_info in enumerate(breaks):
+                if break_info['type'] == 'fuel':
+                    logger.debug("Fuel stop %d: at %.1f miles (%.1f%% of route)",
+                                 idx, break_info['distance_covered'], break_info['route_percentage'])
+
+        return breaks
+
+
+class HOSSchedule:
+    """Trip schedule as parallel NumPy columns, one row per activity"""
+    PICKUP, DRIVING, FUEL, BREAK, DROPOFF = range(5)
+    TYPE_NAMES = ('pickup', 'driving', 'fuel', 'break', 'dropoff')
+
+    def __init__(self, types: np.ndarray, start: np.ndarray, end: np.ndarray,
+                 distance: np.ndarray, total_distance: float):
+        self.types = types
+        self.start = start
+        self.end = end
+        self.distance = distance
+        self.total_distance = total_distance
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    @property
+    def duration(self) -> np.ndarray:
+        return self.end - self.start
+
+    @property
+    def total_duration(self) -> float:
+        return float(self.end[-1])
+
+    def count(self, type_code: int) -> int:
+        return int(np.count_nonzero(self.types == type_code))
+
+    def to_dicts(self) -> List[Dict]:
+        """Row-per-activity dicts in the shape calculate_breaks has always returned"""
+        rows = []
+        for type_code, start, end, distance in zip(self.types.tolist(), self.start.tolist(),
+                                                   self.end.tolist(), self.distance.tolist()):
+            row = {
+                'type': self.TYPE_NAMES[type_code],
+                'duration': end - start,
+                'start_time': start,
+                'end_time': end,
+                'distance_covered': distance
+            }
+            if type_code == self.FUEL:
+                row['route_percentage'] = (distance / self.total_distance) * 100  # Add percentage along route
+            rows.append(row)
+        return rows
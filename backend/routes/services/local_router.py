@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""local_router module"""
+
+import heapq
+import math
+import threading
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+from django.conf import settings
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from .geo import METERS_PER_MILE, haversine_miles
+from .polyline import encode_polyline, to_unit_vectors
+from .routing import RoutingProvider
+
+GRAPH_ARRAYS = ('node_coords', 'indptr', 'indices', 'lengths', 'durations')
+
+
+class LocalGraphRouter(RoutingProvider):
+    """Shortest-time routing over a road graph stored as CSR arrays.
+
+    The graph directory holds one .npy file per array, memory-mapped on load:
+    node_coords (N x 2 lat/lng), indptr (N + 1), and per edge indices
+    (target node), lengths (meters) and durations (seconds). Queries snap
+    each stop to its nearest node and run A* with a straight-line-at-top-speed
+    heuristic, which never overestimates so paths stay optimal. Duration
+    matrices run Dijkstra on a sparse matrix of the edge durations, built
+    once when the graph is loaded.
+    """
+
+    # consecutive edges are merged into steps of about this length, enough for
+    # the log generator to pick waypoints from
+    STEP_LENGTH = 50000  # meters
+
+    def __init__(self, node_coords: np.ndarray, indptr: np.ndarray, indices: np.ndarray,
+                 lengths: np.ndarray, durations: np.ndarray):
+        self.node_coords = node_coords
+        self.indptr = indptr
+        self.indices = indices
+        self.lengths = lengths
+        self.durations = durations
+        self.tree = cKDTree(to_unit_vectors(node_coords[:, 0], node_coords[:, 1]))
+
+        moving = durations > 0
+        self.max_speed = float(np.max(lengths[moving] / durations[moving])) if moving.any() else 1.0
+        # what get_duration_matrix runs Dijkstra on
+        self.duration_graph = self._duration_graph()
+
+    def _duration_graph(self) -> csr_matrix:
+        """Edge durations as a scipy sparse matrix, only the fastest of parallel edges kept"""
+        size = len(self.node_coords)
+        sources = np.repeat(np.arange(size), np.diff(self.indptr))
+        targets = np.asarray(self.indices)
+        durations = np.asarray(self.durations, dtype=np.float64)
+        # scipy would add up parallel edges
+        order = np.lexsort((durations, targets, sources))
+        sources, targets, durations = sources[order], targets[order], durations[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+        return csr_matrix((durations[first], (sources[first], targets[first])), shape=(size, size))
+
+    @classmethod
+    def from_edges(cls, node_coords, sources, targets, lengths, durations) -> 'LocalGraphRouter':
+        """Build the CSR arrays from an edge list"""
+        sources = np.asarray(sources, dtype=np.int64)
+        order = np.argsort(sources, kind='stable')
+        indptr = np.zeros(len(node_coords) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(node_coords)), out=indptr[1:])
+        return cls(
+            np.asarray(node_coords, dtype=np.float64),
+            indptr,
+            np.asarray(targets, dtype=np.int32)[order],
+            np.asarray(lengths, dtype=np.float32)[order],
+            np.asarray(durations, dtype=np.float32)[order],
+        )
+
+    @classmethod
+    def load(cls, path) -> 'LocalGraphRouter':
+        path = Path(path)
+        return cls(*(np.load(path / f"{name}.npy", mmap_mode='r') for name in GRAPH_ARRAYS))
+
+    def save(self, path) -> None:
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name in GRAPH_ARRAYS:
+            np.save(path / f"{name}.npy", np.asarray(getattr(self, name)))
+
+    def nearest_node(self, point: Dict) -> int:
+        _, node = self.tree.query(to_unit_vectors([point['lat']], [point['lng']])[0])
+        return int(node)
+
+    def _heuristic(self, node: int, target: int) -> float:
+        lat1, lng1 = self.node_coords[node]
+        lat2, lng2 = self.node_coords[target]
+        return haversine_miles(lat1, lng1, lat2, lng2) * METERS_PER_MILE / self.max_speed
+
+    def shortest_path(self, source: int, target: int) -> List[int]:
+        """Fastest node path from source to target (A* on edge durations)"""
+        best = {source: 0.0}
+        previous = {}
+        queue = [(self._heuristic(source, target), 0.0, source)]
+        closed = set()
+
+        while queue:
+            _, cost, node = heapq.heappop(queue)
+            if node == target:
+                path = [node]
+                while node in previous:
+                    node = previous[node]
+                    path.append(node)
+                return path[::-1]
+            if node in closed:
+                continue
+            closed.add(node)
+
+            start, end = self.indptr[node], self.indptr[node + 1]
+            for neighbour, duration in zip(self.indices[start:end].tolist(),
+                                           self.durations[start:end].tolist()):
+                new_cost = cost + duration
+                if new_cost < best.get(neighbour, math.inf):
+                    best[neighbour] = new_cost
+                    previous[neighbour] = node
+                    heapq.heappush(queue, (new_cost + self._heuristic(neighbour, target),
+                                           new_cost, neighbour))
+
+        raise ValueError("No route found")
+
+    def _edge(self, source: int, target: int) -> tuple:
+        """(length, duration) of the fastest edge between two adjacent nodes"""
+        start, end = self.indptr[source], self.indptr[source + 1]
+        candidates = np.flatnonzero(np.asarray(self.indices[start:end]) == target) + start
+        edge = candidates[np.argmin(np.asarray(self.durations)[candidates])]
+        return float(self.lengths[edge]), float(self.durations[edge])
+
+    def _location(self, node: int) -> Dict:
+        lat, lng = self.node_coords[node]
+        return {'lat': float(lat), 'lng': float(lng)}
+
+    def _steps(self, path: List[int]) -> List[Dict]:
+        steps = []
+        step_start, step_length, step_duration = path[0], 0.0, 0.0
+        last_edge = len(path) - 2
+        for i, (source, target) in enumerate(zip(path, path[1:])):
+            length, duration = self._edge(source, target)
+            step_length += length
+            step_duration += duration
+            if step_length >= self.STEP_LENGTH or i == last_edge:
+                steps.append({
+                    'distance': {'text': f"{step_length / METERS_PER_MILE:.1f} mi",
+                                 'value': int(round(step_length))},
+                    'duration': {'text': f"{round(step_duration / 60)} mins",
+                                 'value': int(round(step_duration))},
+                    'start_location': self._location(step_start),
+                    'end_location': self._location(target),
+                    'html_instructions': "",
+                    'travel_mode': 'DRIVING',
+                })
+                step_start, step_length, step_duration = target, 0.0, 0.0
+        return steps
+
+    def get_route_details(self, origin: Dict, destination: Dict,
+                          waypoints: List[Dict] = None) -> Dict[str, Any]:
+        try:
+            stops = [self.nearest_node(point) for point in [origin, *(waypoints or []), destination]]
+
+            path, steps, legs = [stops[0]], [], []
+            for source, target in zip(stops, stops[1:]):
+                leg_path = self.shortest_path(source, target)
+                path.extend(leg_path[1:])
+                leg_steps = self._steps(leg_path) if len(leg_path) > 1 else []
+                steps.extend(leg_steps)
+                legs.append({'distance': sum(step['distance']['value'] for step in leg_steps),
+                             'duration': sum(step['duration']['value'] for step in leg_steps)})
+
+            coords = np.asarray(self.node_coords[path])
+            return {
+                'distance': sum(leg['distance'] for leg in legs),  # in meters
+                'duration': sum(leg['duration'] for leg in legs),  # in seconds
+                'polyline': encode_polyline(coords),
+                'steps': steps,
+                'legs': legs,
+                'bounds': {
+                    'northeast': {'lat': float(coords[:, 0].max()), 'lng': float(coords[:, 1].max())},
+                    'southwest': {'lat': float(coords[:, 0].min()), 'lng': float(coords[:, 1].min())},
+                }
+            }
+        except Exception as e:
+            raise Exception(f"Error calculating route: {str(e)}")
+
+    def get_duration_matrix(self, points: List[Dict]) -> np.ndarray:
+        """Travel times between the points' nearest nodes, one Dijkstra run per point"""
+        nodes = [self.nearest_node(point) for point in points]
+        return dijkstra(self.duration_graph, indices=nodes)[:, nodes]
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_local_router() -> LocalGraphRouter:
+    """Process-wide router loaded from settings.ROAD_GRAPH_PATH on first use"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                if not settings.ROAD_GRAPH_PATH:
+                    raise ValueError("ROAD_GRAPH_PATH is not configured")
+                _router = LocalGraphRouter.load(settings.ROAD_GRAPH_PATH)
+    return _router
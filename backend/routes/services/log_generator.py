@@ -2,14 +2,28 @@
 """log_generator module"""
 
 
+from bisect import bisect_left
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import Iterator, List, Dict
+import logging
 import re   #this is regex btw
-import googlemaps
-from django.conf import settings
+import numpy as np
+from .concurrency import fan_out
+from .geocode_cache import geocode_cache
+from .maps_client import get_maps_client
+from .timing import count, stage
+
+logger = logging.getLogger(__name__)
 
 class LogSheetGenerator:
-    def __init__(self):
+    """Daily log sheets for a schedule of activities.
+
+    Places along the route are named by reverse geocoding. With
+    reverse_geocode=False (the local routing backend, which may run without
+    network access) only names already in the geocode cache are used.
+    """
+
+    def __init__(self, reverse_geocode: bool = True):
         self.STATUS_CODES = {
             'driving': 'D',
             'break': 'SB',
@@ -18,7 +32,44 @@ class LogSheetGenerator:
             'off_duty': 'OFF',
             'fuel': 'ON'
         }
-        self.maps_client = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
+        self.STOP_DESCRIPTIONS = {
+            'break': 'Rest Stop',
+            'fuel': 'Refueling',
+            'off_duty': 'Off duty'
+        }
+        self.reverse_geocode = reverse_geocode
+        self.geocode_cache = geocode_cache
+
+    @property
+    def maps_client(self):
+        return get_maps_client()
+
+    def resolve_locality(self, lat: float, lng: float) -> str:
+        """Locality name ("City, ST") for a point, served from the geocode cache when a nearby point is known"""
+        name = self.geocode_cache.lookup(lat, lng)
+        if name is not None:
+            count('cache_hit.geocode')
+            return name
+        if not self.reverse_geocode:
+            return ""
+
+        count('cache_miss.geocode')
+        count('upstream.geocode')
+        with stage('geocode'):
+            result = self.maps_client.reverse_geocode((lat, lng))[0]
+
+        locality = ""
+        state = ""
+        for component in result['address_components']:
+            if 'locality' in component['types']:
+                locality = component['long_name']
+            elif 'administrative_area_level_1' in component['types']:
+                state = component['short_name']
+
+        # points without a locality are cached too, as an empty name
+        name = f"{locality}, {state}" if locality and state else ""
+        self.geocode_cache.add(lat, lng, name)
+        return name
 
     def extract_route_waypoints(self, route_info: Dict) -> List[Dict]:
         """Extract meaningful waypoints from the route with proper distances"""
@@ -31,34 +82,29 @@ class LogSheetGenerator:
             'distance': 0
         })
 
-        # Process steps directly from route_details
+        # Process steps directly from route_details, only significant points
+        # (steps with substantial distance) are geocoded
+        significant_steps = []
         for step in route_info['route_details']['steps']:
             total_distance += step['distance']['value']
-            
-            # Only add significant points (steps with substantial distance)
             if step['distance']['value'] > 50000:  # More than 50km
-                try:
-                    result = self.maps_client.reverse_geocode((
-                        step['end_location']['lat'],
-                        step['end_location']['lng']
-                    ))[0]
-                    
-                    locality = ""
-                    state = ""
-                    for component in result['address_components']:
-                        if 'locality' in component['types']:
-                            locality = component['long_name']
-                        elif 'administrative_area_level_1' in component['types']:
-                            state = component['short_name']
-                    
-                    if locality and state:
-                        waypoints.append({
-                            'name': f"{locality}, {state}",
-                            'distance': round(total_distance / 1609.34, 1)  # Convert to miles
-                        })
-                except Exception as e:
-                    print(f"Error in geocoding: {str(e)}")
-                    continue
+                significant_steps.append((step['end_location'], total_distance))
+
+        def log_error(item, error):
+            logger.warning("Error in geocoding %s: %s", item[0], error)
+
+        # all lookups run concurrently, failed ones come back as None
+        names = fan_out(
+            lambda item: self.resolve_locality(item[0]['lat'], item[0]['lng']),
+            significant_steps,
+            on_error=log_error
+        )
+        for (location, distance), name in zip(significant_steps, names):
+            if name:
+                waypoints.append({
+                    'name': name,
+                    'distance': round(distance / 1609.34, 1)  # Convert to miles
+                })
 
         # Add destination point
         waypoints.append({
@@ -70,54 +116,99 @@ class LogSheetGenerator:
 
     def get_location_at_progress(self, progress_miles: float, waypoints: List[Dict]) -> Dict:
         """Get current and next location based on distance traveled"""
-        for i in range(len(waypoints) - 1):
-            current = waypoints[i]
-            next_point = waypoints[i + 1]
-            
-            if progress_miles >= current['distance'] and progress_miles <= next_point['distance']:
-                return {
-                    'current': current,
-                    'next': next_point
-                }
-        return None
+        waypoint_miles = [waypoint['distance'] for waypoint in waypoints]
+        if len(waypoints) < 2 or not waypoint_miles[0] <= progress_miles <= waypoint_miles[-1]:
+            return None
+
+        # first segment whose end is at or past the progress point
+        index = max(bisect_left(waypoint_miles, progress_miles) - 1, 0)
+        return {
+            'current': waypoints[index],
+            'next': waypoints[index + 1]
+        }
+
+    def describe_activities(self, breaks: List[Dict], route_info: Dict, waypoints: List[Dict]) -> List[str]:
+        """Location descriptions for every activity, computed in one pass.
+
+        Waypoint distances are sorted, so the segment each activity falls in
+        is found with a single searchsorted over all activities instead of a
+        scan of the waypoints per activity.
+        """
+        main_stops = {
+            'pickup': (route_info['locations']['pickup'], "Pickup"),
+            'dropoff': (route_info['locations']['dropoff'], "Dropoff"),
+        }
+
+        # Calculate progress: the miles driven when each activity starts,
+        # i.e. where the previous one ended
+        covered = np.array([activity['distance_covered'] for activity in breaks], dtype=float)
+        progress = np.concatenate(([0.0], covered[:-1])) if len(covered) else covered
+
+        waypoint_miles = np.array([waypoint['distance'] for waypoint in waypoints], dtype=float)
+        if len(waypoints) >= 2:
+            segments = np.maximum(np.searchsorted(waypoint_miles, progress, side='left') - 1, 0)
+            located = (progress >= waypoint_miles[0]) & (progress <= waypoint_miles[-1])
+        else:
+            segments = np.zeros(len(breaks), dtype=int)
+            located = np.zeros(len(breaks), dtype=bool)
+
+        descriptions = []
+        driving = {}  # segment -> description, shared by every drive in it
+        for activity, segment, is_located, progress_miles in zip(
+                breaks, segments.tolist(), located.tolist(), progress.tolist()):
+            activity_type = activity['type']
+            if activity_type in main_stops:
+                main_stop, label = main_stops[activity_type]
+                location = activity.get('location')
+                if activity.get('address'):
+                    # multi-stop trips name each of their stops
+                    descriptions.append(f"{label} at {activity['address']}")
+                elif location is None or self.is_same_point(location, main_stop):
+                    descriptions.append(f"{label} at {main_stop.get('address')}")
+                elif is_located and waypoints[segment]['name']:
+                    descriptions.append(
+                        f"{label} stop near {waypoints[segment]['name']} "
+                        f"({round(progress_miles, 1)} miles from start)"
+                    )
+                else:
+                    descriptions.append(f"{label} stop at {location['lat']:.4f}, {location['lng']:.4f}")
+            elif not is_located:
+                descriptions.append("En Route")
+            elif activity_type == 'driving':
+                if segment not in driving:
+                    driving[segment] = f"Driving from {waypoints[segment]['name']} to {waypoints[segment + 1]['name']}"
+                descriptions.append(driving[segment])
+            elif activity_type in self.STOP_DESCRIPTIONS:
+                descriptions.append(
+                    f"{self.STOP_DESCRIPTIONS[activity_type]} near {waypoints[segment]['name']} "
+                    f"({round(progress_miles, 1)} miles from start)"
+                )
+            else:
+                descriptions.append("En Route")
+        return descriptions
+
+    @staticmethod
+    def is_same_point(a: Dict, b: Dict) -> bool:
+        return abs(a['lat'] - b['lat']) < 1e-6 and abs(a['lng'] - b['lng']) < 1e-6
 
     def get_location_description(self, activity: Dict, route_info: Dict, waypoints: List[Dict]) -> str:
         """Generate meaningful location descriptions based on activity type and progress"""
-        if activity['type'] == 'pickup':
-            return f"Pickup at {route_info['locations']['pickup'].get('address')}"
-        elif activity['type'] == 'dropoff':
-            return f"Dropoff at {route_info['locations']['dropoff'].get('address')}"
+        return self.describe_activities([activity], route_info, waypoints)[0]
 
-        total_duration = route_info['route_details']['duration']
-        total_distance = route_info['route_details']['distance'] / 1609.34  # Convert to miles
-        
-        # Calculate progress
-        progress_miles = (activity['start_time'] * 3600 / total_duration) * total_distance
-        location_info = self.get_location_at_progress(progress_miles, waypoints)
-        
-        if not location_info:
-            return "En Route"
-
-        if activity['type'] == 'driving':
-            return f"Driving from {location_info['current']['name']} to {location_info['next']['name']}"
-        elif activity['type'] == 'break':
-            return f"Rest Stop near {location_info['current']['name']} ({round(progress_miles, 1)} miles from start)"
-        elif activity['type'] == 'fuel':
-            return f"Refueling near {location_info['current']['name']} ({round(progress_miles, 1)} miles from start)"
-        
-        return "En Route"
-
-    def generate_daily_logs(self, breaks: List[Dict], start_time: datetime, route_info: Dict) -> List[Dict]:
+    def iter_daily_logs(self, breaks: List[Dict], start_time: datetime, route_info: Dict) -> Iterator[Dict]:
+        """Yield each day's log as soon as its last activity is placed"""
         # Extract waypoints from the actual route
         waypoints = self.extract_route_waypoints(route_info)
         
-        daily_logs = []
+        descriptions = self.describe_activities(breaks, route_info, waypoints)
+        
         current_time = start_time
         current_day_activities = []
         
-        for activity in breaks:
+        for activity, location in zip(breaks, descriptions):
             activity_start = current_time + timedelta(hours=activity['start_time'])
             activity_end = current_time + timedelta(hours=activity['end_time'])
+            split = False
             
             while activity_start.date() != activity_end.date():
                 midnight = activity_start.replace(hour=0, minute=0, second=0) + timedelta(days=1)
@@ -128,31 +219,35 @@ class LogSheetGenerator:
                     'start_time': activity_start.strftime('%H:%M'),
                     'end_time': '24:00',
                     'duration': duration_until_midnight,
-                    'location': self.get_location_description(activity, route_info, waypoints)
+                    'location': location
                 })
                 
-                daily_logs.append({
+                # the day is complete, hand it over and start a fresh list
+                yield {
                     'date': activity_start.strftime('%Y-%m-%d'),
-                    'activities': current_day_activities.copy(),
+                    'activities': current_day_activities,
                     'total_hours': sum(a['duration'] for a in current_day_activities)
-                })
+                }
                 
                 current_day_activities = []
                 activity_start = midnight
+                split = True
                 
             current_day_activities.append({
                 'status': self.STATUS_CODES[activity['type']],
                 'start_time': activity_start.strftime('%H:%M'),
                 'end_time': activity_end.strftime('%H:%M'),
-                'duration': activity['duration'],
-                'location': self.get_location_description(activity, route_info, waypoints)
+                # only the part after the last midnight counts for this day
+                'duration': (activity_end - activity_start).total_seconds() / 3600 if split else activity['duration'],
+                'location': location
             })
             
-            if activity == breaks[-1]:
-                daily_logs.append({
-                    'date': activity_start.strftime('%Y-%m-%d'),
-                    'activities': current_day_activities.copy(),
-                    'total_hours': sum(a['duration'] for a in current_day_activities)
-                })
-                
-        return daily_logs
\ No newline at end of file
+        if current_day_activities:
+            yield {
+                'date': activity_start.strftime('%Y-%m-%d'),
+                'activities': current_day_activities,
+                'total_hours': sum(a['duration'] for a in current_day_activities)
+            }
+
+    def generate_daily_logs(self, breaks: List[Dict], start_time: datetime, route_info: Dict) -> List[Dict]:
+        return list(self.iter_daily_logs(breaks, start_time, route_info))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""maps_client module"""
+
+import threading
+
+import googlemaps
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _build_session() -> requests.Session:
+    """Keep-alive session with a bounded connection pool, retrying failed connections.
+
+    Only connecting is retried here: error statuses are retried by
+    googlemaps.Client itself (within GOOGLE_MAPS_RETRY_TIMEOUT), and a read
+    that timed out is not sent again, so one call never runs much longer
+    than UPSTREAM_CALL_TIMEOUT per attempt.
+    """
+    retry = Retry(
+        total=settings.GOOGLE_MAPS_MAX_RETRIES,
+        connect=settings.GOOGLE_MAPS_MAX_RETRIES,
+        read=0,
+        status=0,
+        backoff_factor=settings.GOOGLE_MAPS_RETRY_BACKOFF,
+        allowed_methods=('GET',)
+    )
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=settings.GOOGLE_MAPS_POOL_SIZE,
+        pool_block=True,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    return session
+
+
+def get_maps_client() -> googlemaps.Client:
+    """Process-wide googlemaps client, created on first use.
+
+    Every service shares it, so TLS connections to the Google APIs are
+    reused across requests instead of being opened per request. The
+    connection pool holds GOOGLE_MAPS_POOL_SIZE connections; callers beyond
+    that wait for a free one. The client's rate limit of
+    GOOGLE_MAPS_QUERIES_PER_SECOND applies to the whole process.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = googlemaps.Client(
+                    key=settings.GOOGLE_MAPS_API_KEY,
+                    timeout=settings.UPSTREAM_CALL_TIMEOUT,
+                    retry_timeout=settings.GOOGLE_MAPS_RETRY_TIMEOUT,
+                    queries_per_second=settings.GOOGLE_MAPS_QUERIES_PER_SECOND,
+                    requests_session=_build_session()
+                )
+    return _client
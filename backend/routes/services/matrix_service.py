@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""matrix_service module"""
+
+import datetime
+import math
+from typing import Dict, List
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from ..models import MatrixCell
+from .cache_service import LRUCache, round_coordinate
+from .concurrency import fan_out
+from .maps_client import get_maps_client
+from .timing import count, stage
+
+# Distance Matrix API limits per request
+MAX_ORIGINS = 25
+MAX_DESTINATIONS = 25
+MAX_ELEMENTS = 100
+
+# in front of the MatrixCell table: (origin, destination) -> (seconds, meters),
+# both inf when there is no driving route between them
+matrix_cell_cache = LRUCache(max_size=settings.MATRIX_CACHE_SIZE, ttl=settings.MATRIX_CACHE_TTL)
+
+
+def matrix_to_json(matrix: np.ndarray) -> List[List]:
+    """Whole seconds/meters per cell, None where there is no route"""
+    return [[None if math.isinf(value) else int(round(value)) for value in row] for row in matrix.tolist()]
+
+
+class MatrixService:
+    """Driving time and distance matrices from the Distance Matrix API.
+
+    Points are rounded to COORDINATE_CACHE_PRECISION and deduplicated, and
+    every cell is stored on its own (an in-process LRU in front of the
+    MatrixCell table), so a matrix over points seen before, a sub-matrix of an
+    earlier one included, costs no API calls. Only the missing cells are
+    requested: origins missing the same destinations are grouped and split
+    into blocks as large as the API allows, fetched side by side on the
+    upstream pool. The table is read and written in bulk.
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+        self.cache = matrix_cell_cache
+
+    @property
+    def client(self):
+        # matrices answered from the cells never create the Google client
+        if self._client is None:
+            self._client = get_maps_client()
+        return self._client
+
+    def get_matrix(self, origins: List[Dict], destinations: List[Dict]) -> Dict[str, np.ndarray]:
+        """{'duration': seconds, 'distance': meters}, origins x destinations, inf where there is no route"""
+        precision = settings.COORDINATE_CACHE_PRECISION
+        origin_points = [round_coordinate(point, precision) for point in origins]
+        destination_points = [round_coordinate(point, precision) for point in destinations]
+        unique_origins = list(dict.fromkeys(origin_points))
+        unique_destinations = list(dict.fromkeys(destination_points))
+
+        origin_keys = [f"{lat},{lng}" for lat, lng in unique_origins]
+        destination_keys = [f"{lat},{lng}" for lat, lng in unique_destinations]
+
+        shape = (len(unique_origins), len(unique_destinations))
+        durations = np.full(shape, np.inf)
+        distances = np.full(shape, np.inf)
+        missing = np.zeros(shape, dtype=bool)
+        for i, origin in enumerate(origin_keys):
+            for j, destination in enumerate(destination_keys):
+                cell = self.cache.get((origin, destination))
+                if cell is None:
+                    missing[i, j] = True
+                else:
+                    durations[i, j], distances[i, j] = cell
+        if missing.any():
+            self._load(origin_keys, destination_keys, missing, durations, distances)
+
+        missed = int(missing.sum())
+        count('cache_hit.distance_matrix', missing.size - missed)
+        count('cache_miss.distance_matrix', missed)
+        if missed:
+            self._fetch(origin_keys, destination_keys, missing, durations, distances)
+
+        origin_index = self._index(unique_origins, origin_points)
+        destination_index = self._index(unique_destinations, destination_points)
+        rows, cols = np.ix_(origin_index, destination_index)
+        return {'duration': durations[rows, cols], 'distance': distances[rows, cols]}
+
+    @staticmethod
+    def _index(unique: List[tuple], points: List[tuple]) -> List[int]:
+        position = {point: i for i, point in enumerate(unique)}
+        return [position[point] for point in points]
+
+    @staticmethod
+    def _blocks(missing: np.ndarray) -> List[tuple]:
+        """(rows, cols) index arrays covering the missing cells, each within the request limits"""
+        blocks = []
+        rows_missing = np.flatnonzero(missing.any(axis=1))
+        patterns, group = np.unique(missing[rows_missing], axis=0, return_inverse=True)
+        for pattern_index, pattern in enumerate(patterns):
+            rows = rows_missing[np.asarray(group).reshape(-1) == pattern_index]
+            cols = np.flatnonzero(pattern)
+            col_size = min(len(cols), MAX_DESTINATIONS)
+            row_size = max(1, min(MAX_ORIGINS, MAX_ELEMENTS // col_size))
+            for row_start in range(0, len(rows), row_size):
+                for col_start in range(0, len(cols), col_size):
+                    blocks.append((rows[row_start:row_start + row_size], cols[col_start:col_start + col_size]))
+        return blocks
+
+    def _load(self, origins: List[str], destinations: List[str], missing: np.ndarray,
+              durations: np.ndarray, distances: np.ndarray) -> None:
+        """Fill in the missing cells the MatrixCell table has, unmarking them in `missing`"""
+        rows = {origin: i for i, origin in enumerate(origins) if missing[i].any()}
+        cols = {destination: j for j, destination in enumerate(destinations) if missing[:, j].any()}
+        fresh_after = timezone.now() - datetime.timedelta(seconds=settings.MATRIX_CACHE_TTL)
+        stored = MatrixCell.objects.filter(
+            origin__in=list(rows), destination__in=list(cols), updated_at__gte=fresh_after
+        ).values_list('origin', 'destination', 'duration', 'distance')
+
+        for origin, destination, duration, distance in stored.iterator():
+            i, j = rows[origin], cols[destination]
+            if not missing[i, j]:
+                continue
+            cell = (np.inf if duration is None else duration, np.inf if distance is None else distance)
+            durations[i, j], distances[i, j] = cell
+            missing[i, j] = False
+            self.cache.set((origin, destination), cell)
+
+    def _fetch(self, origins: List[str], destinations: List[str], missing: np.ndarray,
+               durations: np.ndarray, distances: np.ndarray) -> None:
+        """Request the missing cells, fill them in and store them"""
+        blocks = self._blocks(missing)
+
+        def fetch(block):
+            rows, cols = block
+            count('upstream.distance_matrix')
+            with stage('distance_matrix'):
+                return self.client.distance_matrix(
+                    origins=[origins[i] for i in rows.tolist()],
+                    destinations=[destinations[j] for j in cols.tolist()],
+                    mode='driving'
+                )
+
+        errors = []
+        # the batch timeout is per wave of calls the pool runs at once
+        waves = math.ceil(len(blocks) / settings.UPSTREAM_MAX_CONCURRENCY)
+        responses = fan_out(fetch, blocks, timeout=settings.UPSTREAM_BATCH_TIMEOUT * waves,
+                            on_error=lambda block, exc: errors.append(exc))
+
+        fetched = []
+        for (rows, cols), response in zip(blocks, responses):
+            if response is None:
+                continue
+            for i, row in zip(rows.tolist(), response['rows']):
+                for j, element in zip(cols.tolist(), row['elements']):
+                    duration = distance = None
+                    if element.get('status') == 'OK':
+                        duration, distance = element['duration']['value'], element['distance']['value']
+                        durations[i, j], distances[i, j] = duration, distance
+                    self.cache.set((origins[i], destinations[j]), (durations[i, j], distances[i, j]))
+                    fetched.append(MatrixCell(origin=origins[i], destination=destinations[j],
+                                              duration=duration, distance=distance))
+        # keep what did come back even if some blocks failed
+        if fetched:
+            MatrixCell.objects.bulk_create(
+                fetched, batch_size=1000, update_conflicts=True,
+                unique_fields=['origin', 'destination'],
+                update_fields=['duration', 'distance', 'updated_at']
+            )
+
+        if errors:
+            raise errors[0]
+        if len(fetched) < int(missing.sum()):
+            raise ValueError("Distance Matrix request timed out")
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""plan_format module"""
+
+from typing import Any, Dict, Iterable, Optional
+
+
+def compact_step(step: Dict) -> Dict[str, Any]:
+    """A route step cut down to what the clients and log sheets use:
+    distance (meters), duration (seconds) and its end points
+    """
+    return {
+        'distance': step['distance']['value'],
+        'duration': step['duration']['value'],
+        'start_location': step['start_location'],
+        'end_location': step['end_location'],
+    }
+
+
+def compact_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """The plan without the raw Google step payloads (HTML instructions, per-step polylines)"""
+    if 'steps' not in plan:
+        return plan
+    return {**plan, 'steps': [compact_step(step) for step in plan['steps']]}
+
+
+def parse_fields(value: Optional[str]) -> Optional[Iterable[str]]:
+    """'breaks, log_sheets' -> ['breaks', 'log_sheets'], None when not given"""
+    if not value:
+        return None
+    return [field.strip() for field in value.split(',') if field.strip()]
+
+
+def project_fields(plan: Dict[str, Any], fields: Optional[Iterable[str]]) -> Dict[str, Any]:
+    """Only the requested top-level fields of the plan (unknown names are ignored)"""
+    if fields is None:
+        return plan
+    return {field: plan[field] for field in fields if field in plan}
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""plan_store module"""
+
+import datetime
+import hashlib
+import json
+import zlib
+from typing import Any, Dict, Optional
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from ..models import Route
+
+# kept in their own columns, everything else of the plan goes in the blob
+COLUMN_FIELDS = ('polyline', 'total_trip_duration', 'fuel_stops')
+
+
+def encode_plan(plan: Dict[str, Any]) -> bytes:
+    payload = {key: value for key, value in plan.items() if key not in COLUMN_FIELDS}
+    return zlib.compress(
+        json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8')
+    )
+
+
+def plan_etag(blob: bytes, plan: Dict[str, Any]) -> str:
+    """Hash of the blob and the column fields, so a change to either gets a new ETag"""
+    digest = hashlib.sha1(blob)
+    columns = [plan.get(key) for key in COLUMN_FIELDS]
+    digest.update(json.dumps(columns, cls=DjangoJSONEncoder).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def decode_plan(route: Route) -> Dict[str, Any]:
+    """The plan as calculate-route returned it, plus its route_id"""
+    plan = json.loads(zlib.decompress(route.plan_blob)) if route.plan_blob else {}
+    plan.update({
+        'route_id': route.id,
+        'polyline': route.route_polyline,
+        'total_trip_duration': route.estimated_duration,
+        'fuel_stops': route.stops or [],
+    })
+    return plan
+
+
+def save_plan(data: Dict, plan: Dict[str, Any], input_hash: str) -> Route:
+    blob = encode_plan(plan)
+    return Route.objects.create(
+        current_location=data['current_location'],
+        pickup_location=data['pickup_location'],
+        dropoff_location=data['dropoff_location'],
+        current_cycle_hours=data['current_cycle_hours'],
+        estimated_duration=plan.get('total_trip_duration'),
+        route_polyline=plan.get('polyline'),
+        stops=plan.get('fuel_stops'),
+        input_hash=input_hash,
+        plan_blob=blob,
+        plan_etag=plan_etag(blob, plan)
+    )
+
+
+def find_plan(input_hash: str, max_age: float) -> Optional[Route]:
+    """The newest plan saved for this input in the last `max_age` seconds, if any"""
+    if max_age <= 0:
+        return None
+    saved_after = timezone.now() - datetime.timedelta(seconds=max_age)
+    return Route.objects.filter(
+        input_hash=input_hash, created_at__gte=saved_after, plan_blob__isnull=False
+    ).order_by('-created_at').first()
+
+
+class PlanChangedError(Exception):
+    """The stored plan was changed by someone else after it was read"""
+
+
+def decode_timeline(route: Route) -> Optional[Dict[str, Any]]:
+    """The saved DutyTimeline.checkpoint_state, None if no re-plan saved one"""
+    return json.loads(zlib.decompress(route.duty_timeline)) if route.duty_timeline else None
+
+
+def update_plan(route: Route, plan: Dict[str, Any], timeline: Optional[Dict[str, Any]] = None) -> Route:
+    """Store a changed plan (e.g. re-planned from a GPS ping), with a new ETag.
+
+    The route no longer answers its input, so its input_hash is cleared and
+    find_plan won't hand it out for a new request. `timeline` replaces the
+    saved checkpoint state when given.
+
+    Only saved if the stored plan still has the ETag route was read with,
+    PlanChangedError otherwise, so concurrent updates can't overwrite each
+    other.
+    """
+    blob = encode_plan({key: value for key, value in plan.items() if key != 'route_id'})
+    fields = {
+        'plan_blob': blob,
+        'plan_etag': plan_etag(blob, plan),
+        'estimated_duration': plan.get('total_trip_duration'),
+        'input_hash': None,
+    }
+    if timeline is not None:
+        fields['duty_timeline'] = zlib.compress(json.dumps(timeline, separators=(',', ':')).encode('utf-8'))
+
+    if not Route.objects.filter(pk=route.pk, plan_etag=route.plan_etag).update(**fields):
+        raise PlanChangedError(f"Route {route.pk} was updated since it was read")
+    for name, value in fields.items():
+        setattr(route, name, value)
+    return route
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""polyline module"""
+
+import math
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+from .geo import EARTH_RADIUS_MILES, MILES_PER_DEGREE_LAT
+
+# web map tiles are 256 px wide, at zoom 0 one tile spans the equator
+MILES_PER_PIXEL_AT_ZOOM_0 = 2 * math.pi * EARTH_RADIUS_MILES / 256
+MAX_ZOOM = 22
+
+
+def decode_polyline(encoded: str) -> np.ndarray:
+    """Decode a Google encoded polyline into an (N, 2) array of lat/lng degrees"""
+    if not encoded:
+        return np.empty((0, 2))
+
+    chunks = np.frombuffer(encoded.encode('ascii'), dtype=np.uint8).astype(np.int64) - 63
+    # every value is a run of 5-bit chunks, the last one has the 0x20 bit clear
+    is_last = chunks < 0x20
+    value_ends = np.flatnonzero(is_last)
+    value_starts = np.concatenate(([0], value_ends[:-1] + 1))
+    position = np.arange(len(chunks)) - np.repeat(value_starts, value_ends - value_starts + 1)
+    values = np.add.reduceat((chunks & 0x1f) << (5 * position), value_starts)
+
+    # zigzag decode, then undo the delta encoding of lat and lng separately
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+    return np.cumsum(deltas.reshape(-1, 2), axis=0) * 1e-5
+
+
+def encode_polyline(coords) -> str:
+    """Encode an (N, 2) array of lat/lng degrees as a Google encoded polyline"""
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    if len(coords) == 0:
+        return ''
+
+    points = np.round(coords * 1e5).astype(np.int64)
+    deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    # split every value into 5-bit chunks, all but the last get the 0x20 bit
+    shifts = 5 * np.arange(7)
+    chunks = (values[:, None] >> shifts) & 0x1f
+    chunk_counts = 1 + ((values[:, None] >> shifts[1:]) > 0).sum(axis=1)
+    position = np.arange(len(shifts))
+    chunks |= np.where(position < chunk_counts[:, None] - 1, 0x20, 0)
+    used = position < chunk_counts[:, None]
+    return (chunks[used] + 63).astype(np.uint8).tobytes().decode('ascii')
+
+
+def haversine_miles_array(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Vectorized great-circle distance in miles"""
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def to_unit_vectors(lat, lng) -> np.ndarray:
+    """Points on the unit sphere, so straight-line (KD-tree) distance tracks great-circle distance"""
+    lat, lng = np.radians(lat), np.radians(lng)
+    return np.column_stack((np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)))
+
+
+def cumulative_miles(coords: np.ndarray) -> np.ndarray:
+    """Distance from the first point to every point of the line, in miles"""
+    if len(coords) == 0:
+        return np.empty(0)
+    segments = haversine_miles_array(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1])
+    return np.concatenate(([0.0], np.cumsum(segments)))
+
+
+def _project_miles(coords: np.ndarray) -> np.ndarray:
+    """Equirectangular x/y in miles around the line's mean latitude, fine at route scale"""
+    scale = math.cos(math.radians(float(np.mean(coords[:, 0]))))
+    return np.column_stack((coords[:, 1] * scale, coords[:, 0])) * MILES_PER_DEGREE_LAT
+
+
+def _segment_distances(points: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """Distance from every point to the start-end segment"""
+    direction = end - start
+    length_sq = float(direction @ direction)
+    if length_sq > 0:
+        t = np.clip((points - start) @ direction / length_sq, 0, 1)
+    else:
+        t = np.zeros(len(points))
+    return np.linalg.norm(points - (start + t[:, None] * direction), axis=1)
+
+
+def douglas_peucker_significance(coords: np.ndarray) -> np.ndarray:
+    """Largest Douglas-Peucker tolerance (miles) each vertex survives.
+
+    Running the recursion once with a zero tolerance and recording every
+    split distance (capped by its parent's, so it never grows deeper in the
+    recursion) gives a ranking of the vertices: the simplification at
+    tolerance t is the vertices whose significance is above t, so any
+    level of detail is a single comparison afterwards. Endpoints are inf.
+    """
+    count = len(coords)
+    significance = np.zeros(count)
+    if count == 0:
+        return significance
+    significance[[0, -1]] = np.inf
+
+    xy = _project_miles(coords)
+    stack = [(0, count - 1, np.inf)]
+    while stack:
+        first, last, parent = stack.pop()
+        if last - first < 2:
+            continue
+        distances = _segment_distances(xy[first + 1:last], xy[first], xy[last])
+        index = int(np.argmax(distances))
+        split = first + 1 + index
+        significance[split] = min(float(distances[index]), parent)
+        stack.append((first, split, significance[split]))
+        stack.append((split, last, significance[split]))
+    return significance
+
+
+def tolerance_for_zoom(zoom: float, latitude: float = 0.0, pixels: float = 1.0) -> float:
+    """Miles covered by `pixels` screen pixels at a web map zoom level"""
+    return MILES_PER_PIXEL_AT_ZOOM_0 * math.cos(math.radians(latitude)) / 2 ** zoom * pixels
+
+
+def simplify_polyline(encoded: str, zoom: float) -> str:
+    """Re-encode a polyline with only the detail visible at the given zoom"""
+    return RouteGeometry.from_polyline(encoded).encoded(zoom=zoom)
+
+
+class RouteGeometry:
+    """Decoded route line with its cumulative distance, built once per route"""
+
+    def __init__(self, coords: np.ndarray):
+        self.coords = coords
+        self.cumulative_miles = cumulative_miles(coords)
+        self._significance = None
+
+    @classmethod
+    def from_polyline(cls, encoded: str) -> 'RouteGeometry':
+        return cls(decode_polyline(encoded))
+
+    @property
+    def length_miles(self) -> float:
+        return float(self.cumulative_miles[-1]) if len(self.cumulative_miles) else 0.0
+
+    def point_at(self, miles: Union[float, np.ndarray]) -> np.ndarray:
+        """Interpolated lat/lng at the given distance(s) along the line"""
+        miles = np.clip(np.asarray(miles, dtype=float), 0, self.length_miles)
+        if len(self.coords) < 2:
+            return np.broadcast_to(self.coords[0], miles.shape + (2,)).copy()
+
+        index = np.clip(np.searchsorted(self.cumulative_miles, miles, side='right') - 1,
+                        0, len(self.coords) - 2)
+        start = self.cumulative_miles[index]
+        span = self.cumulative_miles[index + 1] - start
+        ratio = np.divide(miles - start, span, out=np.zeros_like(miles), where=span > 0)
+        return self.coords[index] + (self.coords[index + 1] - self.coords[index]) * ratio[..., None]
+
+    def locate(self, lat: float, lng: float) -> Tuple[float, float]:
+        """(miles along the line, miles off it) of the line's closest point to lat/lng"""
+        if len(self.coords) < 2:
+            if len(self.coords) == 0:
+                return 0.0, math.inf
+            return 0.0, float(haversine_miles_array(lat, lng, *self.coords[0]))
+
+        xy = _project_miles(np.vstack((self.coords, [[lat, lng]])))
+        line, point = xy[:-1], xy[-1]
+        start, direction = line[:-1], np.diff(line, axis=0)
+        length_sq = np.einsum('ij,ij->i', direction, direction)
+        t = np.divide(np.einsum('ij,ij->i', point - start, direction), length_sq,
+                      out=np.zeros(len(start)), where=length_sq > 0).clip(0, 1)
+        off_route = np.linalg.norm(start + t[:, None] * direction - point, axis=1)
+        segment = int(np.argmin(off_route))
+        along = self.cumulative_miles[segment] + t[segment] * (
+            self.cumulative_miles[segment + 1] - self.cumulative_miles[segment])
+        return float(along), float(off_route[segment])
+
+    def point_at_fraction(self, fraction: Union[float, np.ndarray]) -> np.ndarray:
+        """Interpolated lat/lng at the given fraction(s) of the route length"""
+        return self.point_at(np.asarray(fraction, dtype=float) * self.length_miles)
+
+    @property
+    def significance(self) -> np.ndarray:
+        """Per-vertex Douglas-Peucker significance, computed on first use"""
+        if self._significance is None:
+            self._significance = douglas_peucker_significance(self.coords)
+        return self._significance
+
+    def simplify(self, tolerance_miles: float) -> np.ndarray:
+        """The line's vertices kept by Douglas-Peucker at this tolerance"""
+        return self.coords[self.significance > tolerance_miles]
+
+    def simplify_for_zoom(self, zoom: float) -> np.ndarray:
+        """The line with about one pixel of error at this web map zoom level"""
+        if len(self.coords) == 0:
+            return self.coords
+        latitude = float(np.mean(self.coords[:, 0]))
+        return self.simplify(tolerance_for_zoom(zoom, latitude))
+
+    def encoded(self, zoom: Optional[float] = None) -> str:
+        """Encoded polyline, simplified for the zoom level when one is given"""
+        return encode_polyline(self.coords if zoom is None else self.simplify_for_zoom(zoom))
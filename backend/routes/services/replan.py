@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""replan module"""
+
+import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from ..models import Route
+from .geo import METERS_PER_MILE
+from .hos_rules import BasicDutyTimeline, DutyTimeline
+from .hos_service import HOSCalculator
+from .log_generator import LogSheetGenerator
+from .plan_store import decode_plan, decode_timeline, update_plan
+from .polyline import RouteGeometry
+from .route_planner import RoutePlanner
+from .timing import stage
+
+# how far the projected position may be past a stop and still count as there
+STOP_TOLERANCE_MILES = 0.5
+
+
+class OffRouteError(ValueError):
+    """The truck is too far from the stored route for its plan to be updated"""
+
+
+def plan_start_time(plan: Dict) -> datetime.datetime:
+    """When the schedule's hour 0 is, from the first log entry for plans saved without 'start_time'"""
+    if plan.get('start_time'):
+        return datetime.datetime.fromisoformat(plan['start_time'])
+    first_day = plan['log_sheets'][0]
+    return datetime.datetime.strptime(
+        f"{first_day['date']} {first_day['activities'][0]['start_time']}", '%Y-%m-%d %H:%M'
+    )
+
+
+def remaining_route(plan: Dict, covered_meters: float, stops_done: int) -> Dict[str, Any]:
+    """Route details (distance, duration and for multi-stop trips legs and stops) of what is still ahead"""
+    distance = max(plan['distance'] - covered_meters, 0.0)
+    fraction = distance / plan['distance'] if plan['distance'] else 0.0
+    remaining = {'distance': distance, 'duration': plan['duration'] * fraction}
+
+    if plan.get('stop_order'):
+        legs = plan['legs'][stops_done:]
+        if not legs:
+            # every stop is done
+            return {'distance': 0.0, 'duration': 0.0, 'legs': [], 'stop_order': []}
+        leg_end = float(np.sum([leg['distance'] for leg in plan['legs'][:stops_done + 1]]))
+        left = min(max((leg_end - covered_meters) / legs[0]['distance'], 0.0), 1.0) if legs[0]['distance'] else 0.0
+        legs[0] = {'distance': legs[0]['distance'] * left, 'duration': legs[0]['duration'] * left}
+        remaining['legs'] = legs
+        remaining['stop_order'] = plan['stop_order'][stops_done:]
+        remaining['distance'] = sum(leg['distance'] for leg in legs)
+        remaining['duration'] = sum(leg['duration'] for leg in legs)
+    return remaining
+
+
+def history_tasks(activities: List[Dict], covered: float = 0.0) -> List[Dict]:
+    """DutyTimeline tasks for activities that already happened, driving replayed as logged.
+
+    `covered` is the distance (miles) at the start of the first activity.
+    """
+    tasks = []
+    for activity in activities:
+        duration = activity['end_time'] - activity['start_time']
+        if activity['type'] == 'driving':
+            tasks.append({'type': 'driving', 'duration': duration, 'logged': True,
+                          'distance': activity['distance_covered'] - covered})
+        elif activity['type'] in ('break', 'off_duty'):
+            tasks.append({'type': 'off_duty', 'duration': duration,
+                          'reason': activity.get('reason', activity['type'])})
+        else:
+            tasks.append({'type': activity['type'], 'duration': duration})
+        covered = activity['distance_covered']
+    return tasks
+
+
+def remaining_tasks(plan: Dict, remaining: Dict, stops_done: int) -> List[Dict]:
+    """DutyTimeline tasks for the rest of the trip"""
+    if plan.get('stop_order'):
+        return DutyTimeline.stop_tasks(remaining['legs'], remaining['stop_order'])
+
+    # single-stop schedules work the pickup before driving the whole route
+    tasks = [{'type': 'pickup', 'duration': 1}] if not stops_done else []
+    if remaining['duration'] > 0:
+        tasks.append({'type': 'driving', 'duration': remaining['duration'] / 3600,
+                      'distance': remaining['distance'] / METERS_PER_MILE})
+    tasks.append({'type': 'dropoff', 'duration': 1})
+    return tasks
+
+
+def restore_timeline(route: Route, plan: Dict, timeline_class: type) -> Optional[DutyTimeline]:
+    """The timeline the last re-plan saved, None if there is none or it doesn't match the plan's breaks"""
+    saved = decode_timeline(route)
+    if saved is None:
+        return None
+    timeline = timeline_class.restore(saved, plan['breaks'], route.current_cycle_hours)
+    if timeline.task_events(len(timeline.tasks)) != len(plan['breaks']):
+        return None
+    return timeline
+
+
+def replan(route: Route, position: Dict, elapsed_duty_hours: float) -> Dict[str, Any]:
+    """Re-plan a stored trip from a GPS ping, see update_route_plan.
+
+    Pings for the same route take turns on the row lock. Databases without
+    row locks (SQLite) don't take it; update_plan's ETag check then refuses
+    to overwrite a plan another ping saved first (PlanChangedError).
+    """
+    with transaction.atomic():
+        route = Route.objects.select_for_update().get(pk=route.pk)
+        return update_route_plan(route, position, elapsed_duty_hours)
+
+
+def update_route_plan(route: Route, position: Dict, elapsed_duty_hours: float) -> Dict[str, Any]:
+    """Re-plan the rest of a stored trip from where the truck is, without any new directions.
+
+    The position is projected onto the stored route line. Activities the
+    truck has both driven past and outlived (by the elapsed hours on the
+    plan's clock) stay as planned, and the time since the last of them is
+    taken as driving (or waiting, if the truck hasn't moved). That history
+    leads the rest of the trip on one DutyTimeline, so the rest is scheduled
+    with the hours already driven and worked counted, and only the log
+    sheet days from today on are rebuilt. The timeline is saved with the
+    plan; the next re-plan restores it and replays from the checkpoint of
+    the first activity that changes (the first re-plan of a plan builds it
+    from the planned activities). Fuel stops keep their stations,
+    they sit on the same route line. Once every stop is done there is
+    nothing left to plan and the stored schedule is left as it is.
+
+    Returns the changes: the new tail of 'breaks' and 'log_sheets' (with the
+    index they start at), the new totals and where the truck is on the route.
+    """
+    plan = decode_plan(route)
+    data = {
+        'current_location': route.current_location,
+        'pickup_location': route.pickup_location,
+        'dropoff_location': route.dropoff_location,
+        'current_cycle_hours': route.current_cycle_hours,
+    }
+
+    geometry = RouteGeometry.from_polyline(plan['polyline'])
+    along, off_route = geometry.locate(position['lat'], position['lng'])
+    if off_route > settings.REPLAN_MAX_OFF_ROUTE_MILES:
+        raise OffRouteError(
+            f"Truck is {off_route:.1f} miles off the planned route, calculate a new route instead"
+        )
+    total_miles = plan['distance'] / METERS_PER_MILE
+    covered_miles = along / geometry.length_miles * total_miles if geometry.length_miles else 0.0
+
+    progress = {
+        'location': dict(zip(('lat', 'lng'), geometry.point_at(along).tolist())) if len(geometry.coords) else position,
+        'miles_covered': covered_miles,
+        'miles_remaining': max(total_miles - covered_miles, 0.0),
+        'off_route_miles': off_route,
+        'elapsed_duty_hours': elapsed_duty_hours,
+    }
+
+    # what is behind the truck stays as it was planned
+    kept = []
+    for b in plan['breaks']:
+        if b['end_time'] > elapsed_duty_hours or b['distance_covered'] > covered_miles + STOP_TOLERANCE_MILES:
+            break
+        kept.append(b)
+    stops_done = sum(1 for b in kept if b['type'] in ('pickup', 'dropoff'))
+    stop_count = len(plan['stop_order']) if plan.get('stop_order') else 2
+
+    if stops_done >= stop_count:
+        # the trip is done, nothing changes but where the truck is
+        plan['progress'] = progress
+        route = update_plan(route, plan)
+        return {
+            'route_id': route.id,
+            'etag': route.plan_etag,
+            'progress': progress,
+            'total_trip_duration': plan['total_trip_duration'],
+            'hos_compliance': plan['hos_compliance'],
+            'breaks': {'from': len(plan['breaks']), 'items': []},
+            'log_sheets': {'from': len(plan['log_sheets']), 'items': []},
+        }
+
+    unchanged = len(kept)
+    # from the last kept activity up to now the truck drove (or waited)
+    since = kept[-1]['end_time'] if kept else 0.0
+    if elapsed_duty_hours > since:
+        driven_from = kept[-1]['distance_covered'] if kept else 0.0
+        kept.append({
+            'type': 'driving' if covered_miles > driven_from else 'off_duty',
+            'duration': elapsed_duty_hours - since,
+            'start_time': since,
+            'end_time': elapsed_duty_hours,
+            'distance_covered': max(covered_miles, driven_from),
+        })
+
+    # multi-stop trips are always scheduled on the FMCSA rules, see RoutePlanner.schedule
+    if plan.get('stop_order') or settings.HOS_RULESET == 'fmcsa':
+        timeline_class = DutyTimeline
+    else:
+        timeline_class = BasicDutyTimeline
+    timeline = restore_timeline(route, plan, timeline_class)
+    if timeline is not None:
+        # tasks before the one the first changed activity belongs to stay as they are
+        first_task = timeline.event_task(unchanged)
+        history_from = timeline.task_events(first_task)
+    else:
+        timeline = timeline_class([], data['current_cycle_hours'])
+        first_task = history_from = 0
+    history = history_tasks(kept[history_from:], kept[history_from - 1]['distance_covered'] if history_from else 0.0)
+    remaining = remaining_route(plan, kept[-1]['distance_covered'] * METERS_PER_MILE if kept else 0.0, stops_done)
+    with stage('hos'):
+        timeline.replace_tasks_from(first_task, history + remaining_tasks(plan, remaining, stops_done))
+        tail = timeline.to_breaks(timeline.task_events(first_task + len(history)))
+    for b in tail:
+        if b['type'] == 'fuel':
+            b['route_percentage'] = b['distance_covered'] / total_miles * 100 if total_miles else 0.0
+    RoutePlanner().place_breaks(data, tail, geometry, total_miles)
+    breaks = kept + tail
+
+    # days before today are done, they are kept as they are
+    start_time = plan_start_time(plan)
+    today = (start_time + datetime.timedelta(hours=elapsed_duty_hours)).strftime('%Y-%m-%d')
+    past_days = [day for day in plan['log_sheets'] if day['date'] < today]
+    route_info = {
+        'locations': {
+            'current': data['current_location'],
+            'pickup': data['pickup_location'],
+            'dropoff': data['dropoff_location']
+        },
+        'route_details': plan,
+        'geometry': geometry
+    }
+    with stage('log_sheets'):
+        log_generator = LogSheetGenerator(reverse_geocode=settings.ROUTING_BACKEND != 'local')
+        days = [day for day in log_generator.iter_daily_logs(breaks, start_time, route_info)
+                if day['date'] >= today]
+
+    plan.update({
+        'breaks': breaks,
+        'log_sheets': past_days + days,
+        # as RoutePlanner.schedule reports it for the plan's ruleset
+        'total_trip_duration': (HOSCalculator.trip_duration(breaks) if timeline_class is BasicDutyTimeline
+                                else timeline.total_duration),
+        'hos_compliance': timeline.is_compliant(),
+        'progress': progress,
+    })
+    route = update_plan(route, plan, timeline.checkpoint_state())
+
+    return {
+        'route_id': route.id,
+        'etag': route.plan_etag,
+        'progress': progress,
+        'total_trip_duration': plan['total_trip_duration'],
+        'hos_compliance': plan['hos_compliance'],
+        'breaks': {'from': unchanged, 'items': breaks[unchanged:]},
+        'log_sheets': {'from': len(past_days), 'items': days},
+    }
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""route_jobs module"""
+
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.http.request import validate_host
+from django.utils import timezone
+
+from ..models import RouteJob
+from .route_planner import plan_route
+
+logger = logging.getLogger(__name__)
+
+# jobs run here, off the request threads; their upstream calls still share
+# the upstream pool and its concurrency limit
+job_executor = ThreadPoolExecutor(
+    max_workers=settings.ROUTE_JOB_WORKERS,
+    thread_name_prefix='route-job'
+)
+
+# job ids handed to job_executor that haven't started yet, so a sweep
+# doesn't queue them twice
+_pending = set()
+_pending_lock = threading.Lock()
+_sweeper_pid = None
+_sweeper_lock = threading.Lock()
+
+
+def submit_job(data: Dict, callback_url: Optional[str] = None) -> RouteJob:
+    """Store a queued job and hand it to the worker pool once it is committed"""
+    start_sweeper()
+    job = RouteJob.objects.create(input=data, callback_url=callback_url)
+    transaction.on_commit(lambda: enqueue(job.pk))
+    return job
+
+
+def enqueue(job_id) -> None:
+    with _pending_lock:
+        if job_id in _pending:
+            return
+        _pending.add(job_id)
+    job_executor.submit(run_job, job_id)
+
+
+def resume_queued_jobs() -> None:
+    """Queue again the jobs a stopped process left running, and run every queued job.
+
+    Jobs that have been running for longer than ROUTE_JOB_STALE_AFTER were
+    left behind by a process that died while running them. Queued jobs may
+    have been waiting in such a process's pool; they are handed to this
+    one's, and whichever process claims a job first runs it.
+    """
+    started_before = timezone.now() - datetime.timedelta(seconds=settings.ROUTE_JOB_STALE_AFTER)
+    requeued = RouteJob.objects.filter(status=RouteJob.RUNNING, started_at__lt=started_before).update(
+        status=RouteJob.QUEUED, started_at=None
+    )
+    if requeued:
+        logger.warning("Requeued %d route jobs left running by a stopped process", requeued)
+    for job_id in RouteJob.objects.filter(status=RouteJob.QUEUED).values_list('pk', flat=True):
+        enqueue(job_id)
+
+
+def start_sweeper() -> None:
+    """Run resume_queued_jobs every ROUTE_JOB_SWEEP_INTERVAL seconds on a daemon thread.
+
+    Called when the app loads and on every submit; a no-op while this
+    process's sweeper is running. A worker forked after the app loaded
+    doesn't inherit the thread, so it starts its own.
+    """
+    global _sweeper_pid
+    if settings.ROUTE_JOB_SWEEP_INTERVAL <= 0:
+        return
+    with _sweeper_lock:
+        if _sweeper_pid == os.getpid():
+            return
+        _sweeper_pid = os.getpid()
+    threading.Thread(target=_sweep_forever, name='route-job-sweeper', daemon=True).start()
+
+
+def _sweep_forever() -> None:
+    while True:
+        time.sleep(settings.ROUTE_JOB_SWEEP_INTERVAL)
+        close_old_connections()
+        try:
+            resume_queued_jobs()
+        except Exception:
+            logger.exception("Route job sweep failed")
+        finally:
+            connection.close()
+
+
+def run_job(job_id) -> None:
+    """Claim a queued job and run the calculate-route pipeline for it.
+
+    The claim is a conditional UPDATE, so when several processes see the
+    same queued job only one of them runs it.
+    """
+    with _pending_lock:
+        _pending.discard(job_id)
+    close_old_connections()
+    try:
+        claimed = RouteJob.objects.filter(pk=job_id, status=RouteJob.QUEUED).update(
+            status=RouteJob.RUNNING, started_at=timezone.now()
+        )
+        if not claimed:
+            return
+
+        job = RouteJob.objects.get(pk=job_id)
+        try:
+            plan = plan_route(job.input)
+        except Exception as e:
+            logger.exception("Route job %s failed", job_id)
+            job.status, job.error = RouteJob.FAILED, f'Something went wrong: {str(e)}'
+        else:
+            job.status, job.route_id = RouteJob.SUCCEEDED, plan['route_id']
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'route', 'finished_at'])
+
+        if job.callback_url:
+            job.callback_status = send_callback(job)
+            job.save(update_fields=['callback_status'])
+    finally:
+        # worker threads outlive the job, don't keep its connection open
+        connection.close()
+
+
+def job_status(job: RouteJob) -> Dict:
+    """What the status endpoint and the callback report for a job"""
+    return {
+        'job_id': str(job.pk),
+        'status': job.status,
+        'route_id': job.route_id,
+        'result_url': f"/api/routes/{job.route_id}/" if job.route_id else None,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def callback_allowed(url: str) -> bool:
+    """Whether url's scheme and host are in ROUTE_JOB_CALLBACK_SCHEMES / ROUTE_JOB_CALLBACK_HOSTS"""
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname or ''
+    except ValueError:
+        return False
+    return (parts.scheme in settings.ROUTE_JOB_CALLBACK_SCHEMES
+            and validate_host(host, settings.ROUTE_JOB_CALLBACK_HOSTS))
+
+
+def send_callback(job: RouteJob) -> Optional[int]:
+    """POST the finished job's status to its callback URL, retrying failed deliveries.
+
+    Returns the last HTTP status received, None if the URL was unreachable
+    or is no longer allowed. Redirects aren't followed, they could point
+    anywhere.
+    """
+    if not callback_allowed(job.callback_url):
+        logger.warning("Callback URL of route job %s is not allowed, not sending it", job.pk)
+        return None
+    body = json.dumps(job_status(job))
+    status_code = None
+    for attempt in range(settings.ROUTE_JOB_CALLBACK_RETRIES + 1):
+        if attempt:
+            time.sleep(settings.ROUTE_JOB_CALLBACK_BACKOFF * 2 ** (attempt - 1))
+        try:
+            response = requests.post(
+                job.callback_url, data=body,
+                headers={'Content-Type': 'application/json'},
+                timeout=settings.ROUTE_JOB_CALLBACK_TIMEOUT,
+                allow_redirects=False
+            )
+            status_code = response.status_code
+            if status_code < 500:
+                break
+        except requests.RequestException as e:
+            logger.warning("Callback for route job %s failed: %s", job.pk, e)
+    return status_code
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""route_planner module"""
+
+import datetime
+from contextvars import copy_context
+from typing import Any, Dict, Iterator, List
+
+from django.conf import settings
+from .cache_service import hash_parts, make_cache_key, round_coordinate
+from .concurrency import stage_executor
+from .google_maps_service import GoogleMapsService
+from .hos_rules import DutyTimeline
+from .hos_service import HOSCalculator
+from .log_generator import LogSheetGenerator
+from .plan_store import decode_plan, find_plan, save_plan
+from .polyline import RouteGeometry
+from .routing import get_routing_provider, join_routes
+from .single_flight import SingleFlight
+from .stop_order import StopOrderSolver
+from .timing import count, stage
+
+
+def route_leg_key(data: Dict) -> str:
+    """Key shared by inputs that drive the same current -> pickup -> dropoff route"""
+    precision = settings.COORDINATE_CACHE_PRECISION
+    parts = [
+        round_coordinate(data['current_location'], precision),
+        round_coordinate(data['pickup_location'], precision),
+        round_coordinate(data['dropoff_location'], precision)
+    ]
+    if data.get('stops'):
+        # only added for multi-stop trips so single-stop keys stay the same
+        parts.append([(round_coordinate(stop, precision), stop['type'], stop.get('load'))
+                      for stop in data['stops']])
+    if data.get('alternatives'):
+        parts.append({'alternatives': data['alternatives']})
+    return make_cache_key('leg', *parts)
+
+
+def route_input_hash(data: Dict) -> str:
+    """Hash shared by RouteInput payloads that produce the same plan"""
+    parts = [
+        route_leg_key(data),
+        round(float(data['current_cycle_hours']), 2),
+        # addresses end up in the log sheet descriptions
+        [data[name].get('address') for name in ('current_location', 'pickup_location', 'dropoff_location')]
+    ]
+    if data.get('stops'):
+        parts.append([(stop.get('address'), round(float(stop.get('duration', 1)), 2))
+                      for stop in data['stops']])
+    return hash_parts(*parts)
+
+
+def route_input_key(data: Dict) -> str:
+    return f"route-input:{route_input_hash(data)}"
+
+
+class RoutePlanner:
+    """The calculate-route pipeline: route, HOS breaks, fuel stops and log sheets"""
+
+    def __init__(self):
+        self._maps_service = None
+        self._routing_provider = None
+
+    @property
+    def maps_service(self):
+        # fuel stops only, and only the Places backend calls Google
+        if self._maps_service is None:
+            self._maps_service = GoogleMapsService()
+        return self._maps_service
+
+    @property
+    def routing_provider(self):
+        # only loaded when a route is requested, build_plan doesn't need it
+        if self._routing_provider is None:
+            self._routing_provider = get_routing_provider()
+        return self._routing_provider
+
+    @staticmethod
+    def trip_stops(data: Dict) -> List[Dict]:
+        """The pickup and the extra stops, in request order"""
+        return [{**data['pickup_location'], 'type': 'pickup', 'duration': 1}, *data['stops']]
+
+    def order_stops(self, data: Dict) -> List[int]:
+        """Indices into trip_stops in the order that drives least, loads picked up before dropped off"""
+        stops = self.trip_stops(data)
+        matrix = self.routing_provider.get_duration_matrix(
+            [data['current_location'], *stops, data['dropoff_location']]
+        )
+
+        # matrix index of each stop is its list index + 1, after the current location
+        pickups = {stop['load']: i + 1 for i, stop in enumerate(stops)
+                   if stop['type'] == 'pickup' and stop.get('load') is not None}
+        precedence = [(pickups[stop['load']], i + 1) for i, stop in enumerate(stops)
+                      if stop['type'] == 'dropoff' and stop.get('load') is not None]
+
+        return [i - 1 for i in StopOrderSolver(matrix, precedence).solve()]
+
+    def route_options(self, data: Dict) -> List[Dict]:
+        """Candidate current -> pickup -> dropoff routes from the routing backend"""
+        origin, pickup, dropoff = data['current_location'], data['pickup_location'], data['dropoff_location']
+        if data.get('alternatives', 1) <= 1:
+            return self.routing_provider.get_route_alternatives(origin, dropoff, [pickup])
+
+        # the Directions API has no alternatives for a route with waypoints,
+        # so both legs are requested on their own, side by side, and combined
+        to_pickup = stage_executor.submit(
+            copy_context().run, self.routing_provider.get_route_alternatives, origin, pickup
+        )
+        to_dropoff = self.routing_provider.get_route_alternatives(pickup, dropoff)
+        return [join_routes(first, second) for first in to_pickup.result() for second in to_dropoff]
+
+    def rank_routes(self, data: Dict, options: List[Dict]) -> List[tuple]:
+        """(route details, schedule) per option, quickest trip first.
+
+        Trips are compared on their whole schedule, rest breaks and fuel
+        stops included, not on drive time: a shorter route that needs one
+        more break can arrive later. The schedules are computed side by side.
+        """
+        futures = [stage_executor.submit(copy_context().run, self.schedule, data, option)
+                   for option in options[1:]]
+        schedules = [self.schedule(data, options[0]), *(future.result() for future in futures)]
+        # sorted() is stable, ties keep the backend's order
+        return sorted(zip(options, schedules), key=lambda ranked: ranked[1]['trip_hours'])
+
+    def fetch_routes(self, data: Dict) -> Dict[str, Any]:
+        """What the routing backend returns for data's route, the same for every input with its route_leg_key.
+
+        {'options': [...]} for a trip through the pickup, {'order': [...],
+        'route': {...}} with the order_stops indices for a multi-stop trip.
+        get_route_details turns it into one input's route details.
+        """
+        with stage('route'):
+            if not data.get('stops'):
+                return {'options': self.route_options(data)}
+            order = self.order_stops(data)
+            stops = self.trip_stops(data)
+            route = self.routing_provider.get_route_details(
+                origin=data['current_location'],
+                destination=data['dropoff_location'],
+                waypoints=[{'lat': stops[i]['lat'], 'lng': stops[i]['lng']} for i in order]
+            )
+        return {'order': order, 'route': route}
+
+    def get_route_details(self, data: Dict, routes: Dict = None) -> Dict[str, Any]:
+        """The route to plan data on, from fetch_routes' result for it (fetched when not given)"""
+        if routes is None:
+            routes = self.fetch_routes(data)
+        if data.get('stops'):
+            return self.get_multi_stop_route_details(data, routes)
+
+        options = routes['options']
+        if len(options) == 1 and not data.get('alternatives'):
+            return options[0]
+
+        # ranked on this input's schedule, which depends on its cycle hours
+        ranked = self.rank_routes(data, options)
+        route_details = dict(ranked[0][0])
+        if data.get('alternatives'):
+            route_details['alternatives'] = [{
+                'summary': details.get('summary', ''),
+                'distance': details['distance'],
+                'duration': details['duration'],
+                'polyline': details['polyline'],
+                'trip_hours': schedule['trip_hours'],
+                'total_trip_duration': schedule['total_trip_duration'],
+                'hos_compliance': schedule['hos_compliance'],
+            } for details, schedule in ranked[:data['alternatives']]]
+        return route_details
+
+    def get_multi_stop_route_details(self, data: Dict, routes: Dict) -> Dict[str, Any]:
+        stops = self.trip_stops(data)
+        route_details = dict(routes['route'])
+        # one entry per leg: the stop it ends at, with this input's durations
+        # and addresses, the final dropoff last
+        route_details['stop_order'] = [
+            *(stops[i] for i in routes['order']),
+            {**data['dropoff_location'], 'type': 'dropoff', 'duration': 1}
+        ]
+        return route_details
+
+    def schedule(self, data: Dict, route_details: Dict) -> Dict[str, Any]:
+        """HOS breaks, total trip duration and compliance for driving route_details"""
+        hos_calculator = HOSCalculator(
+            current_cycle_hours=data['current_cycle_hours']
+        )
+
+        # Calculate driving hours and breaks
+        total_drive_time = route_details['duration'] / 3600
+        total_distance = route_details['distance'] / 1609.34  # convert meters to miles
+        with stage('hos'):
+            if route_details.get('stop_order'):
+                # the basic calculator only knows one pickup and one dropoff
+                timeline = DutyTimeline.for_stops(route_details['legs'], route_details['stop_order'],
+                                                  data['current_cycle_hours'])
+                breaks = timeline.to_breaks()
+                total_trip_duration = timeline.total_duration
+                hos_compliance = timeline.is_compliant()
+            elif settings.HOS_RULESET == 'fmcsa':
+                timeline = DutyTimeline.for_trip(total_drive_time, total_distance, data['current_cycle_hours'])
+                breaks = timeline.to_breaks()
+                total_trip_duration = timeline.total_duration
+                hos_compliance = timeline.is_compliant()
+            else:
+                breaks = hos_calculator.calculate_breaks(total_drive_time, total_distance)
+                total_trip_duration = HOSCalculator.trip_duration(breaks)
+                hos_compliance = total_drive_time <= hos_calculator.remaining_cycle_hours
+
+        return {
+            'breaks': breaks,
+            'total_trip_duration': total_trip_duration,
+            'hos_compliance': hos_compliance,
+            # pickup to dropoff, rest and fuel stops included, what routes are ranked by
+            'trip_hours': breaks[-1]['end_time'] if breaks else 0.0
+        }
+
+    def place_breaks(self, data: Dict, breaks: List[Dict], geometry: RouteGeometry, total_distance: float) -> None:
+        """Put every stop on the route line, the map shows them as markers"""
+        if not breaks or not len(geometry.coords):
+            return
+        points = geometry.point_at_fraction(
+            [b['distance_covered'] / total_distance if total_distance else 0.0 for b in breaks]
+        )
+        for b, (lat, lng) in zip(breaks, points.tolist()):
+            if 'location' in b:
+                # multi-stop pickups and dropoffs come with theirs
+                continue
+            b['location'] = {'lat': lat, 'lng': lng}
+            if b['type'] in ('pickup', 'dropoff'):
+                # the schedule has no distance for the leg to the pickup
+                stop = data[f"{b['type']}_location"]
+                b['location'] = {'lat': stop['lat'], 'lng': stop['lng']}
+
+    def iter_plan(self, data: Dict, route_details: Dict, start_time: datetime.datetime = None) -> Iterator[Dict]:
+        """Everything that comes after the route itself, in parts as they become ready.
+
+        Yields the plan summary ({'type': 'plan', ...route details, breaks and
+        HOS totals}) first, then one {'type': 'log_sheet', ...} per day, and
+        finally {'type': 'fuel_stops', 'fuel_stops': [...]}.
+        """
+        start_time = start_time or datetime.datetime.now()
+        # decode the route line once, later stages reuse it
+        geometry = RouteGeometry.from_polyline(route_details['polyline'])
+
+        schedule = self.schedule(data, route_details)
+        breaks = schedule['breaks']
+
+        # prepare route info
+        route_info = {
+            'locations': {
+                'current': data['current_location'],
+                'pickup': data['pickup_location'],
+                'dropoff': data['dropoff_location']
+            },
+            'route_details': route_details,
+            'geometry': geometry
+        }
+
+        self.place_breaks(data, breaks, geometry, route_details['distance'] / 1609.34)
+
+        # find fuel stops along the route using google places API, in the
+        # background since it doesn't depend on the log sheets
+        fuel_stops_future = stage_executor.submit(
+            copy_context().run,
+            self.maps_service.find_fuel_stops,
+            breaks=breaks,
+            geometry=geometry
+        )
+
+        yield {
+            'type': 'plan',
+            **route_details,
+            'breaks': breaks,
+            'total_trip_duration': schedule['total_trip_duration'],
+            'hos_compliance': schedule['hos_compliance'],
+            # day boundaries of the log sheets, re-planning needs them
+            'start_time': start_time.isoformat()
+        }
+
+        # generate log sheets with route information, a day at a time
+        # the local backend doesn't depend on Google, its log sheets only use cached place names
+        log_generator = LogSheetGenerator(reverse_geocode=settings.ROUTING_BACKEND != 'local')
+        days = log_generator.iter_daily_logs(
+            breaks=breaks,
+            start_time=start_time,
+            route_info=route_info
+        )
+        while True:
+            # only the generator's own work is timed, not the consumer's
+            with stage('log_sheets'):
+                day = next(days, None)
+            if day is None:
+                break
+            yield {'type': 'log_sheet', **day}
+
+        yield {'type': 'fuel_stops', 'fuel_stops': fuel_stops_future.result()}
+
+    def build_plan(self, data: Dict, route_details: Dict, start_time: datetime.datetime = None) -> Dict[str, Any]:
+        """The whole plan as a single response dict"""
+        plan = {'log_sheets': []}
+        for part in self.iter_plan(data, route_details, start_time):
+            part_type = part.pop('type')
+            if part_type == 'log_sheet':
+                plan['log_sheets'].append(part)
+            else:
+                plan.update(part)
+        return plan
+
+    def plan(self, data: Dict, start_time: datetime.datetime = None) -> Dict[str, Any]:
+        route_details = self.get_route_details(data)
+        return self.build_plan(data, route_details, start_time)
+
+
+# identical plans requested at the same time are computed once
+route_plan_flight = SingleFlight(
+    'route-plan',
+    lock_timeout=settings.SINGLE_FLIGHT_LOCK_TIMEOUT,
+    result_ttl=settings.SINGLE_FLIGHT_RESULT_TTL,
+    cache_alias='coordination'
+)
+
+
+def plan_route(data: Dict) -> Dict[str, Any]:
+    """Plan and persist a route, shared with concurrent identical requests.
+
+    A plan saved for the same input within PLAN_REUSE_TTL seconds is
+    returned as it is instead of computing and storing another one. The
+    saved plan's id comes back as 'route_id', see GET /api/routes/<id>/.
+    """
+    def compute():
+        input_hash = route_input_hash(data)
+        route = find_plan(input_hash, settings.PLAN_REUSE_TTL)
+        if route is not None:
+            count('cache_hit.route_plan')
+            return decode_plan(route)
+
+        count('cache_miss.route_plan')
+        plan = RoutePlanner().plan(data)
+        route = save_plan(data, plan, input_hash)
+        return {**plan, 'route_id': route.id}
+
+    return route_plan_flight.do(route_input_key(data), compute)
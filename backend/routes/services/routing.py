@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""routing module"""
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List
+
+import numpy as np
+from django.conf import settings
+from .polyline import decode_polyline, encode_polyline
+
+
+class RoutingProvider(ABC):
+    """Anything that can turn origin/waypoints/destination into route details.
+
+    get_route_details returns the dict shape the rest of the pipeline
+    expects: 'distance' (meters), 'duration' (seconds), 'polyline' (encoded
+    overview line), 'steps' (Directions API style steps, at least
+    distance.value and end_location) and 'bounds'. With waypoints it also
+    has 'legs', the distance and duration between consecutive stops.
+    """
+
+    @abstractmethod
+    def get_route_details(self, origin: Dict, destination: Dict,
+                          waypoints: List[Dict] = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def get_route_alternatives(self, origin: Dict, destination: Dict,
+                               waypoints: List[Dict] = None) -> List[Dict[str, Any]]:
+        """Every route the backend offers, in its own order of preference"""
+        return [self.get_route_details(origin, destination, waypoints)]
+
+    def get_duration_matrix(self, points: List[Dict]) -> np.ndarray:
+        """Travel time in seconds from every point to every other (inf when unreachable)"""
+        raise NotImplementedError
+
+
+def legs_of(route: Dict) -> List[Dict]:
+    return route.get('legs') or [{'distance': route['distance'], 'duration': route['duration']}]
+
+
+def join_routes(first: Dict, second: Dict) -> Dict[str, Any]:
+    """Route details for driving `first` and then `second`, which starts where it ends"""
+    coords = np.concatenate((decode_polyline(first['polyline']), decode_polyline(second['polyline'])[1:]))
+    bounds = [first['bounds'], second['bounds']]
+    route = {
+        'distance': first['distance'] + second['distance'],
+        'duration': first['duration'] + second['duration'],
+        'polyline': encode_polyline(coords),
+        'steps': first['steps'] + second['steps'],
+        'legs': [*legs_of(first), *legs_of(second)],
+        'bounds': {
+            'northeast': {'lat': max(b['northeast']['lat'] for b in bounds),
+                          'lng': max(b['northeast']['lng'] for b in bounds)},
+            'southwest': {'lat': min(b['southwest']['lat'] for b in bounds),
+                          'lng': min(b['southwest']['lng'] for b in bounds)},
+        }
+    }
+    if first.get('summary') or second.get('summary'):
+        route['summary'] = ' / '.join(filter(None, (first.get('summary'), second.get('summary'))))
+    return route
+
+
+def get_routing_provider(backend: str = None) -> RoutingProvider:
+    """Routing provider selected by settings.ROUTING_BACKEND ('google' or 'local')"""
+    backend = backend or settings.ROUTING_BACKEND
+    if backend == 'google':
+        from .google_maps_service import GoogleMapsService
+        return GoogleMapsService()
+    if backend == 'local':
+        from .local_router import get_local_router
+        return get_local_router()
+    raise ValueError(f"Unknown routing backend: {backend}")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""single_flight module"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, Callable
+
+from django.core.cache import caches
+
+_MISSING = object()
+
+
+class SingleFlight:
+    """Collapse concurrent identical computations into one.
+
+    Within a process, callers asking for a key that is already being
+    computed wait on the leader's Future. Across processes, the leader also
+    holds a lock entry in the shared Django cache and publishes its result
+    there for `result_ttl` seconds; callers in other workers that find the
+    lock taken poll for that result instead of computing it again. If the
+    leader fails or the lock expires first, they compute it themselves.
+    """
+
+    def __init__(self, namespace: str, lock_timeout: float = 60, result_ttl: float = 10,
+                 poll_interval: float = 0.05, cache_alias: str = 'default'):
+        self.namespace = namespace
+        self.lock_timeout = lock_timeout
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.cache_alias = cache_alias
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias]
+
+    def do(self, key: str, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = self._in_flight[key] = Future()
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            value = self._do_shared(key, compute)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _do_shared(self, key: str, compute: Callable[[], Any]) -> Any:
+        lock_key = f"{self.namespace}:lock:{key}"
+        result_key = f"{self.namespace}:result:{key}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+
+        while True:
+            try:
+                value = self.shared.get(result_key, _MISSING)
+                if value is not _MISSING:
+                    return value
+                acquired = self.shared.add(lock_key, token, timeout=self.lock_timeout)
+            except Exception:
+                # no shared cache, still coalesced within this process
+                return compute()
+
+            if acquired:
+                break
+            if time.monotonic() >= deadline:
+                return compute()
+            time.sleep(self.poll_interval)
+
+        try:
+            value = compute()
+            try:
+                self.shared.set(result_key, value, timeout=self.result_ttl)
+            except Exception:
+                pass
+            return value
+        finally:
+            try:
+                if self.shared.get(lock_key) == token:
+                    self.shared.delete(lock_key)
+            except Exception:
+                pass
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""stop_order module"""
+
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+
+class StopOrderSolver:
+    """Visiting order for the stops of a trip, given a travel time matrix.
+
+    Node 0 is the start and the last node the final destination, both fixed;
+    the nodes in between are visited in the order that minimizes the total
+    travel time while keeping every (before, after) precedence pair, e.g. a
+    load's pickup before its dropoff. A nearest-neighbour tour is improved
+    with 2-opt (segment reversal) and or-opt (moving runs of 1-3 stops)
+    until neither finds a better feasible order. Good, not proven optimal,
+    and fast for the 6-25 stops a trip has.
+    """
+
+    def __init__(self, matrix: np.ndarray, precedence: Sequence[Tuple[int, int]] = ()):
+        self.matrix = np.asarray(matrix, dtype=float)
+        self.size = len(self.matrix)
+        self.precedence = list(precedence)
+        self.predecessors = {node: set() for node in range(self.size)}
+        for before, after in self.precedence:
+            self.predecessors[after].add(before)
+
+    def cost(self, order: Sequence[int]) -> float:
+        path = [0, *order, self.size - 1]
+        return float(self.matrix[path[:-1], path[1:]].sum())
+
+    def is_feasible(self, order: Sequence[int]) -> bool:
+        position = {node: i for i, node in enumerate(order)}
+        return all(position[before] < position[after] for before, after in self.precedence)
+
+    def nearest_neighbour(self) -> List[int]:
+        """Greedy order: always drive to the closest stop whose predecessors are done"""
+        remaining = set(range(1, self.size - 1))
+        order, current = [], 0
+        while remaining:
+            ready = [node for node in remaining if not self.predecessors[node] & remaining]
+            current = min(ready, key=lambda node: self.matrix[current, node])
+            order.append(current)
+            remaining.remove(current)
+        return order
+
+    def _candidates(self, order: List[int]):
+        count = len(order)
+        # 2-opt: reverse order[i:j]
+        for i in range(count - 1):
+            for j in range(i + 2, count + 1):
+                yield order[:i] + order[i:j][::-1] + order[j:]
+        # or-opt: move a run of 1-3 stops elsewhere
+        for length in (1, 2, 3):
+            for i in range(count - length + 1):
+                run, rest = order[i:i + length], order[:i] + order[i + length:]
+                for j in range(len(rest) + 1):
+                    if j != i:
+                        yield rest[:j] + run + rest[j:]
+
+    def solve(self) -> List[int]:
+        """Best order found for the stops between the start and the destination"""
+        order = self.nearest_neighbour()
+        best = self.cost(order)
+        improved = True
+        while improved:
+            improved = False
+            for candidate in self._candidates(order):
+                cost = self.cost(candidate)
+                if cost < best - 1e-9 and self.is_feasible(candidate):
+                    order, best, improved = candidate, cost, True
+                    break
+        return order
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""timing module"""
+
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from .metrics import counter, histogram
+
+stage_seconds = histogram(
+    'route_planner_stage_seconds',
+    "Time a request spent in each planning stage (upstream stages sum their calls)"
+)
+request_seconds = histogram('route_planner_request_seconds', "Request latency by view")
+events_total = counter('route_planner_events_total', "Upstream API calls and cache hits / misses")
+
+
+class RequestTimings:
+    """Stage durations and event counts of one request.
+
+    Stages entered more than once (one geocode call per waypoint, a log
+    sheet per day) add up, and the count of entries is kept alongside.
+    """
+
+    def __init__(self):
+        self.stages = {}  # name -> [seconds, entries]
+        self.events = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        with self._lock:
+            totals = self.stages.setdefault(name, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+
+    def add_event(self, name: str, amount: int) -> None:
+        with self._lock:
+            self.events[name] = self.events.get(name, 0) + amount
+
+    def server_timing(self, total: Optional[float] = None) -> str:
+        """Server-Timing header value, durations in milliseconds"""
+        with self._lock:
+            stages = {name: tuple(totals) for name, totals in self.stages.items()}
+            events = dict(self.events)
+
+        metrics = []
+        for name, (seconds, entries) in stages.items():
+            metric = f"{name};dur={seconds * 1000:.1f}"
+            if entries > 1:
+                metric += f';desc="{entries} calls"'
+            metrics.append(metric)
+        metrics.extend(f'{name};desc="{count}"' for name, count in events.items())
+        if total is not None:
+            metrics.append(f"total;dur={total * 1000:.1f}")
+        return ', '.join(metrics)
+
+    def observe(self) -> None:
+        """Record the per-stage totals in the stage histogram"""
+        with self._lock:
+            stages = {name: totals[0] for name, totals in self.stages.items()}
+        for name, seconds in stages.items():
+            stage_seconds.observe(seconds, stage=name)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar('request_timings', default=None)
+
+
+@contextmanager
+def collect_timings():
+    """Collect the stages and events of everything run inside the block.
+
+    Worker threads see the collector only if they run in a copy of the
+    caller's context (fan_out and RoutePlanner do this).
+    """
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """Time the block as part of the named stage of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = _current.get()
+        if timings is not None:
+            timings.add_stage(name, time.perf_counter() - start)
+
+
+def timed(name: str):
+    """Decorator form of stage()"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(event: str, amount: int = 1) -> None:
+    """Count an event (an upstream call, a cache hit) for the request and the process"""
+    events_total.inc(amount, event=event)
+    timings = _current.get()
+    if timings is not None:
+        timings.add_event(event, amount)
+
@@ -1,3 +1,904 @@
-from django.test import TestCase
+import datetime
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+import numpy as np
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from googlemaps import convert
+
+from .models import MatrixCell, Route, RouteJob
+from .services import route_jobs
+from .services.cache_service import TieredCache
+from .services.fleet_simulation import simulate_fleet
+from .services.geo import METERS_PER_MILE
+from .services.geocode_cache import GeocodeCache
+from .services.hos_rules import DutyTimeline
+from .services.hos_service import HOSCalculator
+from .services.local_router import LocalGraphRouter
+from .services.log_generator import LogSheetGenerator
+from .services.matrix_service import MAX_DESTINATIONS, MAX_ELEMENTS, MAX_ORIGINS, matrix_cell_cache
+from .services.plan_format import compact_plan
+from .services.plan_store import PlanChangedError, decode_plan, decode_timeline, find_plan, save_plan, update_plan
+from .services.polyline import RouteGeometry, decode_polyline, encode_polyline
+from .services.replan import replan, update_route_plan
+from .services.route_planner import RoutePlanner, route_input_hash, route_leg_key, route_plan_flight
+from .services.single_flight import SingleFlight
+from .services.stop_order import StopOrderSolver
+
+
+def driving_task(hours, mph=50):
+    return {'type': 'driving', 'duration': hours, 'distance': hours * mph}
+
+
+class DutyTimelineTests(SimpleTestCase):
+    def reasons(self, timeline):
+        return [event.get('reason') for event in timeline.events if event['type'] == 'off_duty']
+
+    def test_thirty_minute_break_after_eight_hours_driving(self):
+        timeline = DutyTimeline([driving_task(10)], current_cycle_hours=0)
+        events = timeline.events
+        self.assertEqual(events[0]['type'], 'driving')
+        self.assertAlmostEqual(events[0]['duration'], 8)
+        self.assertEqual(events[1]['type'], 'break')
+        self.assertAlmostEqual(events[1]['duration'], 0.5)
+
+    def test_ten_hour_reset_after_eleven_hours_driving(self):
+        timeline = DutyTimeline([driving_task(15)], current_cycle_hours=0)
+        reset = next(event for event in timeline.events if event.get('reason') == '10_hour_reset')
+        driven_before = sum(event['duration'] for event in timeline.events
+                            if event['type'] == 'driving' and event['end_time'] <= reset['start_time'])
+        self.assertAlmostEqual(driven_before, 11)
+        self.assertAlmostEqual(reset['duration'], 10)
+
+    def test_ten_hour_reset_when_fourteen_hour_window_closes(self):
+        # 5 hours on duty at the pickup leave 9 hours of the window for driving
+        timeline = DutyTimeline([{'type': 'pickup', 'duration': 5}, driving_task(12)], current_cycle_hours=0)
+        reset = next(event for event in timeline.events if event.get('reason') == '10_hour_reset')
+        self.assertAlmostEqual(reset['start_time'], 14)
+
+    def test_thirty_four_hour_restart_when_cycle_is_used_up(self):
+        timeline = DutyTimeline([driving_task(5)], current_cycle_hours=68)
+        self.assertIn('34_hour_restart', self.reasons(timeline))
+        self.assertFalse(timeline.is_compliant())
+        driven = sum(event['duration'] for event in timeline.events if event['type'] == 'driving')
+        self.assertAlmostEqual(driven, 5)
+
+    def test_fresh_cycle_needs_no_restart(self):
+        timeline = DutyTimeline.for_trip(20, 1000, current_cycle_hours=0)
+        self.assertTrue(timeline.is_compliant())
+        self.assertIn('10_hour_reset', self.reasons(timeline))
+
+    def test_incremental_replay_matches_full_replay(self):
+        tasks = [{'type': 'pickup', 'duration': 1}, driving_task(9), {'type': 'fuel', 'duration': 0.5},
+                 driving_task(14), {'type': 'dropoff', 'duration': 1}]
+        timeline = DutyTimeline(tasks, current_cycle_hours=30)
+        unchanged = len(timeline.events)
+
+        first_changed = timeline.delay_task(3, 2.5)
+        first_changed = min(first_changed, timeline.replace_task(4, {'type': 'dropoff', 'duration': 3}))
+
+        delayed = [dict(task) for task in tasks]
+        delayed[3]['duration'] += 2.5
+        delayed[4] = {'type': 'dropoff', 'duration': 3}
+        full = DutyTimeline(delayed, current_cycle_hours=30)
+
+        self.assertEqual(timeline.events, full.events)
+        self.assertGreater(first_changed, 0)
+        self.assertLess(first_changed, unchanged)
+        self.assertEqual(timeline.events[:first_changed], full.events[:first_changed])
+
+
+class PolylineTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        # a wandering line with steps of every size, negative deltas included
+        steps = rng.normal(scale=[0.01, 0.5, 3.0], size=(300, 3))[np.arange(300), rng.integers(0, 3, 300)]
+        self.coords = np.round(np.column_stack((
+            np.clip(35 + np.cumsum(steps), -89, 89),
+            np.clip(-100 + np.cumsum(rng.normal(scale=0.3, size=300)), -179, 179),
+        )), 5)
+
+    def test_encode_matches_googlemaps(self):
+        expected = convert.encode_polyline([tuple(point) for point in self.coords.tolist()])
+        self.assertEqual(encode_polyline(self.coords), expected)
+
+    def test_decode_matches_googlemaps(self):
+        encoded = convert.encode_polyline([tuple(point) for point in self.coords.tolist()])
+        expected = [(point['lat'], point['lng']) for point in convert.decode_polyline(encoded)]
+        np.testing.assert_allclose(decode_polyline(encoded), expected, atol=1e-9)
+
+    def test_round_trip(self):
+        np.testing.assert_allclose(decode_polyline(encode_polyline(self.coords)), self.coords, atol=1e-9)
+
+    def test_empty(self):
+        self.assertEqual(encode_polyline(np.empty((0, 2))), '')
+        self.assertEqual(decode_polyline('').shape, (0, 2))
+
+    def test_simplify_keeps_endpoints_and_thins_out(self):
+        geometry = RouteGeometry(self.coords)
+        coarse = geometry.simplify_for_zoom(4)
+        fine = geometry.simplify_for_zoom(18)
+        np.testing.assert_array_equal(coarse[[0, -1]], self.coords[[0, -1]])
+        self.assertLess(len(coarse), len(fine))
+        self.assertEqual(len(fine), len(self.coords))
+
+    def test_locate_inverts_point_at(self):
+        geometry = RouteGeometry(self.coords)
+        miles = geometry.length_miles * 0.37
+        along, off_route = geometry.locate(*geometry.point_at(miles))
+        self.assertAlmostEqual(along, miles, delta=0.01)
+        self.assertLess(off_route, 0.01)
+
+
+def line_matrix(positions):
+    """Travel times between points on a straight road"""
+    positions = np.asarray(positions, dtype=float)
+    return np.abs(positions[:, None] - positions[None, :])
+
+
+class StopOrderSolverTests(SimpleTestCase):
+    def test_visits_stops_in_driving_order(self):
+        # start at 0, stops at 5, 1, 3, destination at 10
+        solver = StopOrderSolver(line_matrix([0, 5, 1, 3, 10]))
+        self.assertEqual(solver.solve(), [2, 3, 1])
+
+    def test_pickup_before_dropoff(self):
+        # the dropoff (node 1) is on the way, its load's pickup (node 2) is past it
+        solver = StopOrderSolver(line_matrix([0, 2, 8, 10]), precedence=[(2, 1)])
+        order = solver.solve()
+        self.assertEqual(order, [2, 1])
+        self.assertTrue(solver.is_feasible(order))
+
+    def test_matches_brute_force_with_precedence(self):
+        rng = np.random.default_rng(3)
+        for _ in range(20):
+            points = rng.uniform(0, 100, size=(8, 2))
+            matrix = np.linalg.norm(points[:, None] - points[None, :], axis=2)
+            precedence = [(1, 4), (2, 6), (5, 3)]
+            solver = StopOrderSolver(matrix, precedence)
+
+            order = solver.solve()
+            self.assertTrue(solver.is_feasible(order))
+            self.assertEqual(sorted(order), list(range(1, 7)))
+            best = min(solver.cost(candidate) for candidate in itertools.permutations(range(1, 7))
+                       if solver.is_feasible(candidate))
+            # a local search, allowed to miss the optimum by a little
+            self.assertLessEqual(solver.cost(order), best * 1.1)
+
+
+class SharedRouteTests(SimpleTestCase):
+    def trip(self, duration, address, cycle_hours):
+        return {
+            'current_location': {'lat': 0.0, 'lng': 0.0},
+            'pickup_location': {'lat': 0.0, 'lng': 8.0, 'address': 'Pickup'},
+            'dropoff_location': {'lat': 0.0, 'lng': 10.0, 'address': 'Dropoff'},
+            'current_cycle_hours': cycle_hours,
+            'stops': [{'lat': 0.0, 'lng': 2.0, 'type': 'dropoff', 'duration': duration, 'address': address}],
+        }
+
+    def test_trips_on_the_same_legs_keep_their_own_stops(self):
+        first, second = self.trip(1, 'Depot A', 10), self.trip(5, 'Depot B', 40)
+        self.assertEqual(route_leg_key(first), route_leg_key(second))
+
+        planner = RoutePlanner()
+        planner._routing_provider = mock.Mock()
+        planner._routing_provider.get_duration_matrix.side_effect = (
+            lambda points: line_matrix([point['lng'] for point in points])
+        )
+        planner._routing_provider.get_route_details.return_value = {'distance': 1, 'duration': 1, 'legs': []}
+        routes = planner.fetch_routes(first)
+
+        for trip in (first, second):
+            stop_order = planner.get_route_details(trip, routes)['stop_order']
+            self.assertEqual([stop['type'] for stop in stop_order], ['dropoff', 'pickup', 'dropoff'])
+            self.assertEqual(stop_order[0]['duration'], trip['stops'][0]['duration'])
+            self.assertEqual(stop_order[0]['address'], trip['stops'][0]['address'])
+        planner._routing_provider.get_route_details.assert_called_once()
+
+
+class StopDescriptionTests(SimpleTestCase):
+    def test_extra_stops_are_not_named_after_the_main_stops(self):
+        pickup = {'lat': 39.77, 'lng': -86.16, 'address': 'Indianapolis, IN'}
+        dropoff = {'lat': 33.75, 'lng': -84.39, 'address': 'Atlanta, GA'}
+        route_info = {'locations': {'current': {'address': 'Chicago, IL'}, 'pickup': pickup, 'dropoff': dropoff}}
+        waypoints = [{'name': 'Chicago, IL', 'distance': 0}, {'name': 'Louisville, KY', 'distance': 300},
+                     {'name': 'Atlanta, GA', 'distance': 700}]
+        stop = {'lat': 36.16, 'lng': -86.78}
+        breaks = [
+            {'type': 'driving', 'distance_covered': 180},
+            {'type': 'pickup', 'distance_covered': 180, 'location': pickup},
+            {'type': 'driving', 'distance_covered': 400},
+            {'type': 'pickup', 'distance_covered': 400, 'location': stop},
+            {'type': 'dropoff', 'distance_covered': 400, 'location': stop, 'address': 'Nashville, TN'},
+            {'type': 'driving', 'distance_covered': 700},
+            {'type': 'dropoff', 'distance_covered': 700, 'location': dropoff},
+        ]
+        descriptions = LogSheetGenerator().describe_activities(breaks, route_info, waypoints)
+        self.assertEqual([description for activity, description in zip(breaks, descriptions)
+                          if activity['type'] != 'driving'], [
+            'Pickup at Indianapolis, IN',
+            'Pickup stop near Louisville, KY (400.0 miles from start)',
+            'Dropoff at Nashville, TN',
+            'Dropoff at Atlanta, GA',
+        ])
+
+
+class LocalRouterTests(SimpleTestCase):
+    def setUp(self):
+        # three nodes on a line, two parallel roads from the first to the second
+        self.router = LocalGraphRouter.from_edges(
+            node_coords=[(40.0, -90.0), (40.0, -89.9), (40.0, -89.8)],
+            sources=[0, 0, 1, 1, 2], targets=[1, 1, 2, 0, 1],
+            lengths=[9000, 8500, 8500, 8500, 8500], durations=[600, 400, 500, 400, 500],
+        )
+        self.points = [{'lat': lat, 'lng': lng} for lat, lng in self.router.node_coords.tolist()]
+
+    def test_matrix_takes_the_fastest_parallel_edge(self):
+        matrix = self.router.get_duration_matrix(self.points)
+        np.testing.assert_allclose(matrix, [[0, 400, 900], [400, 0, 500], [900, 500, 0]])
+
+    def test_matrix_reuses_the_graph_built_on_load(self):
+        with mock.patch('routes.services.local_router.csr_matrix') as build:
+            self.router.get_duration_matrix(self.points)
+            self.router.get_duration_matrix(self.points[:2])
+        build.assert_not_called()
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        caches['coordination'].clear()
+
+    def test_concurrent_callers_share_one_computation(self):
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {'route_id': 1}
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            leader = executor.submit(route_plan_flight.do, 'same-trip', compute)
+            started.wait(5)
+            followers = [executor.submit(route_plan_flight.do, 'same-trip', compute) for _ in range(3)]
+            release.set()
+            results = [leader.result(5)] + [future.result(5) for future in followers]
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'route_id': 1}] * 4)
+
+    def test_lock_is_held_in_the_coordination_cache(self):
+        seen = {}
+
+        def compute():
+            seen['coordination'] = caches['coordination'].get('route-plan:lock:held')
+            seen['default'] = caches['default'].get('route-plan:lock:held')
+            return 'plan'
+
+        self.assertEqual(route_plan_flight.do('held', compute), 'plan')
+        self.assertIsNotNone(seen['coordination'])
+        self.assertIsNone(seen['default'])
+        self.assertIsNone(caches['coordination'].get('route-plan:lock:held'))
+        self.assertEqual(caches['coordination'].get('route-plan:result:held'), 'plan')
+
+    def test_waits_for_a_leader_in_another_worker(self):
+        flight = SingleFlight('test-flight', lock_timeout=5, poll_interval=0.01, cache_alias='coordination')
+        shared = caches['coordination']
+        shared.add('test-flight:lock:trip', 'other-worker', timeout=5)
+        publisher = threading.Timer(0.1, shared.set, ('test-flight:result:trip', 'from other worker'))
+        publisher.start()
+        try:
+            result = flight.do('trip', lambda: self.fail('computed while another worker held the lock'))
+        finally:
+            publisher.cancel()
+        self.assertEqual(result, 'from other worker')
+
+
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.cache = TieredCache('test', max_size=2, ttl=60)
+
+    def test_shared_hits_are_promoted_to_the_local_tier(self):
+        other_process = TieredCache('test', max_size=2, ttl=60)
+        other_process.set('a', 1)
+        self.assertIsNone(self.cache.local.get('a'))
+
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.local.get('a'), 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        stats = self.cache.get_stats()
+        self.assertEqual((stats['shared_hits'], stats['local_hits'], stats['misses']), (1, 1, 0))
+
+    def test_least_recently_used_entry_is_evicted_locally(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+
+        self.assertEqual(len(self.cache.local), 2)
+        self.assertIsNone(self.cache.local.get('b'))
+        self.assertEqual(self.cache.local.get('a'), 1)
+        # still in the shared tier
+        self.assertEqual(self.cache.get('b'), 2)
+
+    def test_expired_entries_are_dropped(self):
+        self.cache.local.set('a', 1, ttl=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.local.get('a'))
+
+    def test_shared_tier_errors_are_misses(self):
+        with mock.patch.object(caches['default'], 'get', side_effect=RuntimeError('no cache table')):
+            self.assertEqual(self.cache.get('missing', 'default'), 'default')
+        self.assertEqual(self.cache.get_stats()['errors'], 1)
+
+
+class GeocodeCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        caches['coordination'].clear()
+
+    def test_lookup_asks_the_shared_tier_once(self):
+        cache = GeocodeCache(radius_miles=5)
+        with mock.patch.object(caches['default'], 'get_many', wraps=caches['default'].get_many) as get_many:
+            self.assertIsNone(cache.lookup(41.88, -87.63))
+            # the empty cells are remembered, the second lookup stays local
+            self.assertIsNone(cache.lookup(41.88, -87.63))
+        get_many.assert_called_once()
+        self.assertGreater(len(get_many.call_args.args[0]), 1)
+
+    def test_finds_points_added_by_another_process(self):
+        ours, theirs = GeocodeCache(radius_miles=5), GeocodeCache(radius_miles=5)
+        theirs.add(41.88, -87.63, 'Chicago, IL')
+        self.assertEqual(ours.lookup(41.89, -87.62), 'Chicago, IL')
+        self.assertIsNone(ours.lookup(39.77, -86.16))
+
+    @staticmethod
+    def slow(read):
+        """A slow shared tier, so adds from several threads overlap"""
+        def slow_read(key):
+            value = read(key)
+            time.sleep(0.005)
+            return value
+        return slow_read
+
+    def test_concurrent_adds_keep_every_point(self):
+        # two processes, each with its own local tier, adding to one cell
+        processes = [GeocodeCache(radius_miles=5, max_points_per_cell=100) for _ in range(2)]
+        for cache in processes:
+            cache.lookup(41.88, -87.63)
+            cache.cells.get_fresh = self.slow(cache.cells.get_fresh)
+
+        def add(i):
+            processes[i % 2].add(41.88 + i * 1e-4, -87.63, f'Point {i}')
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(add, range(40)))
+
+        key = processes[0]._cell_key(processes[0]._cell(41.88, -87.63))
+        names = {name for _, _, name in caches['default'].get(key)}
+        self.assertEqual(names, {f'Point {i}' for i in range(40)})
+
+
+def longest_drive(breaks, interruption):
+    """Most hours driven between two non-driving periods of at least `interruption` hours"""
+    longest = current = 0.0
+    for b in breaks:
+        if b['type'] == 'driving':
+            current += b['end_time'] - b['start_time']
+            longest = max(longest, current)
+        elif b['end_time'] - b['start_time'] >= interruption:
+            current = 0.0
+    return longest
+
+
+# local routing, so log sheets don't reverse geocode through Google
+@override_settings(ROUTING_BACKEND='local')
+class ReplanTests(TestCase):
+    DATA = {
+        'current_location': {'lat': 41.88, 'lng': -87.63, 'address': 'Chicago, IL'},
+        'pickup_location': {'lat': 39.77, 'lng': -86.16, 'address': 'Indianapolis, IN'},
+        'dropoff_location': {'lat': 33.75, 'lng': -84.39, 'address': 'Atlanta, GA'},
+        'current_cycle_hours': 20,
+    }
+
+    def plan_trip(self, miles=720, hours=14):
+        """Stored plan for a route through the three locations, short of a fuel stop"""
+        points = [self.DATA[name] for name in ('current_location', 'pickup_location', 'dropoff_location')]
+        route_details = {
+            'distance': miles * METERS_PER_MILE,
+            'duration': hours * 3600,
+            'polyline': encode_polyline([(point['lat'], point['lng']) for point in points]),
+            'steps': [],
+        }
+        plan = RoutePlanner().build_plan(self.DATA, route_details, datetime.datetime(2024, 1, 1, 6))
+        self.geometry = RouteGeometry.from_polyline(plan['polyline'])
+        return save_plan(self.DATA, plan, route_input_hash(self.DATA))
+
+    def position(self, fraction):
+        lat, lng = self.geometry.point_at_fraction(fraction).tolist()
+        return {'lat': lat, 'lng': lng}
+
+    def stored_breaks(self, route):
+        return decode_plan(Route.objects.get(pk=route.pk))['breaks']
+
+    def test_driving_before_the_replan_counts_towards_the_break(self):
+        route = self.plan_trip()
+        replan(route, self.position(0.45), elapsed_duty_hours=8.5)
+
+        breaks = self.stored_breaks(route)
+        self.assertLessEqual(longest_drive(breaks, 0.5), 8 + 1e-6)
+        self.assertAlmostEqual(breaks[-1]['distance_covered'], 720, delta=0.5)
+        self.assertEqual([b['type'] for b in breaks].count('dropoff'), 1)
+
+    @override_settings(HOS_RULESET='fmcsa')
+    def test_fmcsa_replan_keeps_the_shift_limits(self):
+        route = self.plan_trip(miles=1100 * 0.9, hours=20)
+        replan(route, self.position(0.35), elapsed_duty_hours=8)
+
+        breaks = self.stored_breaks(route)
+        self.assertLessEqual(longest_drive(breaks, 0.5), 8 + 1e-6)
+        self.assertLessEqual(longest_drive(breaks, 10), 11 + 1e-6)
+
+    def test_nothing_is_added_once_the_trip_is_done(self):
+        route = self.plan_trip()
+        planned = self.stored_breaks(route)
+
+        for hours in (30, 100):
+            changes = replan(route, self.position(1.0), elapsed_duty_hours=hours)
+            self.assertEqual(changes['breaks']['items'], [])
+            self.assertEqual(changes['log_sheets']['items'], [])
+
+        breaks = self.stored_breaks(route)
+        self.assertEqual(breaks, planned)
+        self.assertEqual([b['type'] for b in breaks].count('dropoff'), 1)
+
+    def test_arriving_early_at_the_dropoff(self):
+        # planned to finish driving at 15.5 hours
+        route = self.plan_trip()
+        changes = replan(route, self.position(1.0), elapsed_duty_hours=14)
+        self.assertEqual([b['type'] for b in changes['breaks']['items']], ['driving', 'dropoff'])
+        # counted as RoutePlanner.schedule does on the basic ruleset: 12.5
+        # hours driven and an hour each for the pickup, break and dropoff
+        self.assertEqual(changes['total_trip_duration'], 15.5)
+        self.assertEqual(changes['total_trip_duration'], HOSCalculator.trip_duration(self.stored_breaks(route)))
+
+        replan(route, self.position(1.0), elapsed_duty_hours=40)
+        types = [b['type'] for b in self.stored_breaks(route)]
+        self.assertEqual(types.count('dropoff'), 1)
+        self.assertEqual(types[-1], 'dropoff')
+
+
+    @override_settings(HOS_RULESET='fmcsa')
+    def test_later_replans_replay_from_the_saved_checkpoint(self):
+        route = self.plan_trip(miles=1100 * 0.9, hours=20)
+        replan(route, self.position(0.2), elapsed_duty_hours=5)
+        self.assertIsNotNone(decode_timeline(Route.objects.get(pk=route.pk)))
+        # the same stored plan, without the saved timeline
+        rebuilt = Route.objects.get(pk=route.pk)
+        rebuilt.pk, rebuilt.duty_timeline = None, None
+        rebuilt.save()
+
+        replays = []
+        replay = DutyTimeline._replay
+
+        def spy(timeline, from_task):
+            replays.append(from_task)
+            return replay(timeline, from_task)
+
+        with mock.patch.object(DutyTimeline, '_replay', spy):
+            replan(route, self.position(0.5), elapsed_duty_hours=11)
+        self.assertEqual(len(replays), 1)
+        self.assertGreater(replays[0], 0)
+
+        replan(rebuilt, self.position(0.5), elapsed_duty_hours=11)
+        replayed, full = self.stored_breaks(route), self.stored_breaks(rebuilt)
+        self.assertEqual([b['type'] for b in replayed], [b['type'] for b in full])
+        for ours, theirs in zip(replayed, full):
+            self.assertAlmostEqual(ours['end_time'], theirs['end_time'])
+            self.assertAlmostEqual(ours['distance_covered'], theirs['distance_covered'])
+
+    def test_replan_refuses_to_overwrite_a_newer_plan(self):
+        route = self.plan_trip()
+        stale = Route.objects.get(pk=route.pk)
+        replan(route, self.position(0.3), elapsed_duty_hours=5)
+
+        with self.assertRaises(PlanChangedError):
+            update_route_plan(stale, self.position(0.4), elapsed_duty_hours=6)
+        response = self.client.post(reverse('route-replan', args=[route.pk]), {
+            'position': self.position(0.4), 'elapsed_duty_hours': 6
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+
+class PlanStoreTests(TestCase):
+    DATA = ReplanTests.DATA
+    PLAN = {
+        'polyline': encode_polyline([(41.88, -87.63), (39.77, -86.16), (33.75, -84.39)]),
+        'total_trip_duration': 15.5,
+        'fuel_stops': [],
+        'breaks': [{'type': 'driving', 'start_time': hour, 'end_time': hour + 1, 'location': 'On route'}
+                   for hour in range(12)],
+    }
+
+    def save(self):
+        return save_plan(self.DATA, self.PLAN, route_input_hash(self.DATA))
+
+    def get(self, route, **headers):
+        return self.client.get(reverse('route-detail', args=[route.pk]), headers=headers)
+
+    def test_decode_returns_the_saved_plan(self):
+        route = self.save()
+        self.assertEqual(decode_plan(Route.objects.get(pk=route.pk)), {**self.PLAN, 'route_id': route.pk})
+
+    def test_find_plan_only_returns_recent_unchanged_plans(self):
+        route = self.save()
+        input_hash = route_input_hash(self.DATA)
+        self.assertEqual(find_plan(input_hash, 300), route)
+        self.assertIsNone(find_plan(input_hash, 0))
+
+        update_plan(route, {**self.PLAN, 'total_trip_duration': 18})
+        self.assertIsNone(find_plan(input_hash, 300))
+
+    def test_not_modified_while_the_etag_matches(self):
+        route = self.save()
+        response = self.get(route)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"{route.plan_etag}"')
+
+        response = self.get(route, if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_modified_for_gzip_clients(self):
+        route = self.save()
+        response = self.get(route, accept_encoding='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], f'W/"{route.plan_etag}"')
+
+        response = self.get(route, accept_encoding='gzip', if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_changed_plan_gets_a_new_etag(self):
+        route = self.save()
+        etag = self.get(route)['ETag']
+        update_plan(route, {**self.PLAN, 'total_trip_duration': 18})
+
+        response = self.get(route, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['total_trip_duration'], 18)
+
+
+@override_settings(ROUTE_JOB_CALLBACK_HOSTS=['hooks.example.com'])
+class RouteJobTests(TestCase):
+    def setUp(self):
+        route_jobs._pending.clear()
+
+    def stale_job(self, minutes):
+        return RouteJob.objects.create(
+            input=ReplanTests.DATA, status=RouteJob.RUNNING,
+            started_at=timezone.now() - datetime.timedelta(minutes=minutes)
+        )
+
+    def create(self, **extra):
+        return self.client.post(reverse('route-jobs'), {**ReplanTests.DATA, **extra}, content_type='application/json')
+
+    def test_stale_running_jobs_are_queued_again(self):
+        stale, running = self.stale_job(minutes=20), self.stale_job(minutes=1)
+        with mock.patch.object(route_jobs.job_executor, 'submit') as submit:
+            route_jobs.resume_queued_jobs()
+            route_jobs.resume_queued_jobs()
+
+        self.assertEqual(RouteJob.objects.get(pk=stale.pk).status, RouteJob.QUEUED)
+        self.assertEqual(RouteJob.objects.get(pk=running.pk).status, RouteJob.RUNNING)
+        # handed to the pool once, not on every sweep
+        submit.assert_called_once_with(route_jobs.run_job, stale.pk)
+
+    def test_polling_has_no_side_effects(self):
+        job = self.stale_job(minutes=20)
+        response = self.client.get(reverse('route-job-detail', args=[job.pk]))
+        self.assertEqual(response.json()['status'], RouteJob.RUNNING)
+        self.assertEqual(RouteJob.objects.get(pk=job.pk).status, RouteJob.RUNNING)
+
+    def test_finished_job_is_posted_to_its_callback(self):
+        route = save_plan(PlanStoreTests.DATA, PlanStoreTests.PLAN, 'hash')
+        job = RouteJob.objects.create(input=ReplanTests.DATA, callback_url='https://hooks.example.com/done')
+        with mock.patch.object(route_jobs, 'plan_route', return_value={'route_id': route.pk}), \
+                mock.patch.object(route_jobs.requests, 'post', return_value=mock.Mock(status_code=204)) as post:
+            route_jobs.run_job(job.pk)
+
+        job = RouteJob.objects.get(pk=job.pk)
+        self.assertEqual((job.status, job.route_id, job.callback_status), (RouteJob.SUCCEEDED, route.pk, 204))
+        url = post.call_args.args[0]
+        body = json.loads(post.call_args.kwargs['data'])
+        self.assertEqual(url, 'https://hooks.example.com/done')
+        self.assertEqual(body['result_url'], f'/api/routes/{route.pk}/')
+        self.assertFalse(post.call_args.kwargs['allow_redirects'])
+
+    def test_callback_url_must_be_on_the_allowlist(self):
+        for url in ('http://169.254.169.254/latest/meta-data/', 'https://localhost/', 'http://hooks.example.com/'):
+            response = self.create(callback_url=url)
+            self.assertEqual(response.status_code, 400, url)
+            self.assertIn('callback_url', response.json())
+
+        response = self.create(callback_url='https://hooks.example.com/done')
+        self.assertEqual(response.status_code, 202)
+
+    def test_callback_is_not_sent_once_its_host_is_removed(self):
+        job = RouteJob.objects.create(input=ReplanTests.DATA, callback_url='https://hooks.example.com/done')
+        with override_settings(ROUTE_JOB_CALLBACK_HOSTS=[]), mock.patch.object(route_jobs.requests, 'post') as post:
+            self.assertIsNone(route_jobs.send_callback(job))
+        post.assert_not_called()
+
+
+class FleetSimulationTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        self.drive = np.concatenate(([0.0, 8.0, 16.0], rng.uniform(0, 60, 40)))
+        self.miles = self.drive * rng.uniform(35, 60, len(self.drive))
+        self.cycle = np.concatenate(([0.0, 65.0, 70.0], rng.uniform(0, 70, 40)))
+
+    def test_trip_totals_match_the_schedule(self):
+        totals = HOSCalculator.summarize_trips(self.drive, self.miles, self.cycle)
+        for i, (drive, miles, cycle) in enumerate(zip(self.drive, self.miles, self.cycle)):
+            calculator = HOSCalculator(current_cycle_hours=cycle)
+            breaks = calculator.calculate_breaks(drive, miles)
+            self.assertAlmostEqual(totals['trip_hours'][i], breaks[-1]['end_time'])
+            self.assertAlmostEqual(totals['total_trip_duration'][i], HOSCalculator.trip_duration(breaks))
+            self.assertEqual(totals['breaks'][i], [b['type'] for b in breaks].count('break'))
+            self.assertEqual(totals['fuel_stops'][i], [b['type'] for b in breaks].count('fuel'))
+            self.assertEqual(totals['hos_compliance'][i], drive <= calculator.remaining_cycle_hours)
+
+    def test_fleet_totals_add_up_over_chunks(self):
+        chunks = [(self.drive[:20], self.miles[:20], self.cycle[:20]),
+                  (self.drive[20:], self.miles[20:], self.cycle[20:]),
+                  (np.array([np.nan, -1.0]), np.array([10.0, 10.0]), np.array([0.0, 0.0]))]
+        policies = {'baseline': {}, 'policy': {'MILES_PER_FUEL_STOP': 500}}
+        summaries = simulate_fleet(iter(chunks), policies)
+
+        baseline = summaries['baseline'].to_dict()
+        totals = HOSCalculator.summarize_trips(self.drive, self.miles, self.cycle)
+        self.assertEqual((baseline['trips'], baseline['skipped_rows']), (len(self.drive), 2))
+        self.assertAlmostEqual(baseline['trip_hours']['mean'], totals['trip_hours'].mean(), places=3)
+        self.assertAlmostEqual(baseline['trip_hours']['max'], totals['trip_hours'].max(), places=3)
+        self.assertAlmostEqual(baseline['mean_total_trip_duration'], totals['total_trip_duration'].mean(),
+                               places=3)
+        self.assertEqual(baseline['breaks']['total'], totals['breaks'].sum())
+        self.assertEqual(baseline['fuel_stops']['total'], totals['fuel_stops'].sum())
+        self.assertAlmostEqual(baseline['compliance_rate'], totals['hos_compliance'].mean(), places=4)
+        self.assertGreater(summaries['policy'].fuel_stops, summaries['baseline'].fuel_stops)
+
+
+class ResponseShapingTests(SimpleTestCase):
+    def setUp(self):
+        coords = [(41.88 - i * 0.01, -87.63 + (i % 7) * 0.003) for i in range(300)]
+        self.plan = {
+            'route_id': 1,
+            'polyline': encode_polyline(coords),
+            'distance': 1000,
+            'duration': 100,
+            'total_trip_duration': 12.5,
+            'breaks': [{'type': 'pickup', 'start_time': 0, 'end_time': 1}],
+            'steps': [{
+                'distance': {'text': '0.6 mi', 'value': 1000},
+                'duration': {'text': '2 mins', 'value': 100},
+                'start_location': {'lat': 41.88, 'lng': -87.63},
+                'end_location': {'lat': 38.89, 'lng': -87.62},
+                'html_instructions': 'Head <b>south</b>',
+                'polyline': {'points': encode_polyline(coords)},
+            }],
+        }
+        patcher = mock.patch('routes.views.plan_route', return_value=self.plan)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def calculate(self, query='', **headers):
+        return self.client.post(f"{reverse('calculate-route')}{query}", ReplanTests.DATA,
+                                content_type='application/json', headers=headers)
+
+    def test_json_keeps_the_full_steps(self):
+        self.assertEqual(self.calculate().json(), self.plan)
+
+    def test_msgpack_is_compact_by_default(self):
+        response = self.calculate(accept='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        body = msgpack.unpackb(response.content)
+        self.assertEqual(body, compact_plan(self.plan))
+        self.assertEqual(body['steps'][0]['distance'], 1000)
+
+        body = msgpack.unpackb(self.calculate('?format=msgpack&compact=0').content)
+        self.assertEqual(body, self.plan)
+
+    def test_fields_selects_top_level_keys(self):
+        body = self.calculate('?fields=route_id, total_trip_duration,unknown').json()
+        self.assertEqual(body, {'route_id': 1, 'total_trip_duration': 12.5})
+
+    def test_zoom_simplifies_the_polyline(self):
+        full = decode_polyline(self.plan['polyline'])
+        coarse = decode_polyline(self.calculate('?zoom=5&fields=polyline').json()['polyline'])
+        self.assertLess(len(coarse), len(full))
+        np.testing.assert_allclose(coarse[[0, -1]], full[[0, -1]])
+
+        for zoom in ('23', '-1', 'far'):
+            self.assertEqual(self.calculate(f'?zoom={zoom}').status_code, 400, zoom)
+
+
+class FakeMatrixClient:
+    """distance_matrix answering from the coordinates, NOT_FOUND for destinations at lat 0"""
+
+    def __init__(self):
+        self.calls = []
+
+    @staticmethod
+    def cell(origin, destination):
+        o_lat, o_lng = map(float, origin.split(','))
+        d_lat, d_lng = map(float, destination.split(','))
+        meters = round((abs(o_lat - d_lat) + abs(o_lng - d_lng)) * 100000)
+        return meters // 25, meters
+
+    def distance_matrix(self, origins, destinations, mode):
+        self.calls.append((origins, destinations))
+        rows = []
+        for origin in origins:
+            elements = []
+            for destination in destinations:
+                if float(destination.split(',')[0]) == 0:
+                    elements.append({'status': 'NOT_FOUND'})
+                    continue
+                duration, distance = self.cell(origin, destination)
+                elements.append({'status': 'OK', 'duration': {'value': duration},
+                                 'distance': {'value': distance}})
+            rows.append({'elements': elements})
+        return {'rows': rows}
+
+
+class MatrixEndpointTests(TestCase):
+    def setUp(self):
+        matrix_cell_cache.clear()
+        self.maps = FakeMatrixClient()
+        patcher = mock.patch('routes.services.matrix_service.get_maps_client', return_value=self.maps)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def matrix(self, origins, destinations):
+        return self.client.post(reverse('distance-matrix'), {
+            'origins': [{'lat': lat, 'lng': lng} for lat, lng in origins],
+            'destinations': [{'lat': lat, 'lng': lng} for lat, lng in destinations],
+        }, content_type='application/json')
+
+    def test_cells_with_null_for_unreachable_pairs(self):
+        origins = [(41.8781, -87.6298), (39.7392, -104.9903), (41.8781, -87.6298)]
+        destinations = [(32.7767, -96.797), (0, 0)]
+        response = self.matrix(origins, destinations)
+        self.assertEqual(response.status_code, 200)
+
+        body = response.json()
+        expected = [self.maps.cell(f"{o_lat},{o_lng}", "32.7767,-96.797") for o_lat, o_lng in origins]
+        self.assertEqual(body['durations'], [[duration, None] for duration, _ in expected])
+        self.assertEqual(body['distances'], [[distance, None] for _, distance in expected])
+        # the repeated origin is only asked for once
+        self.assertEqual(len(self.maps.calls), 1)
+        self.assertEqual(len(self.maps.calls[0][0]), 2)
+        self.assertEqual(MatrixCell.objects.count(), 4)
+
+    def test_seen_cells_cost_no_api_calls(self):
+        origins = [(41.8781, -87.6298), (39.7392, -104.9903)]
+        destinations = [(32.7767, -96.797), (0, 0), (33.749, -84.388)]
+        first = self.matrix(origins, destinations).json()
+        calls = len(self.maps.calls)
+
+        self.assertEqual(self.matrix(origins, destinations).json(), first)
+        # a sub-matrix, answered from the table once the process cache is gone
+        matrix_cell_cache.clear()
+        sub = self.matrix(origins[1:], destinations[::2]).json()
+        self.assertEqual(sub['durations'], [[first['durations'][1][0], first['durations'][1][2]]])
+        self.assertEqual(len(self.maps.calls), calls)
+
+        # only the new destination is requested
+        self.matrix(origins, destinations + [(29.7604, -95.3698)])
+        self.assertEqual(self.maps.calls[-1], ([f"{lat},{lng}" for lat, lng in origins], ["29.7604,-95.3698"]))
+
+    def test_requests_stay_within_the_api_limits(self):
+        origins = [(30 + i * 0.1, -90.0) for i in range(30)]
+        destinations = [(40 + j * 0.1, -80.0) for j in range(7)]
+        body = self.matrix(origins, destinations).json()
+        self.assertEqual(len(body['durations']), 30)
+        self.assertTrue(all(len(row) == 7 and None not in row for row in body['durations']))
+
+        for call_origins, call_destinations in self.maps.calls:
+            self.assertLessEqual(len(call_origins), MAX_ORIGINS)
+            self.assertLessEqual(len(call_destinations), MAX_DESTINATIONS)
+            self.assertLessEqual(len(call_origins) * len(call_destinations), MAX_ELEMENTS)
+        self.assertEqual(sum(len(o) * len(d) for o, d in self.maps.calls), 30 * 7)
+
+    def test_invalid_points(self):
+        self.assertEqual(self.matrix([], [(32.7767, -96.797)]).status_code, 400)
+        self.assertEqual(self.matrix([(91, 0)], [(32.7767, -96.797)]).status_code, 400)
+        self.assertEqual(self.maps.calls, [])
+
+
+def backend_route(hours, miles, summary, start, end):
+    coords = [(start['lat'], start['lng']), (end['lat'], end['lng'])]
+    return {
+        'summary': summary,
+        'distance': miles * METERS_PER_MILE,
+        'duration': hours * 3600,
+        'polyline': encode_polyline(coords),
+        'steps': [],
+        'bounds': {
+            'northeast': {'lat': max(lat for lat, _ in coords), 'lng': max(lng for _, lng in coords)},
+            'southwest': {'lat': min(lat for lat, _ in coords), 'lng': min(lng for _, lng in coords)},
+        },
+    }
+
+
+@override_settings(ROUTING_BACKEND='local')
+class RouteAlternativesTests(TestCase):
+    # (hours, miles) to the dropoff; the quickest drive needs a fuel stop
+    # and the longest a rest break, so the middle one arrives first
+    TO_DROPOFF = [(6.9, 1050, 'I-65 S'), (8.0, 450, 'US-41 S'), (7.0, 350, 'I-74 E')]
+
+    def setUp(self):
+        caches['coordination'].clear()
+        self.provider = mock.Mock()
+        self.provider.get_route_alternatives.side_effect = self.alternatives
+        patcher = mock.patch('routes.services.route_planner.get_routing_provider', return_value=self.provider)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def alternatives(self, origin, destination, waypoints=None):
+        pickup, dropoff = ReplanTests.DATA['pickup_location'], ReplanTests.DATA['dropoff_location']
+        if waypoints:
+            return [backend_route(1 + hours, 50 + miles, summary, origin, destination)
+                    for hours, miles, summary in self.TO_DROPOFF]
+        if destination == pickup:
+            return [backend_route(1, 50, 'I-65 S', origin, pickup)]
+        return [backend_route(hours, miles, summary, pickup, dropoff) for hours, miles, summary in self.TO_DROPOFF]
+
+    def calculate(self, **data):
+        return self.client.post(reverse('calculate-route'), {**ReplanTests.DATA, **data},
+                                content_type='application/json')
+
+    def test_alternatives_ranked_by_trip_duration(self):
+        response = self.calculate(alternatives=2)
+        self.assertEqual(response.status_code, 200)
+        plan = response.json()
+
+        # the legs are requested on their own and joined
+        self.assertEqual(self.provider.get_route_alternatives.call_count, 2)
+        alternatives = plan['alternatives']
+        self.assertEqual([round(option['duration'] / 3600, 1) for option in alternatives], [8.0, 7.9])
+        self.assertEqual([option['trip_hours'] for option in alternatives], [10.0, 10.4])
+        self.assertEqual(set(alternatives[0]), {'summary', 'distance', 'duration', 'polyline', 'trip_hours',
+                                                'total_trip_duration', 'hos_compliance'})
+        # the plan itself follows the first one
+        self.assertEqual(plan['duration'], alternatives[0]['duration'])
+        self.assertEqual(plan['polyline'], alternatives[0]['polyline'])
+        self.assertEqual(plan['total_trip_duration'], alternatives[0]['total_trip_duration'])
+
+    def test_single_alternative_uses_the_pickup_waypoint(self):
+        plan = self.calculate(alternatives=1).json()
+        self.provider.get_route_alternatives.assert_called_once()
+        self.assertEqual(len(plan['alternatives']), 1)
+        self.assertEqual(plan['alternatives'][0]['trip_hours'], 10.0)
+
+    def test_best_route_without_alternatives(self):
+        plan = self.calculate().json()
+        self.assertNotIn('alternatives', plan)
+        self.assertEqual(round(plan['duration'] / 3600, 1), 8.0)
+
+    def test_alternatives_limits(self):
+        for alternatives in (0, 10):
+            self.assertEqual(self.calculate(alternatives=alternatives).status_code, 400, alternatives)
+        self.provider.get_route_alternatives.assert_not_called()
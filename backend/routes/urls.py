@@ -3,4 +3,13 @@ from . import views
 
 urlpatterns = [
     path('calculate-route/', views.calculate_route, name='calculate-route'),
+    path('calculate-route/async/', views.calculate_route_async, name='calculate-route-async'),
+    path('calculate-route/stream/', views.calculate_route_stream, name='calculate-route-stream'),
+    path('calculate-route/batch/', views.calculate_routes_batch, name='calculate-route-batch'),
+    path('routes/<int:route_id>/', views.route_detail, name='route-detail'),
+    path('routes/<int:route_id>/replan/', views.replan_route, name='route-replan'),
+    path('jobs/', views.create_route_job, name='route-jobs'),
+    path('jobs/<uuid:job_id>/', views.route_job_detail, name='route-job-detail'),
+    path('matrix/', views.distance_matrix, name='distance-matrix'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -1,91 +1,282 @@
 # routes/views.py
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.http import parse_etags
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.response import Response
-from .services.google_maps_service import GoogleMapsService
-from .services.hos_service import HOSCalculator
-from .serializers import RouteInputSerializer, RouteOutputSerializer
-from .services.log_generator import LogSheetGenerator
-import datetime
+from rest_framework.settings import api_settings
+from .models import Route, RouteJob
+from .renderers import MessagePackRenderer
+from .serializers import (MatrixInputSerializer, ReplanInputSerializer, RouteInputSerializer,
+                          RouteJobInputSerializer, RouteOutputSerializer)
+from .services import metrics as service_metrics
+from .services.batch_planner import plan_batch
+from .services.matrix_service import MatrixService, matrix_to_json
+from .services.plan_format import compact_plan, parse_fields, project_fields
+from .services.plan_store import PlanChangedError, decode_plan
+from .services.polyline import MAX_ZOOM, simplify_polyline
+from .services.replan import OffRouteError, replan
+from .services.route_jobs import job_status, submit_job
+from .services.route_planner import RoutePlanner, plan_route
 import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+def parse_zoom(request):
+    """?zoom= as an int, None when absent, ValueError when out of range"""
+    zoom = request.query_params.get('zoom')
+    if zoom is None:
+        return None
+    zoom = int(zoom)
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(zoom)
+    return zoom
+
+
+def shape_plan(request, plan, zoom=None):
+    """Apply the ?compact=, ?zoom= and ?fields= options of a plan response.
+
+    Steps are compacted by default for msgpack responses, which are meant
+    for bandwidth-bound clients; compact=0 / compact=1 overrides that. With
+    a zoom level the polyline only keeps the detail visible at that zoom.
+    """
+    if zoom is not None and plan.get('polyline'):
+        plan = {**plan, 'polyline': simplify_polyline(plan['polyline'], zoom)}
+
+    compact = request.query_params.get('compact')
+    if compact is None:
+        compact = request.accepted_renderer.format == MessagePackRenderer.format
+    else:
+        compact = compact.lower() in ('1', 'true', 'yes')
+
+    if compact:
+        plan = compact_plan(plan)
+    return project_fields(plan, parse_fields(request.query_params.get('fields')))
+
 
 @api_view(['POST'])
+@renderer_classes([*api_settings.DEFAULT_RENDERER_CLASSES, MessagePackRenderer])
 def calculate_route(request):
     serializer = RouteInputSerializer(data=request.data)
     if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        # Print the validated data to see its structure
-        print("Validated Data:", serializer.validated_data)
+        zoom = parse_zoom(request)
+    except ValueError:
+        return Response(
+            {'error': f'zoom must be an integer between 0 and {MAX_ZOOM}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        logger.debug("Validated data: %s", serializer.validated_data)
+
+        response_data = plan_route(serializer.validated_data)
+
+        return Response(shape_plan(request, response_data, zoom), status=status.HTTP_200_OK)
 
-        # Initialize services
-        maps_service = GoogleMapsService()
-        hos_calculator = HOSCalculator(
-            current_cycle_hours=serializer.validated_data['current_cycle_hours']
+    except Exception as e:
+        logger.exception("calculate_route failed")
+        return Response(
+            {'error': f'Something went wrong: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-        # Get route details
-        route_details = maps_service.get_route_details(
-            origin=serializer.validated_data['current_location'],
-            destination=serializer.validated_data['dropoff_location'],
-            waypoints=[serializer.validated_data['pickup_location']]
+
+@csrf_exempt
+@require_POST
+async def calculate_route_async(request):
+    """Async variant of calculate_route for ASGI deployments (core/asgi.py).
+
+    The event loop only parses and validates; the blocking pipeline runs on
+    a worker thread, so a slow upstream call doesn't hold up other requests.
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = RouteInputSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        response_data = await sync_to_async(plan_route, thread_sensitive=False)(
+            serializer.validated_data
         )
-        
-        # im not actually dumping a json here, json.dumps() returns a string of the json and here im printing it
-        # this print statement is here to get myself familiarized with route_details sturcture returned by Google API
-        # planning to use this data to generate accurate log sheets for each stop of the route (refulling, rest stops, etc)
-        
-        # print("Route Details Structure:", json.dumps(route_details, indent=2)) 
-
-        # prepare route info 
-        route_info = {
-            'locations': {
-                'current': serializer.validated_data['current_location'],
-                'pickup': serializer.validated_data['pickup_location'],
-                'dropoff': serializer.validated_data['dropoff_location']
-            },
-            'route_details': route_details
-        }
-        
-
-        # Calculate driving hours and breaks
-        total_drive_time = route_details['duration'] / 3600
-        total_distance = route_details['distance'] / 1609.34  # convert meters to miles
-        breaks = hos_calculator.calculate_breaks(total_drive_time, total_distance)
-
-        # find fuel stops using google places API
-        fuel_stops = maps_service.find_fuel_stops(
-            route_points=[
-                serializer.validated_data['current_location'],
-                serializer.validated_data['pickup_location'],
-                serializer.validated_data['dropoff_location']
-            ]
-        )        
-        # generate log sheets with route information
-        log_generator = LogSheetGenerator()
-        log_sheets = log_generator.generate_daily_logs(
-            breaks=breaks,
-            start_time=datetime.datetime.now(),
-            route_info=route_info
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Something went wrong: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    return JsonResponse(response_data, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+def calculate_route_stream(request):
+    """Same plan as calculate_route, streamed as NDJSON so day 1 can render before the last day is built"""
+    serializer = RouteInputSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    planner = RoutePlanner()
+    try:
+        route_details = planner.get_route_details(serializer.validated_data)
+    except Exception as e:
+        return Response(
+            {'error': f'Something went wrong: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-        response_data = {
-            **route_details,
-            'breaks': breaks,
-            'fuel_stops': fuel_stops,
-            'total_trip_duration': total_drive_time + len([b for b in breaks if b['type'] in ['pickup', 'dropoff', 'break']]),
-            'hos_compliance': total_drive_time <= hos_calculator.remaining_cycle_hours,
-            'log_sheets': log_sheets
-        }
+    def lines():
+        try:
+            for part in planner.iter_plan(serializer.validated_data, route_details):
+                yield json.dumps(part, cls=DjangoJSONEncoder) + '\n'
+        except Exception as e:
+            # the status line is gone already, report the failure in-band
+            yield json.dumps({'type': 'error', 'error': f'Something went wrong: {str(e)}'}) + '\n'
+
+    return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
 
-        return Response(response_data, status=status.HTTP_200_OK)
+@api_view(['POST'])
+def calculate_routes_batch(request):
+    """Plan an array of RouteInput payloads, streamed back as NDJSON in completion order"""
+    if not isinstance(request.data, list):
+        return Response({'error': 'Expected a list of route inputs'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(request.data) > settings.BATCH_MAX_TRIPS:
+        return Response(
+            {'error': f'At most {settings.BATCH_MAX_TRIPS} trips per batch'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
+    serializer = RouteInputSerializer(data=request.data, many=True)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    lines = (
+        json.dumps(result, cls=DjangoJSONEncoder) + '\n'
+        for result in plan_batch(serializer.validated_data)
+    )
+    return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+
+@api_view(['GET'])
+def route_detail(request, route_id):
+    """A stored plan, with ETag / If-None-Match support"""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        etag = Route.objects.filter(pk=route_id).values_list('plan_etag', flat=True).first()
+        # weak comparison: GZipMiddleware hands gzip clients W/"<etag>"
+        tags = [tag.removeprefix('W/') for tag in parse_etags(if_none_match)]
+        if etag and ('*' in tags or f'"{etag}"' in tags):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': f'"{etag}"'})
+
+    route = get_object_or_404(Route, pk=route_id)
+    return Response(decode_plan(route), status=status.HTTP_200_OK, headers={'ETag': f'"{route.plan_etag}"'})
+
+
+@api_view(['POST'])
+def replan_route(request, route_id):
+    """Update a stored plan from the truck's position and elapsed hours, returns only what changed.
+
+    No directions, places or new-route geocoding: the position is matched to
+    the stored route line and the HOS schedule and log sheets are redone from
+    there. The new ETag for GET /api/routes/<id>/ is in the response.
+    """
+    serializer = ReplanInputSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    route = get_object_or_404(Route, pk=route_id)
+    if not route.plan_blob:
+        return Response({'error': 'Route has no stored plan'}, status=status.HTTP_409_CONFLICT)
+
+    try:
+        changes = replan(route, serializer.validated_data['position'],
+                         serializer.validated_data['elapsed_duty_hours'])
+    except OffRouteError as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    except PlanChangedError:
+        return Response({'error': 'The plan was updated by another request, retry'},
+                        status=status.HTTP_409_CONFLICT)
     except Exception as e:
-        import traceback
-        print("Error:", str(e))
-        print("Traceback:", traceback.format_exc())
+        logger.exception("replan_route failed")
         return Response(
             {'error': f'Something went wrong: {str(e)}'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
\ No newline at end of file
+        )
+    return Response(changes, status=status.HTTP_200_OK, headers={'ETag': f'"{changes["etag"]}"'})
+
+
+@api_view(['POST'])
+def create_route_job(request):
+    """Queue a calculate-route request and return its job id right away (202).
+
+    Poll GET /api/jobs/<id>/ or pass a callback_url to have the status POSTed
+    there when the job finishes; the plan itself is at result_url.
+    """
+    serializer = RouteJobInputSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    data = dict(serializer.validated_data)
+    callback_url = data.pop('callback_url', None)
+    job = submit_job(data, callback_url)
+
+    location = reverse('route-job-detail', args=[job.pk])
+    return Response(
+        {**job_status(job), 'status_url': location},
+        status=status.HTTP_202_ACCEPTED,
+        headers={'Location': location}
+    )
+
+
+@api_view(['GET'])
+def route_job_detail(request, job_id):
+    job = get_object_or_404(RouteJob, pk=job_id)
+    return Response(job_status(job), status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@renderer_classes([*api_settings.DEFAULT_RENDERER_CLASSES, MessagePackRenderer])
+def distance_matrix(request):
+    """Driving times (seconds) and distances (meters) from every origin to every destination.
+
+    Cells are cached individually, so repeat or overlapping matrices only
+    pay for the pairs not seen before. Unreachable pairs are null.
+    """
+    serializer = MatrixInputSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        matrix = MatrixService().get_matrix(
+            serializer.validated_data['origins'],
+            serializer.validated_data['destinations']
+        )
+    except Exception as e:
+        logger.exception("distance_matrix failed")
+        return Response(
+            {'error': f'Something went wrong: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    return Response({
+        'durations': matrix_to_json(matrix['duration']),
+        'distances': matrix_to_json(matrix['distance'])
+    }, status=status.HTTP_200_OK)
+
+
+def metrics(request):
+    """Stage and request latency histograms and event counters, Prometheus text format.
+
+    Each worker process keeps its own numbers.
+    """
+    return HttpResponse(service_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')